@@ -0,0 +1,62 @@
+from django.contrib.gis.geos import Polygon
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from guardian.shortcuts import get_objects_for_user
+from rest_framework import exceptions
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from app import models
+from .common import get_and_check_project
+
+
+class MapItems(APIView):
+    permission_classes = (AllowAny, )
+
+    def get(self, request):
+        """
+        Map items of completed tasks, for a project and/or within a bounding box
+        (across all projects the user can view).
+
+        Query params:
+         - "project": ID of a project
+         - "bbox": xmin,ymin,xmax,ymax (EPSG:4326)
+        """
+        project_pk = request.query_params.get('project')
+        bbox = request.query_params.get('bbox')
+
+        if project_pk is None and bbox is None:
+            raise exceptions.ValidationError("You need to specify a project or a bbox")
+
+        project = None
+        if project_pk is not None:
+            try:
+                project = models.Project.objects.get(pk=project_pk, deleting=False)
+            except (ObjectDoesNotExist, ValueError):
+                raise exceptions.NotFound()
+
+            if not project.public:
+                get_and_check_project(request, project.id)
+
+        if bbox is None:
+            # Cached
+            return Response(project.get_map_items())
+
+        try:
+            xmin, ymin, xmax, ymax = [float(v) for v in bbox.split(",")]
+        except:
+            raise exceptions.ValidationError("Invalid bbox parameter")
+
+        geom = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+        query = Q(orthophoto_extent__intersects=geom) | \
+                Q(dsm_extent__intersects=geom) | \
+                Q(dtm_extent__intersects=geom)
+
+        if project is not None:
+            query &= Q(project=project)
+        else:
+            query &= Q(project__in=get_objects_for_user(request.user, 'view_project', models.Project, accept_global_perms=False).filter(deleting=False))
+
+        tasks = models.Task.map_items_values(models.Task.objects.filter(query))
+        return Response([models.Task.map_item_from_values(v) for v in tasks])
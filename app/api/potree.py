@@ -30,7 +30,7 @@ class Scene(TaskNestedView):
             if not k in ["view", "pointclouds", "settings"]:
                 task.potree_scene[k] = scene[k]
 
-        task.save()
+        task.save(update_fields=['potree_scene', 'updated_at'])
         return Response({'success': True})
 
 class CameraView(TaskNestedView):
@@ -54,6 +54,6 @@ class CameraView(TaskNestedView):
             task.potree_scene = init_p
         
         task.potree_scene['view'] = view
-        task.save()
+        task.save(update_fields=['potree_scene', 'updated_at'])
             
         return Response({'success': True})
\ No newline at end of file
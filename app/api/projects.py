@@ -1,4 +1,5 @@
 import re
+from guardian.core import ObjectPermissionChecker
 from guardian.shortcuts import get_perms, get_users_with_perms, assign_perm, remove_perm
 from rest_framework import serializers, viewsets
 from rest_framework.decorators import action
@@ -9,7 +10,7 @@ from django.db import transaction
 from django.contrib.auth.models import User
 from django.contrib.postgres.search import SearchQuery, SearchVector
 from django.contrib.postgres.aggregates import StringAgg
-from django.db.models import Q
+from django.db.models import Q, Manager, Prefetch
 
 from app import models
 from .tasks import TaskIDsSerializer
@@ -20,8 +21,21 @@ from django.utils.translation import gettext as _
 def normalized_perm_names(perms):
     return list(map(lambda p: p.replace("_project", ""),perms))
 
+class ProjectListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        projects = list(data.all() if isinstance(data, Manager) else data)
+
+        # Fetch the permissions of all projects at once
+        # instead of querying them for each project
+        if 'request' in self.context and len(projects) > 0:
+            checker = ObjectPermissionChecker(self.context['request'].user)
+            checker.prefetch_perms(projects)
+            self.context['permission_checker'] = checker
+
+        return super().to_representation(projects)
+
 class ProjectSerializer(serializers.ModelSerializer):
-    tasks = TaskIDsSerializer(many=True, read_only=True)
+    tasks = TaskIDsSerializer(source='task_set', many=True, read_only=True)
     owner = serializers.HiddenField(
             default=serializers.CurrentUserDefault()
         )
@@ -31,7 +45,9 @@ class ProjectSerializer(serializers.ModelSerializer):
     tags = TagsField(required=False)
 
     def get_permissions(self, obj):
-        if 'request' in self.context:
+        if 'permission_checker' in self.context:
+            return normalized_perm_names(list(dict.fromkeys(self.context['permission_checker'].get_perms(obj))))
+        elif 'request' in self.context:
             return normalized_perm_names(get_perms(self.context['request'].user, obj))
         else:
             # Cannot list permissions, no user is associated with request (happens when serializing ui test mocks)
@@ -40,12 +56,13 @@ class ProjectSerializer(serializers.ModelSerializer):
     def get_owned(self, obj):
         if 'request' in self.context:
             user = self.context['request'].user
-            return user.is_superuser or obj.owner.id == user.id
+            return user.is_superuser or obj.owner_id == user.id
         return False
 
     class Meta:
         model = models.Project
         exclude = ('deleting', )
+        list_serializer_class = ProjectListSerializer
 
 
 class ProjectFilter(filters.FilterSet):
@@ -106,7 +123,9 @@ class ProjectViewSet(viewsets.ModelViewSet):
     """
     filter_fields = ('id', 'name', 'description', 'created_at')
     serializer_class = ProjectSerializer
-    queryset = models.Project.objects.prefetch_related('task_set').filter(deleting=False).order_by('-created_at')
+    queryset = models.Project.objects.prefetch_related(
+        Prefetch('task_set', queryset=models.Task.objects.only('id', 'project', 'size'))
+    ).filter(deleting=False).order_by('-created_at')
     filterset_class = ProjectFilter
     ordering_fields = '__all__'
 
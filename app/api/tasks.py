@@ -1,11 +1,16 @@
+import hashlib
+import json
 import logging
 import os
 import re
 import shutil
 import subprocess
 import tempfile
+import time
 import zipfile
-from wsgiref.util import FileWrapper
+import uuid as uuid_module
+from datetime import timedelta
+from urllib.parse import quote
 
 import mimetypes
 import rasterio
@@ -15,13 +20,13 @@ from PIL import Image
 import io
 import numpy as np
 
-from shutil import copyfileobj, move
 from django.core.exceptions import ObjectDoesNotExist, SuspiciousFileOperation, ValidationError
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.db import transaction
+from django.db import connection, transaction
 from django.http import FileResponse
 from django.http import HttpResponse
 from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 from django.contrib.gis.geos import Polygon
 from zipstream.ng import ZipStream
 from rest_framework import status, serializers, viewsets, filters, exceptions, permissions, parsers
@@ -30,8 +35,10 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db.models import Q
+from guardian.shortcuts import get_objects_for_user
 
-from app import models, pending_actions
+from app import models, pending_actions, task_events
+from app.task_events import TASK_EVENT_FIELDS, version_to_datetime, datetime_to_version
 from nodeodm import status_codes
 from nodeodm.models import ProcessingNode
 from worker import tasks as worker_tasks
@@ -41,6 +48,8 @@ from app.security import path_traversal_check
 from django.utils.translation import gettext_lazy as _
 from .fields import PolygonGeometryField
 from app.geoutils import geom_transform_wkt_bbox
+from app.reader_pool import cog_reader
+from app.classes.chunked_upload import ChunkedUpload, save_uploaded_file, check_chunk_range
 from webodm import settings
 
 logger = logging.getLogger('app.logger')
@@ -152,7 +161,7 @@ def convert_vector_asset(request, task, asset, export_format):
         final_path = destination
 
     download_name = f"{get_asset_download_filename(task, meta['download_label'])}{extension}"
-    response = download_file_response(request, final_path, 'attachment', download_filename=download_name)
+    response = download_file_response(request, final_path, 'attachment', download_filename=download_name, accel_redirect=False)
 
     original_close = response.close
 
@@ -204,12 +213,20 @@ class TaskSerializer(serializers.ModelSerializer):
         see https://github.com/OpenDroneMap/NodeODM/issues/32
         :return: array of valid rerun-from parameters
         """
-        if obj.processing_node is not None:
+        if obj.processing_node_id is None:
+            return []
+
+        # Tasks in a listing usually share a few processing nodes,
+        # parse their options once per serialization
+        memo = self.context.setdefault('rerun_from_domains', {})
+        if obj.processing_node_id not in memo:
+            domain = []
             rerun_from_option = list(filter(lambda d: 'name' in d and d['name'] == 'rerun-from', obj.processing_node.available_options))
             if len(rerun_from_option) > 0 and 'domain' in rerun_from_option[0]:
-                return rerun_from_option[0]['domain']
+                domain = rerun_from_option[0]['domain']
+            memo[obj.processing_node_id] = domain
 
-        return []
+        return memo[obj.processing_node_id]
 
     def get_extent(self, obj):
         return obj.get_extent()
@@ -219,8 +236,8 @@ class TaskSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Task
-        exclude = ('orthophoto_extent', 'dsm_extent', 'dtm_extent', )
-        read_only_fields = ('processing_time', 'status', 'last_error', 'created_at', 'pending_action', 'available_assets', 'size', )
+        exclude = ('orthophoto_extent', 'dsm_extent', 'dtm_extent', 'upload_state', 'statistics_mtime', )
+        read_only_fields = ('processing_time', 'status', 'last_error', 'created_at', 'updated_at', 'pending_action', 'available_assets', 'size', 'tile_seed_progress', )
 
 class TaskViewSet(viewsets.ViewSet):
     """
@@ -264,7 +281,9 @@ class TaskViewSet(viewsets.ViewSet):
         task.pending_action = pending_action
         task.partial = False # Otherwise this will not be processed
         task.last_error = None
-        task.save()
+
+        # The worker might be updating the size (add_size) in the meantime
+        task.save(update_fields=['pending_action', 'partial', 'last_error', 'updated_at'])
 
         # Process task right away
         logger.debug("Queueing task %s for background processing", task.id)
@@ -316,8 +335,8 @@ class TaskViewSet(viewsets.ViewSet):
         except ValueError:
             raise exceptions.ValidationError("Invalid parameter")
 
-        lines = task.console.output().rstrip().split('\n')
-        count = len(lines)
+        # Only read the requested lines (console outputs can be large)
+        count = task.console.line_count(rstrip=True)
         line_start = min(line_num, count)
         line_end = None
 
@@ -328,13 +347,15 @@ class TaskViewSet(viewsets.ViewSet):
                 line_start = line_start if count - line_start <= abs(limit) else count - abs(limit) 
                 line_end = None 
 
+        lines = task.console.lines(line_start, line_end)
+
         if fmt == 'text':
-            return Response('\n'.join(lines[line_start:line_end]))
+            return Response('\n'.join(lines))
         elif fmt == 'raw':
-            return HttpResponse('\n'.join(lines[line_start:line_end]), content_type="text/plain; charset=utf-8")
+            return HttpResponse('\n'.join(lines), content_type="text/plain; charset=utf-8")
         else:
             return Response({
-                'lines': lines[line_start:line_end],
+                'lines': lines,
                 'count': count
             })
 
@@ -367,7 +388,7 @@ class TaskViewSet(viewsets.ViewSet):
                      Q(dsm_extent__intersects=geom) | \
                      Q(dtm_extent__intersects=geom)
 
-        tasks = self.queryset.filter(query)
+        tasks = self.queryset.filter(query).select_related('project', 'processing_node')
         tasks = filters.OrderingFilter().filter_queryset(self.request, tasks, self)
         serializer = TaskSerializer(tasks, many=True)
         return Response(serializer.data)
@@ -401,8 +422,8 @@ class TaskViewSet(viewsets.ViewSet):
         if task.images_count < 1:
             raise exceptions.ValidationError(detail=_("You need to upload at least 1 file before commit"))
 
-        task.update_size()
-        task.save()
+        # Other uploads might be updating the size (add_size) in the meantime
+        task.save(update_fields=['partial', 'images_count', 'updated_at'])
         worker_tasks.process_task.delay(task.id)
 
         serializer = TaskSerializer(task)
@@ -429,19 +450,26 @@ class TaskViewSet(viewsets.ViewSet):
         total_chunk_count = request.data.get('dztotalchunkcount', None)
         if len(files) == 1 and chunk_index is not None and uuid is not None and total_chunk_count is not None:
             byte_offset = request.data.get('dzchunkbyteoffset', 0)
+            total_size = request.data.get('dztotalfilesize', None)
             try:
                 chunk_index = int(chunk_index)
                 byte_offset = int(byte_offset)
                 total_chunk_count = int(total_chunk_count)
+                total_size = int(total_size) if total_size is not None else None
             except ValueError:
                 raise exceptions.ValidationError(detail="chunkIndex is not an int")
+
+            try:
+                check_chunk_range(byte_offset, files[0].size, total_size)
+            except ValidationError as e:
+                raise exceptions.ValidationError(detail=e.message)
             
             chunk_info = {
                 'uuid': re.sub('[^0-9a-zA-Z-]+', "", uuid),
                 'chunk_index': chunk_index,
                 'byte_offset': byte_offset,
                 'total_chunk_count': total_chunk_count,
-                'tmp_upload_file': os.path.join(settings.FILE_UPLOAD_TEMP_DIR, f"{uuid}.upload")
+                'total_size': total_size
             }
 
         # 50% of the time, raise an exception
@@ -449,15 +477,48 @@ class TaskViewSet(viewsets.ViewSet):
         # if random.random() < 0.5:
         #     raise exceptions.ValidationError(detail=_("Random upload failure for testing"))
 
-        uploaded = task.handle_images_upload(files, chunk_info)
+        try:
+            uploaded = task.handle_images_upload(files, chunk_info)
+        except ValidationError as e:
+            raise exceptions.ValidationError(detail=e.message)
+
         if len(uploaded) > 0:
             task.images_count = len(task.scan_images())
             # Update other parameters such as processing node, task name, etc.
             serializer = TaskSerializer(task, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+
+            # Parallel uploads update the size (add_size) concurrently,
+            # so we only save the fields that were changed
+            for attr, value in serializer.validated_data.items():
+                setattr(task, attr, value)
+            task.save(update_fields=list(serializer.validated_data.keys()) + ['images_count', 'updated_at'])
         
-        return Response({'success': True, 'uploaded': uploaded}, status=status.HTTP_200_OK)
+        response = {'success': True, 'uploaded': uploaded}
+        if chunk_info is not None and len(uploaded) == 0:
+            # Let clients know which bytes we have, so they can resume
+            response['received'] = ChunkedUpload(settings.FILE_UPLOAD_TEMP_DIR, chunk_info['uuid']).received()['ranges']
+
+        return Response(response, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='upload/ranges')
+    def upload_ranges(self, request, pk=None, project_pk=None):
+        """
+        Byte ranges received so far for a chunked upload
+        (identified by dzuuid), to resume interrupted uploads
+        """
+        get_and_check_project(request, project_pk, ('change_project', ))
+        try:
+            self.queryset.get(pk=pk, project=project_pk)
+        except (ObjectDoesNotExist, ValidationError):
+            raise exceptions.NotFound()
+
+        uuid = request.query_params.get('dzuuid')
+        if not uuid:
+            raise exceptions.ValidationError(detail="dzuuid is required")
+
+        upload = ChunkedUpload(settings.FILE_UPLOAD_TEMP_DIR, re.sub('[^0-9a-zA-Z-]+', "", uuid))
+        return Response(upload.received(), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None, project_pk=None):
@@ -559,6 +620,151 @@ class TaskViewSet(viewsets.ViewSet):
         return self.update(request, *args, **kwargs)
 
 
+# Max number of tasks that can be polled or streamed with a single request
+TASK_UPDATES_MAX_IDS = 200
+
+# Changes made up to this long before the requested version are returned again,
+# since a row can be committed after a concurrent change with a later timestamp
+TASK_UPDATES_OVERLAP = timedelta(seconds=5)
+
+# Seconds between keepalive comments sent to idle event streams
+TASK_EVENTS_KEEPALIVE = 15
+
+def parse_task_ids(request):
+    ids = [i.strip() for i in request.query_params.get('ids', '').split(",") if i.strip() != ""]
+    if len(ids) == 0:
+        raise exceptions.ValidationError(_("You need to specify at least one task ID"))
+    if len(ids) > TASK_UPDATES_MAX_IDS:
+        raise exceptions.ValidationError(_("Too many task IDs (max %(count)s)") % {'count': TASK_UPDATES_MAX_IDS})
+
+    try:
+        for i in ids:
+            uuid_module.UUID(i)
+    except ValueError:
+        raise exceptions.ValidationError(_("Invalid parameter"))
+
+    return ids
+
+def viewable_tasks_query(user, ids):
+    projects = get_objects_for_user(user, 'view_project', models.Project, accept_global_perms=False)
+    return Q(id__in=ids, project__in=projects)
+
+def task_event_values(queryset):
+    tasks = list(queryset.order_by('updated_at').values(*TASK_EVENT_FIELDS))
+    for t in tasks:
+        t['id'] = str(t['id'])
+        t['updated_at'] = datetime_to_version(t['updated_at'])
+    return tasks
+
+class TaskUpdates(APIView):
+    """
+    Status and progress of a set of tasks that changed since a given version,
+    for clients that need to poll many tasks frequently.
+
+    Query params:
+     - "ids": comma separated list of task IDs
+     - "since": optional version returned by a previous call.
+       When omitted, all (accessible) tasks are returned.
+
+    The response includes the version to pass in the next call and
+    an ETag, so that polling unchanged tasks results in a 304 response.
+    """
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request):
+        ids = parse_task_ids(request)
+
+        since = request.query_params.get('since')
+        try:
+            if since is not None:
+                since = int(since)
+                if since < 0:
+                    raise ValueError("Invalid version")
+        except ValueError:
+            raise exceptions.ValidationError(_("Invalid parameter"))
+
+        query = viewable_tasks_query(request.user, ids)
+        if since is not None:
+            query &= Q(updated_at__gt=version_to_datetime(since) - TASK_UPDATES_OVERLAP)
+
+        tasks = task_event_values(models.Task.objects.filter(query))
+
+        version = since or 0
+        for t in tasks:
+            version = max(version, t['updated_at'])
+
+        result = {
+            'version': version,
+            'tasks': tasks
+        }
+
+        # Unchanged tasks always result in the same response
+        etag = '"{}"'.format(hashlib.md5(json.dumps(result, sort_keys=True).encode('utf-8')).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(result)
+            response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class TaskEvents(APIView):
+    """
+    Stream (Server-Sent Events) of status and progress changes of a set of tasks.
+
+    Query params:
+     - "ids": comma separated list of task IDs
+
+    The stream starts with an event for each (accessible) task with its current state,
+    followed by events published by workers, which might include only some fields
+    (same fields as /api/tasks/updates). Streams are closed after
+    TASK_EVENTS_STREAM_TIMEOUT seconds and clients are expected to reconnect.
+    """
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get(self, request):
+        if not settings.TASK_EVENTS:
+            raise exceptions.NotFound(_("Task events are disabled"))
+
+        query = viewable_tasks_query(request.user, parse_task_ids(request))
+        task_ids = list(models.Task.objects.filter(query).values_list('id', flat=True))
+
+        # Subscribe before reading the current state, so that no changes are missed
+        pubsub = task_events.subscribe(task_ids) if len(task_ids) > 0 else None
+        tasks = task_event_values(models.Task.objects.filter(id__in=task_ids))
+
+        # Don't hold a database connection for the duration of the stream
+        if not connection.in_atomic_block:
+            connection.close()
+
+        def stream():
+            try:
+                yield "retry: {}\n\n".format(TASK_EVENTS_KEEPALIVE * 1000)
+                for t in tasks:
+                    yield "data: {}\n\n".format(json.dumps(t))
+
+                if pubsub is None:
+                    return
+
+                deadline = time.time() + settings.TASK_EVENTS_STREAM_TIMEOUT
+                while time.time() < deadline:
+                    message = pubsub.get_message(timeout=min(TASK_EVENTS_KEEPALIVE, max(0, deadline - time.time())))
+                    if message is None:
+                        yield ": keepalive\n\n"
+                    else:
+                        yield "data: {}\n\n".format(message['data'].decode('utf-8'))
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+        response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+
+        # Tell nginx not to buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class TaskNestedView(APIView):
     queryset = models.Task.objects.all().defer('orthophoto_extent', 'dtm_extent', 'dsm_extent', )
     permission_classes = (AllowAny, )
@@ -582,12 +788,63 @@ class TaskNestedView(APIView):
         return task
 
 
-def download_file_response(request, filePath, content_disposition, download_filename=None):
+def parse_range_header(header, filesize):
+    """
+    Parse a single byte range from an HTTP Range header
+    :return: (start, end) inclusive, None if the header should be ignored
+        (missing, malformed or multiple ranges) or False if the range cannot be satisfied
+    """
+    m = re.match(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", header or "")
+    if m is None:
+        return None
+
+    start, end = m.group(1), m.group(2)
+    if start == "" and end == "":
+        return None
+
+    if start == "":
+        # Last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, filesize - length), filesize - 1
+
+    start = int(start)
+    if end != "" and int(end) < start:
+        return None
+    if start >= filesize:
+        return False
+    end = filesize - 1 if end == "" else min(int(end), filesize - 1)
+    return start, end
+
+
+def file_range_iterator(file, start, length, chunk_size=1024 * 1024):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def download_file_response(request, filePath, content_disposition, download_filename=None, accel_redirect=True):
+    """
+    Send a file, with support for byte ranges (206) and conditional requests (ETag / Last-Modified)
+    :param accel_redirect: let nginx send files in MEDIA_ROOT (via X-Accel-Redirect) when
+        DOWNLOAD_ACCEL_REDIRECT is set. Must be False for files that are removed after the response is sent.
+    """
     filename = os.path.basename(filePath)
     if download_filename is None:
         download_filename = filename
-    filesize = os.stat(filePath).st_size
-    file = open(filePath, "rb")
+    st = os.stat(filePath)
+    filesize = st.st_size
+    content_type = mimetypes.guess_type(filename)[0] or "application/zip"
+    last_modified = int(st.st_mtime)
+    etag = '"{:x}-{:x}-{:x}"'.format(st.st_ino, st.st_mtime_ns, filesize)
 
     logger.debug(
         "Preparing %s response for %s (size=%s bytes) requested by %s",
@@ -597,24 +854,54 @@ def download_file_response(request, filePath, content_disposition, download_file
         getattr(request.user, 'username', 'anonymous'),
     )
 
-    # More than 100mb, normal http response, otherwise stream
-    # Django docs say to avoid streaming when possible
-    stream = filesize > 1e8 or request.GET.get('_force_stream', False)
-    if stream:
-        response = FileResponse(file)
-    else:
-        response = HttpResponse(FileWrapper(file),
-                                content_type=(mimetypes.guess_type(filename)[0] or "application/zip"))
+    def set_headers(response):
+        response['Content-Disposition'] = "{}; filename={}".format(content_disposition, download_filename)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    # Not modified / precondition failed
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return set_headers(response)
+
+    real_path = os.path.realpath(filePath)
+    media_root = os.path.join(os.path.realpath(settings.MEDIA_ROOT), "")
+    if accel_redirect and settings.DOWNLOAD_ACCEL_REDIRECT and real_path.startswith(media_root):
+        # nginx sends the bytes (and handles ranges)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.DOWNLOAD_ACCEL_REDIRECT + os.path.relpath(real_path, media_root))
+        return set_headers(response)
+
+    # Ranges are ignored if the file changed since the client's first request
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+        byte_range = parse_range_header(request.META.get('HTTP_RANGE'), filesize)
+
+    if byte_range is False:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = "bytes */{}".format(filesize)
+        return set_headers(response)
 
-    response['Content-Type'] = mimetypes.guess_type(filename)[0] or "application/zip"
-    response['Content-Disposition'] = "{}; filename={}".format(content_disposition, download_filename)
-    response['Content-Length'] = filesize
+    file = open(filePath, "rb")
+    if byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(file_range_iterator(file, start, end - start + 1),
+                                         status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type)
+        response['Content-Range'] = "bytes {}-{}/{}".format(start, end, filesize)
+        response['Content-Length'] = end - start + 1
+    else:
+        # Served with sendfile when the WSGI server supports wsgi.file_wrapper
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = filesize
 
-    # For testing
-    if stream:
-        response['_stream'] = 'yes'
+        # For testing
+        if request.GET.get('_force_stream', False):
+            response['_stream'] = 'yes'
 
-    return response
+    return set_headers(response)
 
 
 def download_file_stream(request, stream, content_disposition, download_filename=None):
@@ -685,7 +972,8 @@ class TaskThumbnail(TaskNestedView):
         except ValueError:
             pass
 
-        with rasterio.open(orthophoto_path, "r") as raster:
+        with cog_reader(orthophoto_path) as src:
+            raster = src.dataset
             ci = raster.colorinterp
             indexes = (1, 2, 3,)
 
@@ -851,34 +1139,28 @@ class TaskAssetsImport(APIView):
         total_chunk_count = request.data.get('dztotalchunkcount', None)
 
         # Chunked upload?
-        tmp_upload_file = None
+        upload = None
         if len(files) > 0 and chunk_index is not None and uuid is not None and total_chunk_count is not None:
             byte_offset = request.data.get('dzchunkbyteoffset', 0) 
+            total_size = request.data.get('dztotalfilesize', None)
 
             try:
                 chunk_index = int(chunk_index)
                 byte_offset = int(byte_offset)
                 total_chunk_count = int(total_chunk_count)
+                total_size = int(total_size) if total_size is not None else None
             except ValueError:
                 raise exceptions.ValidationError(detail="Some parameters are not integers")
             uuid = re.sub('[^0-9a-zA-Z-]+', "", uuid)
 
-            tmp_upload_file = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, f"{uuid}.upload")
-            if os.path.isfile(tmp_upload_file) and chunk_index == 0:
-                os.unlink(tmp_upload_file)
-            
-            with open(tmp_upload_file, 'ab') as fd:
-                fd.truncate(byte_offset)
-                fd.seek(byte_offset)
-                if isinstance(files[0], InMemoryUploadedFile):
-                    for chunk in files[0].chunks():
-                        fd.write(chunk)
-                else:
-                    with open(files[0].temporary_file_path(), 'rb') as f:
-                        shutil.copyfileobj(f, fd)
-            
-            if chunk_index + 1 < total_chunk_count:
-                return Response({'uploaded': True}, status=status.HTTP_200_OK)
+            upload = ChunkedUpload(settings.FILE_UPLOAD_TEMP_DIR, uuid)
+            try:
+                check_chunk_range(byte_offset, files[0].size, total_size)
+                if not upload.write_chunk(files[0], byte_offset, chunk_index=chunk_index,
+                                          total_chunk_count=total_chunk_count, total_size=total_size):
+                    return Response({'uploaded': True, 'received': upload.received()['ranges']}, status=status.HTTP_200_OK)
+            except ValidationError as e:
+                raise exceptions.ValidationError(detail=e.message)
 
         # Ready to import
         with transaction.atomic():
@@ -892,17 +1174,10 @@ class TaskAssetsImport(APIView):
             destination_file = task.assets_path("all.zip")
 
             # Non-chunked file import
-            if tmp_upload_file is None and len(files) > 0:
-                with open(destination_file, 'wb+') as fd:
-                    if isinstance(files[0], InMemoryUploadedFile):
-                        for chunk in files[0].chunks():
-                            fd.write(chunk)
-                    else:
-                        with open(files[0].temporary_file_path(), 'rb') as file:
-                            copyfileobj(file, fd)
-            elif tmp_upload_file is not None:
-                # Move
-                shutil.move(tmp_upload_file, destination_file)
+            if upload is None and len(files) > 0:
+                save_uploaded_file(files[0], destination_file)
+            elif upload is not None:
+                upload.finish(destination_file)
 
             worker_tasks.process_task.delay(task.id)
 
@@ -1,6 +1,4 @@
 import json
-import math
-import numbers
 from rasterio.enums import ColorInterp
 from rasterio.crs import CRS
 from rasterio.features import bounds as featureBounds
@@ -8,16 +6,14 @@ from rasterio.errors import NotGeoreferencedWarning
 import urllib
 import os
 from .common import get_asset_download_filename
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
 from rio_tiler.errors import TileOutsideBounds
-from rio_tiler.models import BandStatistics
 from rio_tiler.profiles import img_profiles
 from rio_tiler.colormap import cmap as colormap, apply_cmap
-from rio_tiler.io import COGReader
 from rio_tiler.errors import InvalidColorMapName, AlphaBandWarning
 from rio_tiler.utils import (
     create_cutline,
-    get_array_statistics,
     has_alpha_band,
     non_alpha_indexes,
     render,
@@ -30,10 +26,14 @@ from .hillshade import LightSource
 from .formulas import lookup_formula, get_algorithm_list, get_auto_bands
 from .tasks import TaskNestedView
 from app.geoutils import geom_transform_wkt_bbox
+from app.reader_pool import cog_reader
+from app.raster_stats import get_raster_statistics, make_json_safe, serialize_model, normalize_band_name
+from app.tile_cache import tile_cache_enabled, get_tile_cache_key, get_cached_tile, write_cached_tile
 from rest_framework import exceptions
 from rest_framework.response import Response
 from worker.tasks import export_raster, export_pointcloud
 from django.utils.translation import gettext as _
+from webodm import settings
 import warnings
 
 # Disable: NotGeoreferencedWarning: Dataset has no geotransform, gcps, or rpcs. The identity matrix be returned.
@@ -52,48 +52,6 @@ for custom_colormap in custom_colormaps:
     colormap = colormap.register(custom_colormap)
 
 
-def _make_json_safe(value):
-    if isinstance(value, CRS):
-        return value.to_string() or value.to_epsg() or value.to_wkt()
-    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
-        float_value = float(value)
-        if not math.isfinite(float_value):
-            return None
-        return float_value
-    if isinstance(value, dict):
-        return {k: _make_json_safe(v) for k, v in value.items()}
-    if isinstance(value, (list, tuple)):
-        return [_make_json_safe(v) for v in value]
-    return value
-
-
-def _serialize_model(model):
-    if hasattr(model, "model_dump"):
-        return _make_json_safe(model.model_dump())
-    if hasattr(model, "dict"):
-        return _make_json_safe(model.dict())
-    if hasattr(model, "json"):
-        return _make_json_safe(json.loads(model.json()))
-    return _make_json_safe(model)
-
-
-def _ensure_percentiles(stat_dict):
-    stat = dict(stat_dict)
-    percentile_keys = [
-        key for key in stat.keys() if isinstance(key, str) and key.startswith("percentile_")
-    ]
-    if percentile_keys and "percentiles" not in stat:
-        percentile_keys.sort(key=lambda key: float(key.split("_")[1]))
-        stat["percentiles"] = [stat[key] for key in percentile_keys]
-    return stat
-
-
-def _normalize_band_name(name):
-    if isinstance(name, str) and name.startswith("b") and name[1:].isdigit():
-        return name[1:]
-    return name
-
-
 def get_zoom_safe(src_dst):
     minzoom, maxzoom = src_dst.spatial_info["minzoom"], src_dst.spatial_info["maxzoom"]
     if maxzoom < minzoom:
@@ -115,6 +73,14 @@ def get_tile_url(task, tile_type, query_params):
     return url
 
 
+def tile_response(content, ext, etag, public=False):
+    response = HttpResponse(content, content_type="image/{}".format(ext))
+    response['ETag'] = etag
+    patch_cache_control(response, public=public, private=not public,
+                        max_age=settings.TILE_CACHE_MAX_AGE, must_revalidate=True)
+    return response
+
+
 def get_extent(task, tile_type):
     extent_map = {
         'orthophoto': task.orthophoto_extent,
@@ -139,6 +105,190 @@ def get_pointcloud_path(task):
     return task.get_asset_download_path("georeferenced_model.laz")
 
 
+def get_tile_cache_key_for(task, raster_path, tile_type, z, x, y, tilesize, ext, formula=None, bands=None,
+                           rescale=None, color_map=None, hillshade=None, crop_wkt=None, boundaries_feature=None):
+    """
+    Rendered tiles are cached on disk, keyed on
+    every parameter that affects the output
+    """
+    return get_tile_cache_key(task, raster_path, {
+        'tile_type': tile_type,
+        'z': z, 'x': x, 'y': y,
+        'tilesize': tilesize,
+        'ext': ext,
+        'formula': formula,
+        'bands': bands,
+        'rescale': rescale,
+        'color_map': color_map,
+        'hillshade': hillshade,
+        'crop': crop_wkt,
+        'boundaries': boundaries_feature,
+    })
+
+
+def accept_webp(request):
+    return 'image/webp' in request.headers.get('Accept', '')
+
+
+def render_tile(task, tile_type, url, z, x, y, tilesize, ext=None, expr=None, rescale=None,
+                color_map=None, hillshade=None, crop=False, boundaries_feature=None, webp=False):
+    """
+    Render a single tile of a task's raster
+    :return: (content, ext) tuple
+    """
+    indexes = None
+    nodata = None
+
+    with cog_reader(url) as src:
+        if not src.tile_exists(z, x, y):
+            raise exceptions.NotFound(_("Outside of bounds"))
+
+        minzoom, maxzoom = get_zoom_safe(src)
+        has_alpha = has_alpha_band(src.dataset)
+        if z < minzoom - ZOOM_EXTRA_LEVELS or z > maxzoom + ZOOM_EXTRA_LEVELS:
+            raise exceptions.NotFound()
+
+        if boundaries_feature is not None:
+            try:
+                cutline = create_cutline(src.dataset, boundaries_feature, CRS.from_string('EPSG:4326'))
+            except:
+                raise exceptions.ValidationError(_("Invalid boundaries"))
+        elif crop and task.crop is not None:
+            cutline, bounds = geom_transform_wkt_bbox(task.crop, src.dataset)
+        else:
+            cutline = None
+        
+        if cutline is not None:
+            vrt_options = {'cutline': cutline}
+        else:
+            vrt_options = None
+
+        # Handle N-bands datasets for orthophotos (not plant health)
+        if tile_type == 'orthophoto' and expr is None:
+            ci = src.dataset.colorinterp
+            # More than 4 bands?
+            if len(ci) > 4:
+                # Try to find RGBA band order
+                if ColorInterp.red in ci and \
+                        ColorInterp.green in ci and \
+                        ColorInterp.blue in ci:
+                    indexes = (ci.index(ColorInterp.red) + 1,
+                               ci.index(ColorInterp.green) + 1,
+                               ci.index(ColorInterp.blue) + 1,)
+                else:
+                    # Fallback to first three
+                    indexes = (1, 2, 3,)
+            elif has_alpha:
+                indexes = non_alpha_indexes(src.dataset)
+
+        # Workaround for https://github.com/OpenDroneMap/WebODM/issues/894
+        if nodata is None and tile_type == 'orthophoto':
+            nodata = 0
+
+        resampling = "nearest"
+        padding = 0
+        tile_buffer = None
+
+        if tile_type in ["dsm", "dtm"]:
+            resampling = "bilinear"
+            padding = 16
+
+        # Hillshading is not a local tile operation and
+        # requires neighbor tiles to be rendered seamlessly
+        if hillshade is not None:
+            tile_buffer = 16
+
+        try:
+            if expr is not None:
+                tile = src.tile(x, y, z, expression=expr, tilesize=tilesize, nodata=nodata,
+                                padding=padding,
+                                tile_buffer=tile_buffer,
+                                resampling_method=resampling, vrt_options=vrt_options)
+            else:
+                tile = src.tile(x, y, z, indexes=indexes, tilesize=tilesize, nodata=nodata,
+                                padding=padding,
+                                tile_buffer=tile_buffer,
+                                resampling_method=resampling, vrt_options=vrt_options)
+        except TileOutsideBounds:
+            raise exceptions.NotFound(_("Outside of bounds"))
+        
+        if color_map:
+            try:
+                colormap.get(color_map)
+            except InvalidColorMapName:
+                raise exceptions.ValidationError(_("Not a valid color_map value"))
+        
+        intensity = None
+        try:
+            rescale_arr = list(map(float, rescale.split(",")))
+        except ValueError:
+            raise exceptions.ValidationError(_("Invalid rescale value"))
+
+        # Auto?
+        if ext is None:
+            # Check for transparency
+            if np.equal(tile.mask, 255).all():
+                ext = "jpg"
+            else:
+                if webp:
+                    ext = "webp"
+                else:
+                    ext = "png"
+
+        driver = "jpeg" if ext == "jpg" else ext
+
+        options = img_profiles.get(driver, {})
+        if hillshade is not None:
+            try:
+                hillshade = float(hillshade)
+                if hillshade <= 0:
+                    hillshade = 1.0
+            except ValueError:
+                raise exceptions.ValidationError(_("Invalid hillshade value"))
+            if tile.data.shape[0] != 1:
+                raise exceptions.ValidationError(
+                    _("Cannot compute hillshade of non-elevation raster (multiple bands found)"))
+            delta_scale = (maxzoom + ZOOM_EXTRA_LEVELS + 1 - z) ** 2
+            dx = src.dataset.meta["transform"][0] * delta_scale
+            dy = src.dataset.meta["transform"][4] * delta_scale
+            ls = LightSource(azdeg=315, altdeg=45)
+            
+            # Remove elevation data from edge buffer tiles
+            # (to keep intensity uniform across tiles)
+            elevation = tile.data[0]
+            elevation[0:tile_buffer, 0:tile_buffer] = nodata
+            elevation[tile_buffer+tilesize:tile_buffer*2+tilesize, 0:tile_buffer] = nodata
+            elevation[0:tile_buffer, tile_buffer+tilesize:tile_buffer*2+tilesize] = nodata
+            elevation[tile_buffer+tilesize:tile_buffer*2+tilesize, tile_buffer+tilesize:tile_buffer*2+tilesize] = nodata
+
+            intensity = ls.hillshade(elevation, dx=dx, dy=dy, vert_exag=hillshade)
+            intensity = intensity[tile_buffer:tile_buffer+tilesize, tile_buffer:tile_buffer+tilesize]
+
+        content = None
+        if intensity is not None:
+            rgb = tile.post_process(in_range=(rescale_arr,))
+            rgb_data = rgb.data[:,tile_buffer:tilesize+tile_buffer, tile_buffer:tilesize+tile_buffer]
+            if colormap:
+                rgb, _discard_ = apply_cmap(rgb_data, colormap.get(color_map))
+            if rgb.data.shape[0] != 3:
+                raise exceptions.ValidationError(
+                    _("Cannot process tile: intensity image provided, but no RGB data was computed."))
+            intensity = intensity * 255.0
+            rgb = hsv_blend(rgb, intensity)
+            if rgb is not None:
+                mask = tile.mask[tile_buffer:tilesize+tile_buffer, tile_buffer:tilesize+tile_buffer]
+                content = render(rgb, mask, img_format=driver, **options)
+
+        if content is None:
+            if color_map is not None:
+                content = tile.post_process(in_range=(rescale_arr,)).render(img_format=driver, colormap=colormap.get(color_map),
+                                                                **options)
+            else:
+                content = tile.post_process(in_range=(rescale_arr,)).render(img_format=driver, **options)
+
+    return content, ext
+
+
 class TileJson(TaskNestedView):
     def get(self, request, pk=None, project_pk=None, tile_type=""):
         """
@@ -150,7 +300,7 @@ class TileJson(TaskNestedView):
         if not os.path.isfile(raster_path):
             raise exceptions.NotFound()
 
-        with COGReader(raster_path) as src:
+        with cog_reader(raster_path) as src:
             minzoom, maxzoom = get_zoom_safe(src)
 
         return Response({
@@ -213,12 +363,11 @@ class Metadata(TaskNestedView):
 
         except ValueError as e:
             raise exceptions.ValidationError(str(e))
-        pmin, pmax = 2.0, 98.0
         raster_path = get_raster_path(task, tile_type)
         if not os.path.isfile(raster_path):
             raise exceptions.NotFound()
         try:
-            with COGReader(raster_path) as src:
+            with cog_reader(raster_path) as src:
                 band_count = src.dataset.meta['count']
                 if boundaries_feature is not None:
                     cutline = create_cutline(src.dataset, boundaries_feature, CRS.from_string('EPSG:4326'))
@@ -228,64 +377,23 @@ class Metadata(TaskNestedView):
                 else:
                     cutline = None
                     bounds = None
-                
-                if cutline is not None:
-                    vrt_options = {'cutline': cutline}
-                else:
-                    vrt_options = None
+
+                # Read while we hold the reader (it goes back to the pool afterwards)
+                src_bounds = src.bounds
+                src_crs = src.dataset.crs
 
                 if has_alpha_band(src.dataset):
                     band_count -= 1
-                nodata = None
-                # Workaround for https://github.com/OpenDroneMap/WebODM/issues/894
-                if tile_type == 'orthophoto':
-                    nodata = 0
-                histogram_options = {"bins": 255}
-                if hrange is not None:
-                    histogram_options["range"] = hrange
                 info_model = src.info()
-                if expr is not None:
-                    image = src.preview(expression=expr, vrt_options=vrt_options)
-                    data = image.array
-                    if image.mask is not None:
-                        mask = np.expand_dims(image.mask == 0, axis=0)
-                        data = np.ma.array(
-                            data,
-                            mask=np.broadcast_to(mask, data.shape),
-                        )
-                    stats_list = get_array_statistics(
-                        data,
-                        percentiles=[pmin, pmax],
-                        **histogram_options,
-                    )
-                    stats = {
-                        str(b + 1): _ensure_percentiles(
-                            _serialize_model(BandStatistics(**stats_list[b]))
-                        )
-                        for b in range(len(stats_list))
-                    }
-                else:
-                    stats = {}
-                    statistics = src.statistics(
-                        percentiles=[pmin, pmax],
-                        hist_options=histogram_options,
-                        nodata=nodata,
-                        vrt_options=vrt_options,
-                    )
-                    for band, stat in statistics.items():
-                        stats[_normalize_band_name(band)] = _ensure_percentiles(
-                            _serialize_model(stat)
-                        )
-                stats = {
-                    _normalize_band_name(band): value for band, value in stats.items()
-                }
-                info = _serialize_model(info_model)
+                stats = get_raster_statistics(src, raster_path, task.get_raster_statistics_cache(),
+                                              tile_type, expr, hrange, cutline)
+                info = serialize_model(info_model)
                 info["band_metadata"] = [
-                    (_normalize_band_name(b), meta)
+                    (normalize_band_name(b), meta)
                     for b, meta in info.get("band_metadata", [])
                 ]
                 info["band_descriptions"] = [
-                    (_normalize_band_name(b), desc)
+                    (normalize_band_name(b), desc)
                     for b, desc in info.get("band_descriptions", [])
                 ]
                 info["statistics"] = stats
@@ -296,7 +404,7 @@ class Metadata(TaskNestedView):
             # if this ever happens.
             if task.crop is not None:
                 task.crop = None
-                task.save()
+                task.save(update_fields=['crop', 'updated_at'])
             
             raise exceptions.ValidationError("Cannot retrieve raster metadata: %s" % str(e))
         # Override min/max
@@ -371,10 +479,10 @@ class Metadata(TaskNestedView):
             info['maxzoom'] = info['minzoom']
         info['maxzoom'] += ZOOM_EXTRA_LEVELS
         info['minzoom'] -= ZOOM_EXTRA_LEVELS
-        bounds_value = bounds if bounds is not None else src.bounds
+        bounds_value = bounds if bounds is not None else src_bounds
         info['bounds'] = {
             'value': list(bounds_value) if bounds_value is not None else None,
-            'crs': _make_json_safe(src.dataset.crs),
+            'crs': make_json_safe(src_crs),
         }
 
         # Ensure all metadata values are JSON serializable. Certain raster
@@ -382,7 +490,7 @@ class Metadata(TaskNestedView):
         # bounds). Django's JSON renderer will raise a ValueError when
         # attempting to serialize those. Recursively sanitize the payload so we
         # always return a valid JSON document instead of triggering a 500.
-        safe_info = _make_json_safe(info)
+        safe_info = make_json_safe(info)
 
         return Response(safe_info)
 
@@ -400,10 +508,6 @@ class Tiles(TaskNestedView):
 
         scale = int(scale)
 
-        indexes = None
-        nodata = None
-        rgb_tile = None
-
         formula = self.request.query_params.get('formula')
         bands = self.request.query_params.get('bands')
         rescale = self.request.query_params.get('rescale')
@@ -459,166 +563,41 @@ class Tiles(TaskNestedView):
             if rescale is None:
                 rescale = "-1,1"
 
-        if nodata is not None:
-            nodata = np.nan if nodata == "nan" else float(nodata)
         tilesize = scale * tilesize
         url = get_raster_path(task, tile_type)
         if not os.path.isfile(url):
             raise exceptions.NotFound()
 
-        with COGReader(url) as src:
-            if not src.tile_exists(z, x, y):
-                raise exceptions.NotFound(_("Outside of bounds"))
-
-            minzoom, maxzoom = get_zoom_safe(src)
-            has_alpha = has_alpha_band(src.dataset)
-            if z < minzoom - ZOOM_EXTRA_LEVELS or z > maxzoom + ZOOM_EXTRA_LEVELS:
-                raise exceptions.NotFound()
-
-            if boundaries_feature is not None:
-                try:
-                    cutline = create_cutline(src.dataset, boundaries_feature, CRS.from_string('EPSG:4326'))
-                except:
-                    raise exceptions.ValidationError(_("Invalid boundaries"))
-            elif crop and task.crop is not None:
-                cutline, bounds = geom_transform_wkt_bbox(task.crop, src.dataset)
-            else:
-                cutline = None
-            
-            if cutline is not None:
-                vrt_options = {'cutline': cutline}
-            else:
-                vrt_options = None
-
-            # Handle N-bands datasets for orthophotos (not plant health)
-            if tile_type == 'orthophoto' and expr is None:
-                ci = src.dataset.colorinterp
-                # More than 4 bands?
-                if len(ci) > 4:
-                    # Try to find RGBA band order
-                    if ColorInterp.red in ci and \
-                            ColorInterp.green in ci and \
-                            ColorInterp.blue in ci:
-                        indexes = (ci.index(ColorInterp.red) + 1,
-                                   ci.index(ColorInterp.green) + 1,
-                                   ci.index(ColorInterp.blue) + 1,)
-                    else:
-                        # Fallback to first three
-                        indexes = (1, 2, 3,)
-                elif has_alpha:
-                    indexes = non_alpha_indexes(src.dataset)
-
-            # Workaround for https://github.com/OpenDroneMap/WebODM/issues/894
-            if nodata is None and tile_type == 'orthophoto':
-                nodata = 0
-
-            resampling = "nearest"
-            padding = 0
-            tile_buffer = None
-
-            if tile_type in ["dsm", "dtm"]:
-                resampling = "bilinear"
-                padding = 16
-
-            # Hillshading is not a local tile operation and
-            # requires neighbor tiles to be rendered seamlessly
-            if hillshade is not None:
-                tile_buffer = 16
-
+        cache_key = get_tile_cache_key_for(task, url, tile_type, z, x, y, tilesize,
+                                           ext if ext is not None else ('auto-webp' if accept_webp(request) else 'auto'),
+                                           formula, bands, rescale, color_map, hillshade,
+                                           task.crop.wkt if crop and task.crop is not None else None,
+                                           boundaries_feature)
+        etag = '"{}"'.format(cache_key)
+        public = task.public or task.project.public
+
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        cache_dir = task.get_tile_cache() if tile_cache_enabled() else None
+        cached_path, cached_ext = get_cached_tile(cache_dir, cache_key, ext)
+        if cached_path is not None:
             try:
-                if expr is not None:
-                    tile = src.tile(x, y, z, expression=expr, tilesize=tilesize, nodata=nodata,
-                                    padding=padding,
-                                    tile_buffer=tile_buffer,
-                                    resampling_method=resampling, vrt_options=vrt_options)
-                else:
-                    tile = src.tile(x, y, z, indexes=indexes, tilesize=tilesize, nodata=nodata,
-                                    padding=padding,
-                                    tile_buffer=tile_buffer,
-                                    resampling_method=resampling, vrt_options=vrt_options)
-            except TileOutsideBounds:
-                raise exceptions.NotFound(_("Outside of bounds"))
-            
-            if color_map:
-                try:
-                    colormap.get(color_map)
-                except InvalidColorMapName:
-                    raise exceptions.ValidationError(_("Not a valid color_map value"))
-            
-            intensity = None
-            try:
-                rescale_arr = list(map(float, rescale.split(",")))
-            except ValueError:
-                raise exceptions.ValidationError(_("Invalid rescale value"))
-
-            # Auto?
-            if ext is None:
-                # Check for transparency
-                if np.equal(tile.mask, 255).all():
-                    ext = "jpg"
-                else:
-                    if 'image/webp' in request.headers.get('Accept', ''):
-                        ext = "webp"
-                    else:
-                        ext = "png"
-
-            driver = "jpeg" if ext == "jpg" else ext
-
-            options = img_profiles.get(driver, {})
-            if hillshade is not None:
-                try:
-                    hillshade = float(hillshade)
-                    if hillshade <= 0:
-                        hillshade = 1.0
-                except ValueError:
-                    raise exceptions.ValidationError(_("Invalid hillshade value"))
-                if tile.data.shape[0] != 1:
-                    raise exceptions.ValidationError(
-                        _("Cannot compute hillshade of non-elevation raster (multiple bands found)"))
-                delta_scale = (maxzoom + ZOOM_EXTRA_LEVELS + 1 - z) ** 2
-                dx = src.dataset.meta["transform"][0] * delta_scale
-                dy = src.dataset.meta["transform"][4] * delta_scale
-                ls = LightSource(azdeg=315, altdeg=45)
-                
-                # Remove elevation data from edge buffer tiles
-                # (to keep intensity uniform across tiles)
-                elevation = tile.data[0]
-                elevation[0:tile_buffer, 0:tile_buffer] = nodata
-                elevation[tile_buffer+tilesize:tile_buffer*2+tilesize, 0:tile_buffer] = nodata
-                elevation[0:tile_buffer, tile_buffer+tilesize:tile_buffer*2+tilesize] = nodata
-                elevation[tile_buffer+tilesize:tile_buffer*2+tilesize, tile_buffer+tilesize:tile_buffer*2+tilesize] = nodata
-
-                intensity = ls.hillshade(elevation, dx=dx, dy=dy, vert_exag=hillshade)
-                intensity = intensity[tile_buffer:tile_buffer+tilesize, tile_buffer:tile_buffer+tilesize]
-
-            if intensity is not None:
-                rgb = tile.post_process(in_range=(rescale_arr,))
-                rgb_data = rgb.data[:,tile_buffer:tilesize+tile_buffer, tile_buffer:tilesize+tile_buffer]
-                if colormap:
-                    rgb, _discard_ = apply_cmap(rgb_data, colormap.get(color_map))
-                if rgb.data.shape[0] != 3:
-                    raise exceptions.ValidationError(
-                        _("Cannot process tile: intensity image provided, but no RGB data was computed."))
-                intensity = intensity * 255.0
-                rgb = hsv_blend(rgb, intensity)
-                if rgb is not None:
-                    mask = tile.mask[tile_buffer:tilesize+tile_buffer, tile_buffer:tilesize+tile_buffer]
-                    return HttpResponse(
-                        render(rgb, mask, img_format=driver, **options),
-                        content_type="image/{}".format(ext)
-                    )
-
-            if color_map is not None:
-                return HttpResponse(
-                    tile.post_process(in_range=(rescale_arr,)).render(img_format=driver, colormap=colormap.get(color_map),
-                                                                    **options),
-                    content_type="image/{}".format(ext)
-                )
-
-            return HttpResponse(
-                tile.post_process(in_range=(rescale_arr,)).render(img_format=driver, **options),
-                content_type="image/{}".format(ext)
-            )
+                with open(cached_path, 'rb') as f:
+                    return tile_response(f.read(), cached_ext, etag, public)
+            except OSError:
+                # Evicted in the meantime, render it again
+                pass
+
+        content, ext = render_tile(task, tile_type, url, z, x, y, tilesize, ext=ext, expr=expr,
+                                   rescale=rescale, color_map=color_map, hillshade=hillshade,
+                                   crop=crop, boundaries_feature=boundaries_feature,
+                                   webp=accept_webp(request))
+
+        write_cached_tile(cache_dir, cache_key, ext, content)
+        return tile_response(content, ext, etag, public)
 
 
 class Export(TaskNestedView):
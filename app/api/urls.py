@@ -3,7 +3,7 @@ from django.urls import include, re_path
 from app.api.presets import PresetViewSet
 from app.plugins.views import api_view_handler
 from .projects import ProjectViewSet
-from .tasks import TaskViewSet, TaskDownloads, TaskThumbnail, TaskAssets, TaskBackup, TaskAssetsImport, TaskSafeTexturedModel
+from .tasks import TaskViewSet, TaskDownloads, TaskThumbnail, TaskAssets, TaskBackup, TaskAssetsImport, TaskSafeTexturedModel, TaskUpdates, TaskEvents
 from .imageuploads import Thumbnail, ImageDownload
 from .processingnodes import ProcessingNodeViewSet, ProcessingNodeOptionsView
 from .admin import AdminUserViewSet, AdminGroupViewSet, AdminProfileViewSet
@@ -14,6 +14,7 @@ from .potree import Scene, CameraView
 from .workers import CheckTask, GetTaskResult
 from .users import UsersList
 from .externalauth import ExternalTokenAuth
+from .mapitems import MapItems
 from webodm import settings
 
 router = routers.DefaultRouter()
@@ -55,6 +56,10 @@ urlpatterns = [
     re_path(r'projects/(?P<project_pk>[^/.]+)/tasks/(?P<pk>[^/.]+)/3d/scene$', Scene.as_view()),
     re_path(r'projects/(?P<project_pk>[^/.]+)/tasks/(?P<pk>[^/.]+)/3d/cameraview$', CameraView.as_view()),
 
+    re_path(r'^tasks/updates$', TaskUpdates.as_view()),
+    re_path(r'^tasks/events$', TaskEvents.as_view()),
+    re_path(r'^mapitems$', MapItems.as_view()),
+
     re_path(r'workers/check/(?P<celery_task_id>.+)', CheckTask.as_view()),
     re_path(r'workers/get/(?P<celery_task_id>.+)', GetTaskResult.as_view()),
 
@@ -0,0 +1,246 @@
+import errno
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def copy_into(src_path, dst_fd, dst_offset=0):
+    """
+    Copy a file into an open file descriptor at a given offset,
+    letting the kernel move the data when possible
+    :return: number of bytes copied
+    """
+    with open(src_path, 'rb') as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        copied = 0
+
+        # copy_file_range (Linux, same or different filesystems on recent kernels)
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied, copied, dst_offset + copied)
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    return copied
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                    raise
+
+        # sendfile writes at the current position of the destination
+        if hasattr(os, 'sendfile'):
+            try:
+                os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+                while copied < size:
+                    n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    return copied
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                    raise
+
+        # Plain read/write
+        src.seek(copied)
+        while copied < size:
+            buf = src.read(COPY_BUFFER_SIZE)
+            if not buf:
+                break
+            os.pwrite(dst_fd, buf, dst_offset + copied)
+            copied += len(buf)
+
+        return copied
+
+
+def write_uploaded_file(file, dst_fd, dst_offset=0):
+    """
+    Write a Django UploadedFile into an open file descriptor at a given offset
+    :return: number of bytes written
+    """
+    if hasattr(file, 'temporary_file_path'):
+        return copy_into(file.temporary_file_path(), dst_fd, dst_offset)
+
+    written = 0
+    for chunk in file.chunks():
+        os.pwrite(dst_fd, chunk, dst_offset + written)
+        written += len(chunk)
+    return written
+
+
+def save_uploaded_file(file, dst_path):
+    """
+    Save a Django UploadedFile to dst_path, moving the temporary
+    file into place instead of copying it when possible
+    """
+    if hasattr(file, 'temporary_file_path'):
+        try:
+            os.rename(file.temporary_file_path(), dst_path)
+
+            # Temporary files are only readable by their owner
+            os.chmod(dst_path, 0o644)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        write_uploaded_file(file, fd)
+    finally:
+        os.close(fd)
+
+
+def check_chunk_range(byte_offset, chunk_size, total_size=None):
+    """
+    Make sure that a chunk falls within the file
+    :raises ValidationError: if the offset or total size are out of range
+    """
+    if byte_offset < 0:
+        raise ValidationError("Invalid chunk byte offset: {}".format(byte_offset))
+    if total_size is not None:
+        if total_size < 0:
+            raise ValidationError("Invalid total file size: {}".format(total_size))
+        if byte_offset + chunk_size > total_size:
+            raise ValidationError("Chunk ({} bytes at offset {}) exceeds the total file size ({})".format(chunk_size, byte_offset, total_size))
+
+
+def add_range(ranges, start, end):
+    """
+    Add the [start, end) byte range to a sorted list of
+    non-overlapping ranges, merging adjacent ones
+    """
+    result = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if result and s <= result[-1][1]:
+            result[-1][1] = max(result[-1][1], e)
+        else:
+            result.append([s, e])
+    return result
+
+
+class ChunkedUpload:
+    """
+    Assembles a file uploaded in chunks (e.g. by Dropzone). Chunks are written
+    directly at their byte offset, so they can arrive out of order or in parallel,
+    and the byte ranges received so far are tracked so that interrupted
+    uploads can be resumed by sending only the missing chunks.
+    """
+    def __init__(self, upload_dir, uuid):
+        self.path = os.path.join(upload_dir, "{}.upload".format(uuid))
+        self.state_path = self.path + ".json"
+        self.lock_path = self.path + ".lock"
+
+    @contextmanager
+    def locked(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'total_size': None, 'total_chunk_count': None, 'ranges': [], 'chunks': [], 'complete': False}
+
+    def write_state(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def received(self):
+        """
+        :return: dict with the byte ranges ([start, end)) and chunk indexes received so far
+        """
+        with self.locked():
+            state = self.read_state()
+        return {'ranges': state['ranges'], 'chunks': state['chunks'], 'total_size': state['total_size']}
+
+    def write_chunk(self, file, byte_offset, chunk_index=None, total_chunk_count=None, total_size=None):
+        """
+        Write a chunk of the file
+        :param file: UploadedFile with the chunk's data
+        :param total_size: size of the whole file, if known (used to preallocate the file)
+        :return: True if this chunk completed the upload (only one call will ever return True)
+        :raises ValidationError: if the chunk falls outside of the file
+        """
+        check_chunk_range(byte_offset, file.size, total_size)
+
+        with self.locked():
+            state = self.read_state()
+            if state['complete'] or (total_size is not None and state['total_size'] not in [None, total_size]):
+                # Stale upload with the same identifier, start over
+                self.remove_files(self.path, self.state_path)
+                state = self.read_state()
+
+            state['total_size'] = total_size if total_size is not None else state['total_size']
+            state['total_chunk_count'] = total_chunk_count if total_chunk_count is not None else state['total_chunk_count']
+            check_chunk_range(byte_offset, file.size, state['total_size'])
+
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                # Sparse file, so that chunks can be written at any offset
+                if state['total_size'] is not None and os.fstat(fd).st_size < state['total_size']:
+                    os.ftruncate(fd, state['total_size'])
+            finally:
+                os.close(fd)
+
+            self.write_state(state)
+
+        # Write outside of the lock, so that chunks can be written in parallel
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            written = write_uploaded_file(file, fd, byte_offset)
+        finally:
+            os.close(fd)
+
+        with self.locked():
+            state = self.read_state()
+            state['ranges'] = add_range(state['ranges'], byte_offset, byte_offset + written)
+            if chunk_index is not None and not chunk_index in state['chunks']:
+                state['chunks'] = sorted(state['chunks'] + [chunk_index])
+
+            if state['total_size'] is not None:
+                complete = state['ranges'] == [[0, state['total_size']]] or (state['total_size'] == 0)
+            elif state['total_chunk_count'] is not None:
+                complete = len(state['chunks']) >= state['total_chunk_count']
+            else:
+                complete = False
+
+            complete = complete and not state['complete']
+            state['complete'] = state['complete'] or complete
+            self.write_state(state)
+
+        return complete
+
+    def finish(self, dst_path):
+        """
+        Move the assembled file to its final location and clean up
+        """
+        shutil.move(self.path, dst_path)
+        self.cleanup()
+
+    def cleanup(self):
+        self.remove_files(self.path, self.state_path, self.lock_path)
+
+    @staticmethod
+    def remove_files(*paths):
+        for p in paths:
+            try:
+                os.unlink(p)
+            except FileNotFoundError:
+                pass
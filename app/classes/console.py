@@ -1,7 +1,126 @@
 import os
 import logging
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 logger = logging.getLogger('app.logger')
 
+# Maximum number of console files for which
+# line offsets are kept in memory (per process)
+LINE_INDEX_CACHE_SIZE = 256
+
+# Same characters stripped by str.rstrip (ASCII only)
+WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+# Bytes checked to detect when a file has been replaced
+SIGNATURE_SIZE = 64
+
+class LineIndex:
+    """
+    Byte offsets of the beginning of each line of a file,
+    built incrementally as the file grows
+    """
+    def __init__(self, ino):
+        self.ino = ino
+        self.size = 0
+        self.offsets = array('Q', [0])
+        self.signature = b""
+        self.lock = threading.Lock()
+
+    def feed(self, data):
+        base = self.size
+        pos = data.find(b"\n")
+        while pos != -1:
+            self.offsets.append(base + pos + 1)
+            pos = data.find(b"\n", pos + 1)
+
+        self.size += len(data)
+        self.signature = (self.signature + data)[-SIGNATURE_SIZE:]
+
+    def matches(self, f, st):
+        if self.ino != st.st_ino or self.size > st.st_size:
+            return False
+        if self.size == 0:
+            return True
+
+        # Inodes can be reused, make sure the content we indexed is still there
+        f.seek(self.size - len(self.signature))
+        return f.read(len(self.signature)) == self.signature
+
+    def update(self, f, st):
+        while self.size < st.st_size:
+            f.seek(self.size)
+            data = f.read(min(st.st_size - self.size, 1024 * 1024))
+            if not data:
+                break
+            self.feed(data)
+
+
+_line_indexes = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+def get_line_index(path, f):
+    """
+    :param path: path of the file
+    :param f: file object of path, opened in binary mode
+    :return: up to date LineIndex for the file
+    """
+    st = os.fstat(f.fileno())
+
+    with _line_indexes_lock:
+        index = _line_indexes.get(path)
+        if index is not None:
+            _line_indexes.move_to_end(path)
+        else:
+            index = LineIndex(st.st_ino)
+            _line_indexes[path] = index
+            while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+                _line_indexes.popitem(last=False)
+
+    with index.lock:
+        if not index.matches(f, st):
+            # File was replaced or truncated, start over
+            with _line_indexes_lock:
+                index = LineIndex(st.st_ino)
+                _line_indexes[path] = index
+            index.update(f, st)
+        else:
+            index.update(f, st)
+
+    return index
+
+def extend_line_index(path, ino, offset, data):
+    """
+    Update the index of a file after data has been appended at offset
+    (if the index is not in sync, it will be updated on the next read)
+    """
+    with _line_indexes_lock:
+        index = _line_indexes.get(path)
+
+    if index is not None:
+        with index.lock:
+            if index.ino == ino and index.size == offset:
+                index.feed(data)
+
+def clear_line_index(path):
+    with _line_indexes_lock:
+        _line_indexes.pop(path, None)
+
+def stripped_end(f, size):
+    """
+    :return: position of the end of the file, excluding trailing whitespace
+    """
+    end = size
+    while end > 0:
+        chunk_start = max(0, end - 4096)
+        f.seek(chunk_start)
+        chunk = f.read(end - chunk_start).rstrip(WHITESPACE)
+        if chunk:
+            return chunk_start + len(chunk)
+        end = chunk_start
+    return 0
+
 class Console:
     def __init__(self, file):
         self.file = file
@@ -29,6 +148,48 @@ class Console:
     def output(self):
         return str(self)
 
+    def line_count(self, rstrip=False):
+        """
+        Count the lines of console output without reading the entire file
+        :param rstrip: ignore trailing whitespace (same as output().rstrip().split("\n"))
+        :return: number of lines (same as output().split("\n"), or 0 if there's no output)
+        """
+        try:
+            with open(self.file, 'rb') as f:
+                index = get_line_index(self.file, f)
+                if rstrip:
+                    return bisect_right(index.offsets, stripped_end(f, index.size))
+                elif index.size == 0:
+                    return 0
+                else:
+                    return len(index.offsets)
+        except IOError:
+            return 1 if rstrip else 0
+
+    def lines(self, line_start=0, line_end=None):
+        """
+        Read a range of lines of console output, ignoring trailing whitespace.
+        Only the requested lines are read from disk.
+        :return: same as output().rstrip().split("\n")[line_start:line_end]
+        """
+        try:
+            with open(self.file, 'rb') as f:
+                index = get_line_index(self.file, f)
+                end = stripped_end(f, index.size)
+                count = bisect_right(index.offsets, end)
+
+                start = min(max(0, line_start), count)
+                stop = count if line_end is None else min(max(line_end, start), count)
+                if start >= stop:
+                    return []
+
+                byte_start = index.offsets[start]
+                byte_end = index.offsets[stop] - 1 if stop < count else end
+                f.seek(byte_start)
+                return f.read(byte_end - byte_start).decode('utf-8', errors='replace').split("\n")
+        except IOError:
+            return [""][line_start:line_end]
+
     def append(self, text):
         if os.path.isdir(self.parent_dir):
             try:
@@ -36,8 +197,14 @@ class Console:
                 if not os.path.isdir(self.base_dir):
                     os.makedirs(self.base_dir, exist_ok=True)
                 
-                with open(self.file, "a", encoding="utf-8") as f:
-                    f.write(text)
+                data = text.encode('utf-8')
+                with open(self.file, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    offset = f.tell() - len(data)
+                    ino = os.fstat(f.fileno()).st_ino
+
+                extend_line_index(self.file, ino, offset, data)
             except IOError:
                 logger.warn("Cannot append to console file: %s" % self.file)
 
@@ -49,6 +216,7 @@ class Console:
 
                 if os.path.isfile(self.file):
                     os.unlink(self.file)
+                clear_line_index(self.file)
                 
                 with open(self.file, "w", encoding="utf-8") as f:
                     f.write(text)
@@ -73,6 +241,7 @@ class Console:
             
             if os.path.isfile(self.file):
                 os.unlink(self.file)
+            clear_line_index(self.file)
             
             os.link(src_file, self.file)
         except OSError:
@@ -0,0 +1,85 @@
+import errno
+import fcntl
+import logging
+import os
+import shutil
+
+logger = logging.getLogger('app.logger')
+
+# ioctl(dst_fd, FICLONE, src_fd) from linux/fs.h
+FICLONE = 0x40049409
+
+LINK = 'link'
+REFLINK = 'reflink'
+COPY = 'copy'
+
+
+def reflink(src, dst):
+    """
+    Create dst as a copy-on-write clone of src (btrfs, XFS, ZFS >= 2.2, ...)
+    :return: True if the clone was created, False if the filesystem does not support it
+    """
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError as e:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EPERM):
+            return False
+        raise
+
+
+def clone_file(src, dst, link=True):
+    """
+    Duplicate a file using the cheapest method available: a hard link (if link is True),
+    a reflink or a regular copy. Hard links share the file with its source, so they
+    should only be used for files that are never modified in place.
+    :return: (method, bytes written)
+    """
+    if link:
+        try:
+            os.link(src, dst)
+            return LINK, 0
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+
+    if reflink(src, dst):
+        return REFLINK, 0
+
+    shutil.copy2(src, dst)
+    return COPY, os.path.getsize(dst)
+
+
+def clone_tree(src, dst, link_filter=None, mode='cow'):
+    """
+    Duplicate a directory tree
+    :param link_filter: function(relative_path) returning True for files that can be hard linked
+    :param mode: "cow" to link/reflink files where possible or "copy" to always copy
+    :return: dict with the number of files linked, reflinked and copied, and the number of bytes written
+    """
+    stats = {LINK: 0, REFLINK: 0, COPY: 0, 'bytes_written': 0}
+
+    for root, dirs, files in os.walk(src, followlinks=True):
+        rel_root = os.path.relpath(root, src)
+        dst_root = os.path.normpath(os.path.join(dst, rel_root))
+        os.makedirs(dst_root, exist_ok=True)
+
+        for f in files:
+            src_file = os.path.join(root, f)
+            dst_file = os.path.join(dst_root, f)
+
+            if mode == 'copy':
+                shutil.copy2(src_file, dst_file)
+                method, written = COPY, os.path.getsize(dst_file)
+            else:
+                link = link_filter is not None and link_filter(os.path.normpath(os.path.join(rel_root, f)))
+                method, written = clone_file(src_file, dst_file, link=link)
+
+            stats[method] += 1
+            stats['bytes_written'] += written
+
+    return stats
@@ -5,6 +5,8 @@ import shutil
 import rasterio
 import re
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pipes import quote
 from rio_cogeo.cogeo import cog_validate, cog_translate
 from rio_tiler.utils import has_alpha_band
@@ -12,6 +14,33 @@ from webodm import settings
 
 logger = logging.getLogger('app.logger')
 
+def has_cog_layout(src_path):
+    """
+    Fast check for the structural metadata that GDAL's COG driver
+    writes right after the TIFF header of the files it creates
+    :param src_path: path to GeoTIFF
+    :return: true if the GeoTIFF declares a COG layout that hasn't been edited since
+    """
+    try:
+        with open(src_path, 'rb') as f:
+            header = f.read(1024)
+    except IOError:
+        return False
+
+    # Classic TIFF / BigTIFF
+    for offset in [8, 16]:
+        prefix = b"GDAL_STRUCTURAL_METADATA_SIZE="
+        if header[offset:offset + len(prefix)] == prefix:
+            try:
+                size = int(header[offset + len(prefix):offset + len(prefix) + 6])
+            except ValueError:
+                return False
+            metadata = header[offset:offset + 43 + size]
+            return b"LAYOUT=IFDS_BEFORE_DATA" in metadata and \
+                   b"KNOWN_INCOMPATIBLE_EDITION=NO" in metadata
+
+    return False
+
 def valid_cogeo(src_path):
     """
     Validate a Cloud Optimized GeoTIFF
@@ -20,7 +49,10 @@ def valid_cogeo(src_path):
     """
     try:
         from app.vendor.validate_cloud_optimized_geotiff import validate
-        warnings, errors, details = validate(src_path, full_check=True)
+
+        # Reading tile leaders/trailers is slow on large rasters
+        # and is not needed if GDAL wrote the file as a COG
+        warnings, errors, details = validate(src_path, full_check=not has_cog_layout(src_path))
         return not errors and not warnings
     except ModuleNotFoundError:
         logger.warning("Using legacy cog_validate (osgeo.gdal package not found)")
@@ -28,21 +60,22 @@ def valid_cogeo(src_path):
         return cog_validate(src_path, strict=True)
 
 
-def assure_cogeo(src_path):
+def assure_cogeo(src_path, num_threads="ALL_CPUS"):
     """
     Guarantee that the .tif passed as an argument is a Cloud Optimized GeoTIFF (cogeo)
     If the path is not a cogeo, it is destructively converted into a cogeo.
     If the file cannot be converted, the function does not change the file
     :param src_path: path to GeoTIFF (cogeo or not)
-    :return: None
+    :param num_threads: number of threads to use for the conversion
+    :return: True if the file was converted, False otherwise
     """
 
     if not os.path.isfile(src_path):
         logger.warning("Cannot validate cogeo: %s (file does not exist)" % src_path)
-        return
+        return False
 
     if valid_cogeo(src_path):
-        return
+        return False
 
     # Not a cogeo
     logger.info("Optimizing %s as Cloud Optimized GeoTIFF" % src_path)
@@ -66,9 +99,34 @@ def assure_cogeo(src_path):
         
     if use_legacy:
         logger.warning("Using legacy implementation (GDAL >= 3.1 not found)")
-        return make_cogeo_legacy(src_path)
+        return make_cogeo_legacy(src_path, num_threads)
     else:
-        return make_cogeo_gdal(src_path)
+        return make_cogeo_gdal(src_path, num_threads)
+
+def assure_cogeos(paths, cpu_budget=0):
+    """
+    Run assure_cogeo on multiple rasters concurrently,
+    splitting a CPU budget among the conversions
+    :param paths: paths to GeoTIFFs (cogeo or not)
+    :param cpu_budget: max number of CPUs to use (0 for all available CPUs)
+    :return: list of (path, converted, seconds elapsed, IOError or None), in the same order as paths
+    """
+    if cpu_budget is None or cpu_budget <= 0:
+        cpu_budget = os.cpu_count() or 1
+
+    jobs = max(1, min(len(paths), cpu_budget))
+    num_threads = max(1, cpu_budget // jobs)
+
+    def run(src_path):
+        start = time.time()
+        try:
+            converted = assure_cogeo(src_path, num_threads)
+            return src_path, converted, time.time() - start, None
+        except IOError as e:
+            return src_path, False, time.time() - start, e
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(run, paths))
 
 def get_gdal_version():
     # Bit of a hack without installing 
@@ -87,7 +145,7 @@ def get_gdal_version():
     return tuple(map(int, m.groups()))
 
 
-def make_cogeo_gdal(src_path):
+def make_cogeo_gdal(src_path, num_threads="ALL_CPUS"):
     """
     Make src_path a Cloud Optimized GeoTIFF.
     Requires GDAL >= 3.1
@@ -100,10 +158,10 @@ def make_cogeo_gdal(src_path):
         subprocess.run(["gdal_translate", "-of", "COG",
                         "-co", "BLOCKSIZE=256",
                         "-co", "COMPRESS=deflate",
-                        "-co", "NUM_THREADS=ALL_CPUS",
+                        "-co", "NUM_THREADS={}".format(num_threads),
                         "-co", "BIGTIFF=IF_SAFER",
                         "-co", "RESAMPLING=NEAREST",
-                        "--config", "GDAL_NUM_THREADS", "ALL_CPUS",
+                        "--config", "GDAL_NUM_THREADS", str(num_threads),
                         quote(src_path), quote(tmpfile)])
     except Exception as e:
         logger.warning("Cannot create Cloud Optimized GeoTIFF: %s" % str(e))
@@ -125,7 +183,7 @@ def make_cogeo_gdal(src_path):
     else:
         return False
 
-def make_cogeo_legacy(src_path):
+def make_cogeo_legacy(src_path, num_threads="ALL_CPUS"):
     """
     Make src_path a Cloud Optimized GeoTIFF
     This implementation does not require GDAL >= 3.1
@@ -146,7 +204,7 @@ def make_cogeo_legacy(src_path):
 
         # Dataset Open option (see gdalwarp `-oo` option)
         config = dict(
-            GDAL_NUM_THREADS="ALL_CPUS",
+            GDAL_NUM_THREADS=str(num_threads),
             GDAL_TIFF_INTERNAL_MASK=True,
             GDAL_TIFF_OVR_BLOCKSIZE="128",
         )
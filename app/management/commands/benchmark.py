@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.transform import from_origin
+from django.core.management.base import BaseCommand
+from rasterio.windows import Window
+from app.raster_utils import export_raster, compute_subwindows, plan_subwindows, estimate_window_io
+from app.models.task import resize_images_parallel
+from app.synthetic_images import write_synthetic_images
+from webodm import settings
+
+class Command(BaseCommand):
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", type=str, choices=['export', 'io', 'resize'])
+        parser.add_argument("--input", type=str, required=False, help="Raster to analyze (io action)")
+        parser.add_argument("--size", type=int, default=8192, required=False, help="Width/height in pixels of the synthetic raster")
+        parser.add_argument("--images", type=int, default=24, required=False, help="Number of synthetic images (resize action)")
+        parser.add_argument("--resize-to", type=int, default=2048, required=False, help="Target size of the largest side (resize action)")
+        parser.add_argument("--workers", type=int, default=settings.WORKERS_MAX_THREADS, required=False, help="Number of workers to compare against a single worker")
+        parser.add_argument("--keep", action='store_true', required=False, help="Don't delete the generated files")
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, **options):
+        if options.get('action') == 'export':
+            size = options.get('size')
+            workers = max(2, options.get('workers'))
+            tmpdir = tempfile.mkdtemp(dir=settings.MEDIA_TMP)
+
+            try:
+                dem = os.path.join(tmpdir, "dsm.tif")
+                print(f"Generating {size}x{size} synthetic DEM: {dem}")
+                write_synthetic_dem(dem, size, size)
+
+                opts = {'asset_type': 'dsm', 'format': 'gtiff-rgb', 'color_map': 'viridis', 'hillshade': 6}
+                outputs = {}
+                for w in [1, workers]:
+                    output = os.path.join(tmpdir, f"export_{w}.tif")
+                    start = time.time()
+                    export_raster(dem, output, max_workers=w, **opts)
+                    elapsed = time.time() - start
+                    outputs[w] = (output, elapsed)
+                    print(f"{w} worker(s): {round(elapsed, 2)}s")
+
+                serial, serial_time = outputs[1]
+                parallel, parallel_time = outputs[workers]
+                print(f"Speedup: {round(serial_time / parallel_time, 2)}x")
+
+                with rasterio.open(serial) as a, rasterio.open(parallel) as b:
+                    identical = np.array_equal(a.read(), b.read())
+                print("Outputs are identical" if identical else "WARNING: outputs differ")
+            finally:
+                if not options.get('keep'):
+                    shutil.rmtree(tmpdir)
+                else:
+                    print(f"Files kept in {tmpdir}")
+        elif options.get('action') == 'io':
+            input = options.get('input')
+            if input is None or not os.path.isfile(input):
+                print("Please specify a valid --input raster")
+                return
+
+            with rasterio.open(input) as src:
+                win = Window(0, 0, src.width, src.height)
+                block_h, block_w = src.block_shapes[0]
+                print(f"{input}: {src.width}x{src.height}, {src.count} band(s), {block_w}x{block_h} blocks")
+
+                for label, subwins in [("Fixed 512px windows", compute_subwindows(win, 512)),
+                                       ("Block aligned windows", plan_subwindows(src, win, 512))]:
+                    for pad in [0, 16]:
+                        decompressed, output = estimate_window_io(src, subwins, pad=pad)
+                        print(f"{label} (padding: {pad}px): {len(subwins)} windows, "
+                              f"{round(decompressed / 1024 / 1024, 2)} MB decompressed, "
+                              f"{round(output / 1024 / 1024, 2)} MB output "
+                              f"({round(decompressed / output, 2) if output > 0 else 0}x)")
+        elif options.get('action') == 'resize':
+            count = options.get('images')
+            resize_to = options.get('resize_to')
+            workers = max(2, options.get('workers'))
+            tmpdir = tempfile.mkdtemp(dir=settings.MEDIA_TMP)
+
+            try:
+                source = os.path.join(tmpdir, "source")
+                print(f"Generating {count} synthetic 5472x3648 images: {source}")
+                images = write_synthetic_images(source, count)
+
+                runs = [("1 worker", 1, False), ("1 worker (draft)", 1, True), (f"{workers} workers (draft)", workers, True)]
+                for label, w, draft in runs:
+                    run_dir = os.path.join(tmpdir, f"run_{w}_{draft}")
+                    shutil.copytree(source, run_dir)
+                    paths = [os.path.join(run_dir, os.path.basename(im)) for im in images]
+
+                    start = time.time()
+                    resized = resize_images_parallel(paths, resize_to, max_workers=w, draft=draft)
+                    elapsed = time.time() - start
+
+                    with Image.open(resized[0]['path']) as im:
+                        exif = 'exif' in im.info
+                        size = im.size
+                    print(f"{label}: {round(elapsed, 2)}s ({round(count / elapsed, 2)} images/s), "
+                          f"output {size[0]}x{size[1]}, EXIF {'preserved' if exif else 'MISSING'}")
+            finally:
+                if not options.get('keep'):
+                    shutil.rmtree(tmpdir)
+                else:
+                    print(f"Files kept in {tmpdir}")
+        else:
+            print("Invalid action")
+
+
+def write_synthetic_dem(path, width, height, block_size=256):
+    with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1,
+                        dtype=rasterio.float32, nodata=-9999, crs='EPSG:32615',
+                        transform=from_origin(576000, 4550000, 0.1, 0.1),
+                        tiled=True, blockxsize=block_size, blockysize=block_size,
+                        compress='DEFLATE', BIGTIFF='IF_SAFER') as dst:
+        for _, w in dst.block_windows(1):
+            y, x = np.mgrid[w.row_off:w.row_off + w.height, w.col_off:w.col_off + w.width]
+            elevation = 100 + 20 * np.sin(x / 150.0) * np.cos(y / 210.0) + np.random.random(x.shape)
+            dst.write(elevation.astype(np.float32), 1, window=w)
+
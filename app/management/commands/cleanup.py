@@ -1,5 +1,7 @@
 import os
 import shutil
+import time
+from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from app.models import Project
@@ -9,8 +11,8 @@ class Command(BaseCommand):
     requires_system_checks = []
 
     def add_arguments(self, parser):
-        parser.add_argument("action", type=str, choices=['projects'])
-        parser.add_argument("--dry-run", action='store_true', required=False, help="Don't actually delete folders")
+        parser.add_argument("action", type=str, choices=['projects', 'quotas'])
+        parser.add_argument("--dry-run", action='store_true', required=False, help="Don't actually delete folders (or tasks)")
         parser.add_argument("--only-empty", action='store_true', required=False, help="Only delete folders if there's no data")
         
         super(Command, self).add_arguments(parser)
@@ -55,7 +57,18 @@ class Command(BaseCommand):
                         print(f"WARNING: orphaned folder with data inside: {orphaned_folder}")
                 else:
                     rm(orphaned_folder)
-                
+        elif options.get('action') == 'quotas':
+            from worker.tasks import check_quotas
+
+            report = check_quotas(dry_run=options.get('dry_run'))
+            print(f"{len(report)} user(s) over quota")
+
+            for entry in report:
+                expired = time.time() > entry['deadline']
+                print(f"{entry['user']}: {round(entry['used'], 2)} / {round(entry['quota'], 2)} MB, "
+                      f"deadline {'expired' if expired else datetime.fromtimestamp(entry['deadline']).isoformat()}")
+                for task_id in entry['tasks']:
+                    print(f"R {task_id}")
         else:
             print("Invalid action")
                 
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from app.models import Task
+from nodeodm import status_codes
+
+class Command(BaseCommand):
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action='store_true', required=False, help="Parse stats.json files even if they did not change")
+
+        super(Command, self).add_arguments(parser)
+
+    def handle(self, **options):
+        tasks = Task.objects.filter(status=status_codes.COMPLETED).select_related('project')
+        print(f"Checking {tasks.count()} completed tasks")
+
+        updated = 0
+        for task in tasks.iterator(chunk_size=500):
+            if task.update_statistics_field(commit=True, force=options.get('force')):
+                updated += 1
+                print(f"U {task}")
+
+        print(f"Updated statistics of {updated} tasks")
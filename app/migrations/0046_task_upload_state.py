@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0045_update_json_and_bool_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='upload_state',
+            field=models.JSONField(blank=True, default=dict, help_text="State of the upload of this task's files to the processing node, used to resume interrupted uploads", verbose_name='Upload State'),
+        ),
+    ]
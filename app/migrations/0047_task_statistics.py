@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0046_task_upload_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='statistics',
+            field=models.JSONField(blank=True, default=None, help_text="Processing statistics parsed from the task's stats.json", null=True, verbose_name='Statistics'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='statistics_mtime',
+            field=models.FloatField(blank=True, default=None, help_text='Modification time of the stats.json file the statistics were parsed from', null=True, verbose_name='Statistics Modification Time'),
+        ),
+    ]
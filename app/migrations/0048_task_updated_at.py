@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0047_task_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Last time the status or progress of the task changed', verbose_name='Updated at'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0048_task_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='tile_seed_progress',
+            field=models.FloatField(blank=True, default=0.0, help_text="Value between 0 and 1 indicating the progress of rendering this task's tiles into the tile cache", verbose_name='Tile Seed Progress'),
+        ),
+    ]
@@ -10,6 +10,10 @@ from django.core.cache import cache
 from webodm import settings
 
 
+def clear_used_quota_cache(user_id):
+    cache.delete(f'used_quota_{user_id}')
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     quota = models.FloatField(default=-1, blank=True, help_text=_("Maximum disk quota in megabytes"), verbose_name=_("Quota"))
@@ -48,7 +52,7 @@ class Profile(models.Model):
         return q > self.quota
 
     def clear_used_quota_cache(self):
-        cache.delete(f'used_quota_{self.user.id}')
+        clear_used_quota_cache(self.user_id)
 
     def get_quota_deadline(self):
         return cache.get(f'quota_deadline_{self.user.id}')
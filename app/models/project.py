@@ -4,8 +4,8 @@ import shutil
 import os
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Q
 from django.db.models import signals
 from django.dispatch import receiver
 from django.utils import timezone
@@ -17,12 +17,15 @@ from django.db import transaction
 
 from app import pending_actions
 
-from nodeodm import status_codes
 from webodm import settings as wo_settings
 
 logger = logging.getLogger('app.logger')
 
 
+def map_items_cache_key(project_id):
+    return 'project_map_items_{}'.format(project_id)
+
+
 class Project(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, help_text=_("The person who created the project"), verbose_name=_("Owner"))
     name = models.CharField(max_length=255, help_text=_("A label used to describe the project"), verbose_name=_("Name"))
@@ -66,7 +69,7 @@ class Project(models.Model):
             # Need to remove all tasks before we can remove this project
             # which will be deleted by workers after pending actions
             # have been completed
-            self.task_set.update(pending_action=pending_actions.REMOVE)
+            self.task_set.update(pending_action=pending_actions.REMOVE, updated_at=timezone.now())
             self.deleting = True
             self.save()
             logger.info("Tasks pending, set project {} deleting flag".format(self.id))
@@ -87,11 +90,20 @@ class Project(models.Model):
         return self.task_set.count()
 
     def get_map_items(self):
-        return [task.get_map_items() for task in self.task_set.filter(
-                    status=status_codes.COMPLETED
-                ).filter(Q(orthophoto_extent__isnull=False) | Q(dsm_extent__isnull=False) | Q(dtm_extent__isnull=False))
-                .only('id', 'project_id')
-                .order_by('-created_at')]
+        """
+        Map items of the project's completed tasks, built with a single query
+        and cached until one of the project's completed tasks changes
+        """
+        key = map_items_cache_key(self.id)
+        map_items = cache.get(key)
+        if map_items is None:
+            Task = self.task_set.model
+            map_items = [Task.map_item_from_values(v) for v in Task.map_items_values(self.task_set.all())]
+            cache.set(key, map_items, 3600) # 1 hour
+        return map_items
+
+    def clear_map_items_cache(self):
+        cache.delete(map_items_cache_key(self.id))
 
     def get_public_info(self):
         return {
@@ -136,8 +148,13 @@ class Project(models.Model):
         if self.public and self.public_id is None:
             self.public_id = uuid.uuid4()
 
+        adding = self._state.adding
         super(Project, self).save(*args, **kwargs)
 
+        # Don't serve map items cached for a previous project with the same ID
+        if adding:
+            self.clear_map_items_cache()
+
     class Meta:
         verbose_name = _("Project")
         verbose_name_plural = _("Projects")
@@ -2,10 +2,14 @@ import logging
 import math
 import os
 import shutil
+import stat
 import time
 import struct
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import uuid as uuid_module
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from zipstream.ng import ZipStream
 
 import json
@@ -26,10 +30,12 @@ from django.contrib.gis.gdal import GDALRaster
 from django.contrib.gis.gdal import OGRGeometry
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.postgres.fields import ArrayField
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.cache import cache
 from django.core.exceptions import ValidationError, SuspiciousFileOperation
 from django.db import models
 from django.db import transaction
+from django.db.models import F, Q, Func, ExpressionWrapper
+from django.db.models.functions import Coalesce, Greatest
 from django.db import connection
 from django.utils import timezone
 from urllib3.exceptions import ReadTimeoutError
@@ -37,9 +43,15 @@ from urllib3.exceptions import ReadTimeoutError
 from app import pending_actions
 from django.contrib.gis.db.models.fields import GeometryField
 
-from app.cogeo import assure_cogeo
+from app.cogeo import assure_cogeos
+from app.raster_stats import precompute_raster_statistics
+from app.tile_cache import tile_cache_enabled
 from app.pointcloud_utils import is_pointcloud_georeferenced
 from app.testwatch import testWatch
+from app.zip_utils import extract_zip, download_and_extract_zip
+from app.clone import clone_file, clone_tree
+from app import task_events
+from app.task_events import ProgressThrottle
 from app.security import path_traversal_check
 from app.geoutils import geom_transform
 from nodeodm import status_codes
@@ -47,12 +59,13 @@ from nodeodm.models import ProcessingNode
 from pyodm.exceptions import NodeResponseError, NodeConnectionError, NodeServerError, OdmError
 from webodm import settings
 from app.classes.gcp import GCPFile
-from .project import Project
+from .project import Project, map_items_cache_key
 from django.utils.translation import gettext_lazy as _, gettext
 
 from functools import partial
 import subprocess
 from app.classes.console import Console
+from app.classes.chunked_upload import ChunkedUpload, save_uploaded_file
 
 logger = logging.getLogger('app.logger')
 redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
@@ -69,6 +82,14 @@ def full_task_directory_path(taskId, projectId, *args):
     return os.path.join(settings.MEDIA_ROOT, task_directory_path(taskId, projectId), *args)
 
 
+def tile_base_url(projectId, taskId, tile_type):
+    # plant is just a special case of orthophoto
+    if tile_type == 'plant':
+        tile_type = 'orthophoto'
+
+    return "/api/projects/{}/tasks/{}/{}/".format(projectId, taskId, tile_type)
+
+
 def assets_directory_path(taskId, projectId, filename):
     # files will be uploaded to MEDIA_ROOT/project/<id>/task/<id>/<filename>
     return '{0}{1}'.format(task_directory_path(taskId, projectId), filename)
@@ -78,6 +99,76 @@ def gcp_directory_path(task, filename):
     return assets_directory_path(task.id, task.project.id, filename)
 
 
+def resize_images_parallel(images_path, resize_to, done=None, max_workers=1, draft=True):
+    """
+    Resize images using a pool of threads (PIL releases the GIL
+    while decoding, resampling and encoding)
+    :param images_path: list of paths to images
+    :param done: optional callback, invoked from the calling thread
+    :return: list of resize_image results, in the same order as images_path
+    """
+    if max_workers <= 1:
+        return [resize_image(image_path, resize_to, done=done, draft=draft) for image_path in images_path]
+
+    # Callbacks are queued and invoked from this thread,
+    # so that they can safely interrupt the resize
+    callbacks = queue.Queue()
+    def queue_done(*args):
+        callbacks.put(args)
+
+    results = [None] * len(images_path)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(resize_image, image_path, resize_to, queue_done, draft): i for i, image_path in enumerate(images_path)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+            while not callbacks.empty():
+                args = callbacks.get()
+                if done is not None:
+                    done(*args)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return results
+
+
+def directory_size(path):
+    """
+    :return: number of bytes used by the files in a directory (excluding symlinks)
+    """
+    total_bytes = 0
+    for dirpath, _, filenames in os.walk(path):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            if not os.path.islink(fp):
+                total_bytes += os.path.getsize(fp)
+    return total_bytes
+
+
+def remove_directory(path):
+    """
+    Remove a directory tree
+    :return: number of bytes that were freed (excluding symlinks)
+    """
+    freed_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            st = os.lstat(fp)
+            os.unlink(fp)
+            if not stat.S_ISLNK(st.st_mode):
+                freed_bytes += st.st_size
+        for d in dirnames:
+            dp = os.path.join(dirpath, d)
+            if os.path.islink(dp):
+                os.unlink(dp)
+            else:
+                os.rmdir(dp)
+    os.rmdir(path)
+    return freed_bytes
+
+
 def validate_task_options(value):
     """
     Make sure that the format of this options field is valid
@@ -93,11 +184,12 @@ def validate_task_options(value):
 
 
 
-def resize_image(image_path, resize_to, done=None):
+def resize_image(image_path, resize_to, done=None, draft=True):
     """
     :param image_path: path to the image
     :param resize_to: target size to resize this image to (largest side)
     :param done: optional callback
+    :param draft: use reduced JPEG decoding when downscaling by a factor of 2 or more
     :return: path and resize ratio
     """
     try:
@@ -145,6 +237,11 @@ def resize_image(image_path, resize_to, done=None):
         resized_width = int(width * ratio)
         resized_height = int(height * ratio)
 
+        if draft and ratio <= 0.5 and im.format == 'JPEG':
+            # Let the decoder downscale by 1/2, 1/4 or 1/8 (no smaller than the
+            # target size), which is much faster than decoding the full image
+            im.draft(im.mode, (resized_width, resized_height))
+
         im = im.resize((resized_width, resized_height), Image.LANCZOS)
         params = {}
         if is_jpeg:
@@ -264,6 +361,7 @@ class Task(models.Model):
 
     # mission
     created_at = models.DateTimeField(default=timezone.now, help_text=_("Creation date"), verbose_name=_("Created at"))
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True, help_text=_("Last time the status or progress of the task changed"), verbose_name=_("Updated at"))
     pending_action = models.IntegerField(choices=PENDING_ACTIONS, db_index=True, null=True, blank=True, help_text=_("A requested action to be performed on the task. The selected action will be performed by the worker at the next iteration."), verbose_name=_("Pending Action"))
 
     public = models.BooleanField(default=False, help_text=_("A flag indicating whether this task is available to the public"), verbose_name=_("Public"))
@@ -275,6 +373,7 @@ class Task(models.Model):
                                         help_text=_("Value between 0 and 1 indicating the upload progress of this task's files to the processing node"),
                                         verbose_name=_("Upload Progress"),
                                         blank=True)
+    upload_state = models.JSONField(default=dict, blank=True, help_text=_("State of the upload of this task's files to the processing node, used to resume interrupted uploads"), verbose_name=_("Upload State"))
     resize_progress = models.FloatField(default=0.0,
                                         help_text=_("Value between 0 and 1 indicating the resize progress of this task's images"),
                                         verbose_name=_("Resize Progress"),
@@ -283,6 +382,10 @@ class Task(models.Model):
                                         help_text=_("Value between 0 and 1 indicating the running progress (estimated) of this task"),
                                         verbose_name=_("Running Progress"),
                                         blank=True)
+    tile_seed_progress = models.FloatField(default=0.0,
+                                        help_text=_("Value between 0 and 1 indicating the progress of rendering this task's tiles into the tile cache"),
+                                        verbose_name=_("Tile Seed Progress"),
+                                        blank=True)
     import_url = models.TextField(null=False, default="", blank=True, help_text=_("URL this task is imported from (only for imported tasks)"), verbose_name=_("Import URL"))
     images_count = models.IntegerField(null=False, blank=True, default=0, help_text=_("Number of images associated with this task"), verbose_name=_("Images Count"))
     partial = models.BooleanField(default=False, help_text=_("A flag indicating whether this task is currently waiting for information or files to be uploaded before being considered for processing."), verbose_name=_("Partial"))
@@ -291,6 +394,8 @@ class Task(models.Model):
     tags = models.TextField(db_index=True, default="", blank=True, help_text=_("Task tags"), verbose_name=_("Tags"))
     orthophoto_bands = models.JSONField(default=list, blank=True, help_text=_("List of orthophoto bands"), verbose_name=_("Orthophoto Bands"))
     size = models.FloatField(default=0.0, blank=True, help_text=_("Size of the task on disk in megabytes"), verbose_name=_("Size"))
+    statistics = models.JSONField(null=True, default=None, blank=True, help_text=_("Processing statistics parsed from the task's stats.json"), verbose_name=_("Statistics"))
+    statistics_mtime = models.FloatField(null=True, default=None, blank=True, help_text=_("Modification time of the stats.json file the statistics were parsed from"), verbose_name=_("Statistics Modification Time"))
     compacted = models.BooleanField(default=False, help_text=_("A flag indicating whether this task was compacted"), verbose_name=_("Compact"))
     crop = GeometryField(null=True, blank=True, srid=4326, help_text=_("Polygon defining the crop area of this task"), verbose_name=_("Crop Polygon"))
 
@@ -303,7 +408,11 @@ class Task(models.Model):
         super(Task, self).__init__(*args, **kwargs)
 
         # To help keep track of changes to the project id
-        self.__original_project_id = self.project.id
+        self.__original_project_id = self.project_id
+
+        # To help keep track of tasks leaving the completed state
+        # (read from __dict__ to avoid loading the field if it was deferred)
+        self.__original_status = self.__dict__.get('status')
         
         self.console = Console(self.data_path("console_output.txt"))
 
@@ -337,6 +446,9 @@ class Task(models.Model):
             logger.warning("Could not move assets folder for task {}. We're going to proceed anyway, but you might experience issues: {}".format(self, e))
 
     def save(self, *args, **kwargs):
+        previous_project_id = self.__original_project_id
+        previous_status = self.__original_status
+
         if self.project.id != self.__original_project_id:
             self.move_assets(self.__original_project_id, self.project.id)
             self.__original_project_id = self.project.id
@@ -377,7 +489,19 @@ class Task(models.Model):
         self.clean()
         self.validate_unique()
 
+        self.updated_at = timezone.now()
+
         super(Task, self).save(*args, **kwargs)
+        self.__original_status = self.status
+
+        # Completed tasks are part of their project's map items
+        # (after commit, so that readers cannot cache the old list in the meantime)
+        if status_codes.COMPLETED in (self.status, previous_status):
+            keys = list(set([map_items_cache_key(self.project_id), map_items_cache_key(previous_project_id)]))
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+        event = {f: getattr(self, f) for f in task_events.TASK_EVENT_FIELDS}
+        transaction.on_commit(lambda: task_events.publish(self.id, event))
     
     def get_extent(self):
         if self.orthophoto_extent is not None:
@@ -385,7 +509,7 @@ class Task(models.Model):
         elif self.dsm_extent is not None:
             return self.dsm_extent.extent
         elif self.dtm_extent is not None:
-            return self.dsm_extent.extent
+            return self.dtm_extent.extent
         else:
             return None
 
@@ -406,7 +530,7 @@ class Task(models.Model):
         Get path relative to the root task directory
         """
         return os.path.join(settings.MEDIA_ROOT,
-                            assets_directory_path(self.id, self.project.id, ""),
+                            assets_directory_path(self.id, self.project_id, ""),
                             *args)
 
     def is_asset_available_slow(self, asset):
@@ -428,6 +552,38 @@ class Task(models.Model):
         return False
 
     def get_statistics(self):
+        """
+        Statistics parsed from ODM's stats.json (cached in the statistics field).
+        Tasks processed before the field was introduced are parsed once on first access
+        (or in bulk with the updatestatistics management command)
+        """
+        if self.statistics is None:
+            self.update_statistics_field(commit=True)
+        return self.statistics
+
+    def update_statistics_field(self, commit=False, force=False):
+        """
+        Updates the statistics field by parsing stats.json, if it changed since it was last parsed
+        :param commit: when True also writes the field to the database
+        :param force: parse stats.json even if it did not change
+        :return: True if the field was updated
+        """
+        stats_json = self.assets_path("odm_report", "stats.json")
+        try:
+            mtime = os.path.getmtime(stats_json)
+        except OSError:
+            mtime = None
+
+        if not force and self.statistics is not None and mtime == self.statistics_mtime:
+            return False
+
+        self.statistics = self.parse_statistics()
+        self.statistics_mtime = mtime
+        if commit:
+            Task.objects.filter(pk=self.id).update(statistics=self.statistics, statistics_mtime=self.statistics_mtime)
+        return True
+
+    def parse_statistics(self):
         """
         Parse ODM's stats.json if available
         """
@@ -620,6 +776,7 @@ class Task(models.Model):
             with transaction.atomic():
                 task = Task.objects.get(pk=self.pk)
                 task.pk = None
+                task.upload_state = {}
                 if set_new_name:
                     task.name = gettext('Copy of %(task)s') % {'task': self.name}
                 task.created_at = timezone.now()
@@ -629,16 +786,14 @@ class Task(models.Model):
                 logger.info("Duplicating {} to {}".format(self, task))
 
                 if os.path.isdir(self.task_path()):
-                    try:
-                        # Try to use hard links first
-                        shutil.copytree(self.task_path(), task.task_path(), copy_function=os.link)
-                    except Exception as e:
-                        logger.warning("Cannot duplicate task using hard links, will use normal copy instead: {}".format(str(e)))
-                        shutil.copytree(self.task_path(), task.task_path())
+                    stats = clone_tree(self.task_path(), task.task_path(),
+                                       link_filter=Task.is_immutable_file, mode=settings.TASK_DUPLICATE_MODE)
+                    logger.info("Duplicated files of {}: {} linked, {} reflinked, {} copied ({} bytes written)".format(
+                        self, stats['link'], stats['reflink'], stats['copy'], stats['bytes_written']))
                 else:
                     logger.warning("Task {} doesn't have folder, will skip copying".format(self))
 
-                self.project.owner.profile.clear_used_quota_cache()
+                self.clear_used_quota_cache()
 
                 from app.plugins import signals as plugin_signals
                 plugin_signals.task_duplicated.send_robust(sender=self.__class__, task_id=task.id)
@@ -649,6 +804,21 @@ class Task(models.Model):
         
         return False
 
+    @staticmethod
+    def is_immutable_file(path):
+        """
+        Whether a file (path relative to the task directory) is only ever replaced
+        or removed, never modified in place, so that duplicates can share it via hard links.
+        These are the input images (and other files in the root of the task directory)
+        and the assets downloaded from the processing node.
+        """
+        parts = os.path.normpath(path).split(os.sep)
+        if len(parts) == 1:
+            return True
+
+        # Console output is appended to (and might be linked to data/console_output.txt)
+        return parts[0] == "assets" and path != os.path.join("assets", "task_output.txt")
+
     def write_backup_file(self):
         """Dump this tasks's fields to a backup file"""
         with open(self.data_path("backup.json"), "w") as f:
@@ -781,19 +951,19 @@ class Task(models.Model):
                     content_length = download_stream.headers.get('content-length')
                     total_length = int(content_length) if content_length is not None else None
                     downloaded = 0
-                    last_update = 0
+                    throttle = ProgressThrottle()
 
                     with open(zip_path, 'wb') as fd:
                         for chunk in download_stream.iter_content(4096):
                             downloaded += len(chunk)
 
-                            if time.time() - last_update >= 2:
+                            publish, write = throttle.check()
+                            if publish or write:
                                 # Update progress
                                 if total_length is not None:
-                                    Task.objects.filter(pk=self.id).update(running_progress=(float(downloaded) / total_length) * 0.9)
+                                    self.report_progress(write, running_progress=(float(downloaded) / total_length) * 0.9)
 
                                 self.check_if_canceled()
-                                last_update = time.time()
 
                             fd.write(chunk)
 
@@ -803,7 +973,7 @@ class Task(models.Model):
         self.refresh_from_db()
 
         try:
-            self.extract_assets_and_complete()
+            self.extract_assets_and_complete(progress_start=0.9)
         except (zipfile.BadZipFile, FileNotFoundError):
             raise NodeServerError(gettext("Invalid zip file"))
         except NotImplementedError:
@@ -907,18 +1077,29 @@ class Task(models.Model):
                     )
                     images = [os.path.join(images_path, i) for i in image_names]
 
-                    # Track upload progress, but limit the number of DB updates
-                    # to every 2 seconds (and always record the 100% progress)
-                    last_update = 0
-                    def callback(progress):
-                        nonlocal last_update
+                    # Resume a previous upload to the same node with the same options
+                    upload_state = {}
+                    if self.upload_state.get('node') == self.processing_node.id and self.upload_state.get('options') == self.options:
+                        upload_state = dict(self.upload_state)
+                        logger.info("Resuming upload of {} ({} files already uploaded)".format(self, len(upload_state.get('uploaded', []))))
+                    previously_uploaded = len(upload_state.get('uploaded', []))
+
+                    def state_callback(uuid, uploaded):
+                        upload_state.update({'node': self.processing_node.id, 'options': self.options, 'uuid': uuid, 'uploaded': uploaded})
+                        if len(uploaded) == 0:
+                            Task.objects.filter(pk=self.id).update(upload_state=upload_state)
 
-                        time_has_elapsed = time.time() - last_update >= 2
-                        if time_has_elapsed:
+                    # Track upload progress, but limit the number of events and DB updates
+                    throttle = ProgressThrottle()
+                    def callback(progress):
+                        publish, write = throttle.check()
+                        if publish or write:
                             testWatch.manual_log_call("Task.process.callback")
                             self.check_if_canceled()
-                            Task.objects.filter(pk=self.id).update(upload_progress=float(progress) / 100.0)
-                            last_update = time.time()
+                            if write:
+                                self.report_progress(upload_progress=float(progress) / 100.0, upload_state=upload_state)
+                            else:
+                                self.report_progress(False, upload_progress=float(progress) / 100.0)
 
                     # This takes a while
                     try:
@@ -928,16 +1109,28 @@ class Task(models.Model):
                             self.processing_node_id,
                             json.dumps(self.options),
                         )
-                        uuid = self.processing_node.process_new_task(images, self.name, self.options, callback)
+                        uuid = self.processing_node.process_new_task(images, self.name, self.options, callback,
+                                                                     upload_state=upload_state, state_callback=state_callback)
                         logger.debug("Task %s received processing UUID %s", self.id, uuid)
                     except NodeConnectionError as e:
+                        Task.objects.filter(pk=self.id).update(upload_state=upload_state)
+
+                        # If files were uploaded, try again at the next tick
+                        # (already uploaded files will be skipped)
+                        if len(upload_state.get('uploaded', [])) > previously_uploaded:
+                            raise e
+
                         # If we can't create a task because the node is offline
                         # We want to fail instead of trying again
                         raise NodeServerError(gettext('Connection error: %(error)s') % {'error': str(e)})
+                    except Exception as e:
+                        Task.objects.filter(pk=self.id).update(upload_state=upload_state)
+                        raise e
 
                     # Refresh task object before committing change
                     self.refresh_from_db()
                     self.upload_progress = 1.0
+                    self.upload_state = {}
                     self.uuid = uuid
                     self.save()
 
@@ -1044,24 +1237,11 @@ class Task(models.Model):
                 # Need to update status (first time, queued or running?)
                 if self.uuid and self.status in [None, status_codes.QUEUED, status_codes.RUNNING]:
                     # Update task info from processing node
-                    if not self.console.output():
-                        current_lines_count = 0
-                    else:
-                        current_lines_count = len(self.console.output().split("\n"))
+                    current_lines_count = self.console.line_count()
+                    previous_status = (self.status, self.last_error)
 
                     info = self.processing_node.get_task_info(self.uuid, current_lines_count)
-
-                    self.processing_time = info.processing_time
-                    self.status = info.status.value
-
-                    if len(info.output) > 0:
-                        self.console += "\n".join(info.output) + '\n'
-
-                    # Update running progress
-                    self.running_progress = (info.progress / 100.0) * self.TASK_PROGRESS_LAST_VALUE
-
-                    if info.last_error != "":
-                        self.last_error = info.last_error
+                    self.update_from_task_info(info)
 
                     # Has the task just been canceled, failed, or completed?
                     if self.status in [status_codes.FAILED, status_codes.COMPLETED, status_codes.CANCELED]:
@@ -1073,7 +1253,7 @@ class Task(models.Model):
                             # Remove previous assets directory
                             if os.path.exists(assets_dir):
                                 logger.info("Removing old assets directory: {} for {}".format(assets_dir, self))
-                                shutil.rmtree(assets_dir)
+                                self.add_size(-remove_directory(assets_dir))
 
                             os.makedirs(assets_dir)
 
@@ -1081,33 +1261,60 @@ class Task(models.Model):
                             # (~5% of the times, on large downloads, the archive could be corrupted)
                             retry_num = 0
                             extracted = False
-                            last_update = 0
+                            throttle = ProgressThrottle()
 
                             def callback(progress):
-                                nonlocal last_update
+                                publish, write = throttle.check(final=int(progress) == 100)
 
-                                time_has_elapsed = time.time() - last_update >= 2
-
-                                if time_has_elapsed or int(progress) == 100:
-                                    Task.objects.filter(pk=self.id).update(running_progress=(
+                                if publish or write:
+                                    self.report_progress(write, running_progress=(
                                         self.TASK_PROGRESS_LAST_VALUE + (float(progress) / 100.0) * 0.1))
-                                    last_update = time.time()
+
+                            def fetch_range(start, end):
+                                try:
+                                    return self.processing_node.download_task_asset_range(self.uuid, "all.zip", start, end)
+                                except OdmError as e:
+                                    raise zipfile.BadZipFile(str(e))
 
                             while not extracted:
                                 last_update = 0
+                                all_zip_path = self.assets_path("all.zip")
+
+                                total_size = None
+                                if settings.PIPELINED_ASSET_DOWNLOADS and retry_num == 0:
+                                    try:
+                                        total_size = self.processing_node.get_task_asset_size(self.uuid, "all.zip")
+                                    except NodeServerError as e:
+                                        logger.info("Cannot pipeline download of all.zip for {}: {}".format(self, str(e)))
+
+                                if total_size is not None:
+                                    logger.info("Downloading and extracting all.zip for {}".format(self))
+
+                                    try:
+                                        cogeo_results = self.download_and_extract_assets(total_size, fetch_range,
+                                                                                         progress_callback=lambda p: callback(p * 100))
+                                        self.extract_assets_and_complete(extract=False, cogeo_results=cogeo_results)
+                                        extracted = True
+                                    except zipfile.BadZipFile as e:
+                                        logger.warning("Cannot download and extract all.zip for {} ({}). Retrying...".format(self, str(e)))
+                                        retry_num += 1
+                                        if os.path.exists(all_zip_path):
+                                            os.remove(all_zip_path)
+                                    continue
+
                                 logger.info("Downloading all.zip for {}".format(self))
 
                                 # Download all assets
                                 zip_path = self.processing_node.download_task_assets(self.uuid, assets_dir, progress_callback=callback, parallel_downloads=max(1, int(16 / (2 ** retry_num))))
 
                                 # Rename to all.zip
-                                all_zip_path = self.assets_path("all.zip")
                                 os.rename(zip_path, all_zip_path)
 
                                 logger.info("Extracting all.zip for {}".format(self))
 
                                 try:
-                                    self.extract_assets_and_complete()
+                                    self.extract_assets_and_complete(progress_start=self.TASK_PROGRESS_LAST_VALUE + 0.1,
+                                                                     fetch_range=fetch_range)
                                     extracted = True
                                 except zipfile.BadZipFile:
                                     if retry_num < 5:
@@ -1126,7 +1333,13 @@ class Task(models.Model):
 
                     else:
                         # Still waiting...
-                        self.save()
+                        if settings.TASK_EVENTS and (self.status, self.last_error) == previous_status and \
+                            timezone.now() - self.updated_at < timedelta(seconds=settings.TASK_PROGRESS_DB_INTERVAL):
+                            # Only the progress changed, clients receive it from events
+                            # and the database is updated at the next interval
+                            self.report_progress(False, processing_time=self.processing_time, running_progress=self.running_progress)
+                        else:
+                            self.save()
 
         except (NodeServerError, NodeResponseError) as e:
             self.set_failure(str(e))
@@ -1138,22 +1351,97 @@ class Task(models.Model):
 
         logger.debug("Task %s completed process() cycle", self.id)
 
-    def extract_assets_and_complete(self):
+    def update_from_task_info(self, info):
+        """
+        Updates status, progress and console output (does not save)
+        :param info: TaskInfo retrieved from the processing node
+        """
+        self.processing_time = info.processing_time
+        self.status = info.status.value
+
+        if len(info.output) > 0:
+            self.console += "\n".join(info.output) + '\n'
+
+        # Update running progress
+        self.running_progress = (info.progress / 100.0) * self.TASK_PROGRESS_LAST_VALUE
+
+        if info.last_error != "":
+            self.last_error = info.last_error
+
+    def download_and_extract_assets(self, total_size, fetch_range, progress_callback=None):
+        """
+        Downloads assets/all.zip from the processing node by byte ranges, extracting
+        members and converting rasters to COGs while the download is still in progress
+        It will raise a zipfile.BadZipFile exception if the archive is corrupted.
+        :param total_size: size of all.zip
+        :param fetch_range: function(start, end) to download a range of bytes of all.zip
+        :param progress_callback: optional function(progress) with download progress from 0 to 1
+        :return: list of assure_cogeos results for the rasters that were optimized
+        """
+        raster_paths = set([raster_path for raster_path, _ in self.get_extent_fields()])
+        cogeo_results = []
+
+        cogeo_bytes = 0
+
+        # Called from the extraction threads: rasters are converted one at a time,
+        # so that the threads share a single CPU budget instead of one each
+        cogeo_lock = threading.Lock()
+
+        def member_callback(path):
+            nonlocal cogeo_bytes
+
+            path = os.path.realpath(path)
+            if path in raster_paths:
+                with cogeo_lock:
+                    size = os.path.getsize(path)
+                    cogeo_results.extend(assure_cogeos([path], settings.COGEO_CPU_BUDGET))
+                    cogeo_bytes += os.path.getsize(path) - size
+
+        extracted_bytes = download_and_extract_zip(fetch_range, total_size, self.assets_path("all.zip"), self.assets_path(""),
+                                                   max_workers=settings.WORKERS_MAX_THREADS, progress_callback=progress_callback,
+                                                   member_callback=member_callback)
+        self.add_size(extracted_bytes + cogeo_bytes)
+        logger.info("Downloaded and extracted all.zip for {}".format(self))
+
+        return cogeo_results
+
+    def extract_assets_and_complete(self, progress_start=None, fetch_range=None, extract=True, cogeo_results=None):
         """
         Extracts assets/all.zip, populates task fields where required and assure COGs
         It will raise a zipfile.BadZipFile exception is the archive is corrupted.
+        :param progress_start: if set, extraction progress is reported in running_progress from this value
+        :param fetch_range: optional function(start, end) to download again the bytes of corrupted members
+        :param extract: whether all.zip needs to be extracted (False if it has already been extracted)
+        :param cogeo_results: assure_cogeos results for rasters that have already been optimized
         :return:
         """
+        if cogeo_results is None:
+            cogeo_results = []
+
         assets_dir = self.assets_path("")
         zip_path = self.assets_path("all.zip")
 
-        # Extract from zip
-        with zipfile.ZipFile(zip_path, "r") as zip_h:
-            zip_h.extractall(assets_dir)
+        if extract:
+            throttle = ProgressThrottle()
 
-        logger.info("Extracted all.zip for {}".format(self))
-        
-        os.remove(zip_path)
+            def callback(progress):
+                if progress_start is None:
+                    return
+
+                publish, write = throttle.check(final=progress >= 1)
+                if publish or write:
+                    self.report_progress(write, running_progress=(
+                        progress_start + progress * (1.0 - progress_start) * 0.5))
+
+            # Extract from zip
+            extracted_bytes = extract_zip(zip_path, assets_dir, max_workers=settings.WORKERS_MAX_THREADS,
+                                          progress_callback=callback, fetch_range=fetch_range)
+            self.add_size(extracted_bytes)
+
+            logger.info("Extracted all.zip for {}".format(self))
+
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
 
         # Check if this looks like a backup file, in which case we need to move the files
         # a directory level higher
@@ -1182,18 +1470,28 @@ class Task(models.Model):
                     shutil.rmtree(top_level[0])
 
 
-        # Populate *_extent fields
         extent_fields = self.get_extent_fields()
 
+        # Make sure these are Cloud Optimized GeoTIFFs
+        # if not, they will be created (concurrently)
+        optimized = set([raster_path for raster_path, _, _, _ in cogeo_results])
+        raster_sizes = dict([(raster_path, os.path.getsize(raster_path)) for raster_path, _ in extent_fields
+                             if os.path.exists(raster_path) and not raster_path in optimized])
+        cogeo_results = cogeo_results + assure_cogeos(list(raster_sizes.keys()), settings.COGEO_CPU_BUDGET)
+        self.add_size(sum([os.path.getsize(raster_path) - size for raster_path, size in raster_sizes.items()
+                           if os.path.exists(raster_path)]))
+        for raster_path, converted, elapsed, error in cogeo_results:
+            params = {'file': os.path.basename(raster_path), 'seconds': round(elapsed, 2)}
+            if error is not None:
+                logger.warning("Cannot create Cloud Optimized GeoTIFF for %s (%s). This will result in degraded visualization performance." % (raster_path, str(error)))
+            elif converted:
+                self.console += gettext("Converted %(file)s to Cloud Optimized GeoTIFF in %(seconds)ss") % params + "\n"
+            else:
+                self.console += gettext("Validated %(file)s as Cloud Optimized GeoTIFF in %(seconds)ss") % params + "\n"
+
+        # Populate *_extent fields
         for raster_path, field in extent_fields:
             if os.path.exists(raster_path):
-                # Make sure this is a Cloud Optimized GeoTIFF
-                # if not, it will be created
-                try:
-                    assure_cogeo(raster_path)
-                except IOError as e:
-                    logger.warning("Cannot create Cloud Optimized GeoTIFF for %s (%s). This will result in degraded visualization performance." % (raster_path, str(e)))
-
                 # Read extent and SRID
                 raster = GDALRaster(raster_path)
                 extent = OGRGeometry.from_bbox(raster.extent)
@@ -1221,10 +1519,15 @@ class Task(models.Model):
         self.update_available_assets_field()
         self.update_epsg_field()
         self.update_orthophoto_bands_field()
-        self.update_size()
+        self.update_statistics_field()
+        if is_backup:
+            # Files were moved around, recompute
+            self.update_size()
         self.clear_task_assets_cache()
+        precompute_raster_statistics(self)
         self.potree_scene = {}
         self.running_progress = 1.0
+        self.tile_seed_progress = 0.0
         self.crop = None
         self.status = status_codes.COMPLETED
 
@@ -1244,6 +1547,10 @@ class Task(models.Model):
         from app.plugins import signals as plugin_signals
         plugin_signals.task_completed.send_robust(sender=self.__class__, task_id=self.id)
 
+        if settings.TILE_SEED_ZOOM_LEVELS > 0 and tile_cache_enabled():
+            from worker import tasks as worker_tasks
+            worker_tasks.seed_tiles.delay(self.id)
+
     def get_extent_fields(self):
         return [
             (os.path.realpath(self.assets_path("odm_orthophoto", "odm_orthophoto.tif")),
@@ -1264,41 +1571,85 @@ class Task(models.Model):
         return self.assets_path("{}_tiles".format(tile_type), z, x, "{}.png".format(y))
 
     def get_tile_base_url(self, tile_type):
-        # plant is just a special case of orthophoto
-        if tile_type == 'plant':
-            tile_type = 'orthophoto'
-
-        return "/api/projects/{}/tasks/{}/{}/".format(self.project.id, self.id, tile_type)
+        return tile_base_url(self.project_id, self.id, tile_type)
 
     def get_map_items(self):
+        return Task.map_item_from_values({
+            'id': self.id,
+            'name': self.name,
+            'project_id': self.project_id,
+            'public': self.public,
+            'public_edit': self.public_edit,
+            'epsg': self.epsg,
+            'orthophoto_bands': self.orthophoto_bands,
+            'available_assets': self.available_assets,
+            'has_crop': self.crop is not None,
+            'extent': self.get_extent(),
+        })
+
+    @staticmethod
+    def map_items_values(queryset):
+        """
+        Select the values needed to build the map items of the tasks in a queryset
+        (completed tasks with at least one extent), computing extents in the database
+        :return: values queryset to pass to Task.map_item_from_values
+        """
+        extent = Coalesce('orthophoto_extent', 'dsm_extent', 'dtm_extent')
+        return queryset.filter(
+                    status=status_codes.COMPLETED
+                ).filter(Q(orthophoto_extent__isnull=False) | Q(dsm_extent__isnull=False) | Q(dtm_extent__isnull=False)
+                ).annotate(
+                    xmin=Func(extent, function='ST_XMin', output_field=models.FloatField()),
+                    ymin=Func(extent, function='ST_YMin', output_field=models.FloatField()),
+                    xmax=Func(extent, function='ST_XMax', output_field=models.FloatField()),
+                    ymax=Func(extent, function='ST_YMax', output_field=models.FloatField()),
+                    has_crop=ExpressionWrapper(Q(crop__isnull=False), output_field=models.BooleanField())
+                ).order_by('-created_at').values('id', 'name', 'project_id', 'public', 'public_edit', 'epsg',
+                                                 'orthophoto_bands', 'available_assets', 'has_crop',
+                                                 'xmin', 'ymin', 'xmax', 'ymax')
+
+    @staticmethod
+    def map_item_from_values(values):
+        """
+        :param values: dict with a task's values (see Task.map_items_values)
+        :return: map item of the task
+        """
+        available_assets = values['available_assets']
+        project_id = values['project_id']
+        task_id = values['id']
+
         types = []
-        if 'orthophoto.tif' in self.available_assets: 
+        if 'orthophoto.tif' in available_assets:
             types.append('orthophoto')
             types.append('plant')
-        if 'dsm.tif' in self.available_assets: types.append('dsm')
-        if 'dtm.tif' in self.available_assets: types.append('dtm')
+        if 'dsm.tif' in available_assets: types.append('dsm')
+        if 'dtm.tif' in available_assets: types.append('dtm')
 
         camera_shots = ''
-        if 'shots.geojson' in self.available_assets: camera_shots = '/api/projects/{}/tasks/{}/download/shots.geojson'.format(self.project.id, self.id)
+        if 'shots.geojson' in available_assets: camera_shots = '/api/projects/{}/tasks/{}/download/shots.geojson'.format(project_id, task_id)
 
         ground_control_points = ''
-        if 'ground_control_points.geojson' in self.available_assets: ground_control_points = '/api/projects/{}/tasks/{}/download/ground_control_points.geojson'.format(self.project.id, self.id)
+        if 'ground_control_points.geojson' in available_assets: ground_control_points = '/api/projects/{}/tasks/{}/download/ground_control_points.geojson'.format(project_id, task_id)
+
+        extent = values.get('extent')
+        if extent is None and values.get('xmin') is not None:
+            extent = (values['xmin'], values['ymin'], values['xmax'], values['ymax'])
 
         return {
-            'tiles': [{'url': self.get_tile_base_url(t), 'type': t} for t in types],
+            'tiles': [{'url': tile_base_url(project_id, task_id, t), 'type': t} for t in types],
             'meta': {
                 'task': {
-                    'id': str(self.id),
-                    'name': self.name,
-                    'project': self.project.id,
-                    'public': self.public,
-                    'public_edit': self.public_edit,
+                    'id': str(task_id),
+                    'name': values['name'],
+                    'project': project_id,
+                    'public': values['public'],
+                    'public_edit': values['public_edit'],
                     'camera_shots': camera_shots,
                     'ground_control_points': ground_control_points,
-                    'epsg': self.epsg,
-                    'orthophoto_bands': self.orthophoto_bands,
-                    'crop': self.crop is not None,
-                    'extent': self.get_extent(),
+                    'epsg': values['epsg'],
+                    'orthophoto_bands': values['orthophoto_bands'],
+                    'crop': values['has_crop'],
+                    'extent': extent,
                 }
             }
         }
@@ -1410,6 +1761,8 @@ class Task(models.Model):
         self.clear_task_assets_cache()
 
         super(Task, self).delete(using, keep_parents)
+        key = map_items_cache_key(self.project_id)
+        transaction.on_commit(lambda: cache.delete(key))
 
         # Remove files related to this task
         try:
@@ -1417,7 +1770,7 @@ class Task(models.Model):
         except FileNotFoundError as e:
             logger.warning(e)
 
-        self.project.owner.profile.clear_used_quota_cache()
+        self.clear_used_quota_cache()
 
         plugin_signals.task_removed.send_robust(sender=self.__class__, task_id=task_id)
 
@@ -1425,14 +1778,18 @@ class Task(models.Model):
         # Remove all images
         images_path = self.task_path()
         images = [os.path.join(images_path, i) for i in self.scan_images()]
+        freed_bytes = 0
         for im in images:
             try:
+                size = os.path.getsize(im)
                 os.unlink(im)
+                freed_bytes += size
             except Exception as e:
                 logger.warning(e)
 
+        self.add_size(-freed_bytes)
         self.compacted = True
-        self.update_size(commit=True)
+        self.save()
 
     def check_public_edit(self):
         """
@@ -1456,6 +1813,16 @@ class Task(models.Model):
         return [os.path.join(directory, f) for f in os.listdir(directory) if
                        re.match(regex, f, re.IGNORECASE)]
 
+    def report_progress(self, commit=True, **fields):
+        """
+        Publish progress fields to the clients listening for this task's events
+        :param commit: also write the fields to the database
+        """
+        if commit:
+            fields['updated_at'] = timezone.now()
+            Task.objects.filter(pk=self.id).update(**fields)
+        task_events.publish(self.id, fields)
+
     def check_if_canceled(self):
         # Check if task has been canceled/removed
         if Task.objects.only("pending_action").get(pk=self.id).pending_action in [pending_actions.CANCEL,
@@ -1478,26 +1845,28 @@ class Task(models.Model):
         plugin_signals.task_resizing_images.send_robust(sender=self.__class__, task_id=self.id)
 
         images_path = self.find_all_files_matching(r'.*\.(jpe?g|tiff?)$')
+        images_bytes = sum([os.path.getsize(p) for p in images_path])
         total_images = len(images_path)
         resized_images_count = 0
-        last_update = 0
+        throttle = ProgressThrottle()
 
         def callback(retval=None):
-            nonlocal last_update
             nonlocal resized_images_count
             nonlocal total_images
 
             resized_images_count += 1
-            if time.time() - last_update >= 2:
+            publish, write = throttle.check()
+            if publish or write:
                 # Update progress
-                Task.objects.filter(pk=self.id).update(resize_progress=(float(resized_images_count) / float(total_images)))
+                self.report_progress(write, resize_progress=(float(resized_images_count) / float(total_images)))
                 self.check_if_canceled()
-                last_update = time.time()
 
-        resized_images = [im for im in list(map(partial(resize_image, resize_to=self.resize_to, done=callback), images_path)) 
+        max_workers = max(1, min(settings.WORKERS_MAX_THREADS, os.cpu_count() or 1))
+        resized_images = [im for im in resize_images_parallel(images_path, self.resize_to, callback, max_workers)
                           if im is not None]
-        
-        Task.objects.filter(pk=self.id).update(resize_progress=1.0)
+
+        self.report_progress(resize_progress=1.0)
+        self.add_size(sum([os.path.getsize(p) for p in images_path if os.path.exists(p)]) - images_bytes)
 
         return resized_images
 
@@ -1567,10 +1936,7 @@ class Task(models.Model):
             os.unlink(dst_file)
 
         if os.path.exists(alignment_file):
-            try:
-                os.link(alignment_file, dst_file)
-            except:
-                shutil.copy(alignment_file, dst_file)
+            clone_file(alignment_file, dst_file)
         else:
             logger.warn("Cannot set alignment file for {}, {} does not exist".format(self, alignment_file))
     
@@ -1581,6 +1947,7 @@ class Task(models.Model):
 
     def handle_images_upload(self, files, chunk_info=None):
         uploaded = {}
+        delta_bytes = 0
         for file in files:
             name = file.name
             if name is None:
@@ -1590,51 +1957,66 @@ class Task(models.Model):
             if not os.path.exists(tp):
                 os.makedirs(tp, exist_ok=True)
 
+            upload = None
             if chunk_info is not None:
-                if os.path.isfile(chunk_info['tmp_upload_file']) and chunk_info['chunk_index'] == 0:
-                    os.unlink(chunk_info['tmp_upload_file'])
-                
-                with open(chunk_info['tmp_upload_file'], 'ab') as fd:
-                    fd.seek(chunk_info['byte_offset'])
-                    if isinstance(file, InMemoryUploadedFile):
-                        for chunk in file.chunks():
-                            fd.write(chunk)
-                    else:
-                        with open(file.temporary_file_path(), 'rb') as f:
-                            shutil.copyfileobj(f, fd)
-                
-                if chunk_info['chunk_index'] + 1 < chunk_info['total_chunk_count']:
-                    continue # will wait for next chunk
+                # Chunks are written at their offset, in any order
+                upload = ChunkedUpload(settings.FILE_UPLOAD_TEMP_DIR, chunk_info['uuid'])
+                if not upload.write_chunk(file, chunk_info['byte_offset'],
+                                          chunk_index=chunk_info['chunk_index'],
+                                          total_chunk_count=chunk_info['total_chunk_count'],
+                                          total_size=chunk_info.get('total_size')):
+                    continue # will wait for other chunks
 
             dst_path = self.get_image_path(name)
+            if os.path.isfile(dst_path):
+                # Overwriting
+                delta_bytes -= os.path.getsize(dst_path)
 
-            if chunk_info is not None:
-                if chunk_info['tmp_upload_file'] is not None and os.path.isfile(chunk_info['tmp_upload_file']):
-                    shutil.move(chunk_info['tmp_upload_file'], dst_path)
+            if upload is not None:
+                upload.finish(dst_path)
             else:
-                with open(dst_path, 'wb+') as fd:
-                    if isinstance(file, InMemoryUploadedFile):
-                        for chunk in file.chunks():
-                            fd.write(chunk)
-                    else:
-                        with open(file.temporary_file_path(), 'rb') as f:
-                            shutil.copyfileobj(f, fd)
+                save_uploaded_file(file, dst_path)
             
             uploaded[name] = os.path.getsize(dst_path)
+            delta_bytes += uploaded[name]
+
+        self.add_size(delta_bytes)
         return uploaded
 
+    def add_size(self, delta_bytes):
+        """
+        Incrementally update the size of the task after
+        adding (or removing, if negative) files from its directory
+        :param delta_bytes: number of bytes added
+        """
+        if delta_bytes == 0 or self.id is None:
+            return
+
+        Task.objects.filter(pk=self.id).update(size=Greatest(F('size') + (delta_bytes / 1024 / 1024), 0.0))
+
+        # Defer the field, so that the new size is only loaded if it's read
+        # and saves of this instance don't overwrite it
+        self.__dict__.pop('size', None)
+
+        self.clear_used_quota_cache()
+
+    def clear_used_quota_cache(self):
+        # Without loading the owner and their profile
+        from app.models.profile import clear_used_quota_cache
+        clear_used_quota_cache(self.project.owner_id)
+
     def update_size(self, commit=False):
+        """
+        Recompute the size of the task by walking its directory. This is slow for
+        tasks with many files, prefer add_size. Sizes are periodically reconciled
+        with this method by a background job (see worker.tasks.reconcile_task_sizes)
+        """
         try:
-            total_bytes = 0
-            for dirpath, _, filenames in os.walk(self.task_path()):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    if not os.path.islink(fp):
-                        total_bytes += os.path.getsize(fp)
-            self.size = (total_bytes / 1024 / 1024)
-            if commit: self.save()
-
-            self.project.owner.profile.clear_used_quota_cache()
+            self.size = (directory_size(self.task_path()) / 1024 / 1024)
+            if commit:
+                Task.objects.filter(pk=self.id).update(size=self.size)
+
+            self.clear_used_quota_cache()
         except Exception as e:
             logger.warn("Cannot update size for task {}: {}".format(self, str(e)))
 
@@ -1643,7 +2025,23 @@ class Task(models.Model):
         if self.id is None:
             return None
         return os.path.join(settings.MEDIA_CACHE, "task_assets", str(self.id))
-    
+
+    def get_tile_cache(self):
+        """
+        Rendered tiles are stored within the task assets cache,
+        so that clearing the assets cache also invalidates them
+        """
+        d = self.get_task_assets_cache()
+        if d is None:
+            return None
+        return os.path.join(d, "tiles")
+
+    def get_raster_statistics_cache(self):
+        d = self.get_task_assets_cache()
+        if d is None:
+            return None
+        return os.path.join(d, "statistics")
+
     def clear_task_assets_cache(self):
         d = self.get_task_assets_cache()
         if d is None:
@@ -0,0 +1,203 @@
+import os
+import json
+import math
+import numbers
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from rasterio.crs import CRS
+from rio_tiler.models import BandStatistics
+from rio_tiler.utils import get_array_statistics
+from app.reader_pool import cog_reader
+
+logger = logging.getLogger('app.logger')
+
+PERCENTILES = [2.0, 98.0]
+
+def make_json_safe(value):
+    if isinstance(value, CRS):
+        return value.to_string() or value.to_epsg() or value.to_wkt()
+    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
+        float_value = float(value)
+        if not math.isfinite(float_value):
+            return None
+        return float_value
+    if isinstance(value, dict):
+        return {k: make_json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [make_json_safe(v) for v in value]
+    return value
+
+
+def serialize_model(model):
+    if hasattr(model, "model_dump"):
+        return make_json_safe(model.model_dump())
+    if hasattr(model, "dict"):
+        return make_json_safe(model.dict())
+    if hasattr(model, "json"):
+        return make_json_safe(json.loads(model.json()))
+    return make_json_safe(model)
+
+
+def _ensure_percentiles(stat_dict):
+    stat = dict(stat_dict)
+    percentile_keys = [
+        key for key in stat.keys() if isinstance(key, str) and key.startswith("percentile_")
+    ]
+    if percentile_keys and "percentiles" not in stat:
+        percentile_keys.sort(key=lambda key: float(key.split("_")[1]))
+        stat["percentiles"] = [stat[key] for key in percentile_keys]
+    return stat
+
+
+def normalize_band_name(name):
+    if isinstance(name, str) and name.startswith("b") and name[1:].isdigit():
+        return name[1:]
+    return name
+
+
+def compute_raster_statistics(src, tile_type, expr=None, hrange=None, vrt_options=None):
+    """
+    Compute per-band statistics (percentiles, histogram, min/max) of a raster
+    :param src: COGReader
+    :param tile_type: orthophoto|dsm|dtm
+    :param expr: optional band math expression
+    :param hrange: optional histogram range
+    :param vrt_options: optional VRT options (e.g. cutline)
+    :return: dict of band --> statistics
+    """
+    nodata = None
+    # Workaround for https://github.com/OpenDroneMap/WebODM/issues/894
+    if tile_type == 'orthophoto':
+        nodata = 0
+    histogram_options = {"bins": 255}
+    if hrange is not None:
+        histogram_options["range"] = hrange
+
+    if expr is not None:
+        image = src.preview(expression=expr, vrt_options=vrt_options)
+        data = image.array
+        if image.mask is not None:
+            mask = np.expand_dims(image.mask == 0, axis=0)
+            data = np.ma.array(
+                data,
+                mask=np.broadcast_to(mask, data.shape),
+            )
+        stats_list = get_array_statistics(
+            data,
+            percentiles=PERCENTILES,
+            **histogram_options,
+        )
+        stats = {
+            str(b + 1): _ensure_percentiles(
+                serialize_model(BandStatistics(**stats_list[b]))
+            )
+            for b in range(len(stats_list))
+        }
+    else:
+        stats = {}
+        statistics = src.statistics(
+            percentiles=PERCENTILES,
+            hist_options=histogram_options,
+            nodata=nodata,
+            vrt_options=vrt_options,
+        )
+        for band, stat in statistics.items():
+            stats[normalize_band_name(band)] = _ensure_percentiles(
+                serialize_model(stat)
+            )
+
+    return {
+        normalize_band_name(band): value for band, value in stats.items()
+    }
+
+
+def get_statistics_cache_key(raster_path, tile_type, expr=None, hrange=None, cutline=None):
+    try:
+        mtime = os.path.getmtime(raster_path)
+    except OSError:
+        mtime = None
+
+    payload = json.dumps({
+        'mtime': mtime,
+        'tile_type': tile_type,
+        'expr': expr,
+        'hrange': list(hrange) if hrange is not None else None,
+        'cutline': hashlib.sha1(cutline.encode('utf-8')).hexdigest() if cutline is not None else None,
+    }, sort_keys=True)
+
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        # numpy scalars
+        return value.item()
+    return str(value)
+
+
+def get_cached_statistics(cache_dir, key):
+    if cache_dir is None:
+        return None
+
+    p = os.path.join(cache_dir, "{}.json".format(key))
+    if not os.path.isfile(p):
+        return None
+
+    try:
+        with open(p, "r") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot read cached statistics {}: {}".format(p, str(e)))
+        return None
+
+
+def write_cached_statistics(cache_dir, key, stats):
+    if cache_dir is None:
+        return
+
+    p = os.path.join(cache_dir, "{}.json".format(key))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(stats, default=_json_default))
+        os.replace(tmp, p)
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot write cached statistics {}: {}".format(p, str(e)))
+
+
+def get_raster_statistics(src, raster_path, cache_dir, tile_type, expr=None, hrange=None, cutline=None):
+    """
+    Same as compute_raster_statistics, but reuses previously computed
+    results stored in cache_dir (if any)
+    """
+    key = get_statistics_cache_key(raster_path, tile_type, expr, hrange, cutline)
+    stats = get_cached_statistics(cache_dir, key)
+    if stats is not None:
+        return stats
+
+    vrt_options = {'cutline': cutline} if cutline is not None else None
+    stats = compute_raster_statistics(src, tile_type, expr, hrange, vrt_options)
+    write_cached_statistics(cache_dir, key, stats)
+
+    return stats
+
+
+def precompute_raster_statistics(task):
+    """
+    Compute and cache the default statistics (no formula, no crop)
+    of a task's orthophoto and elevation models
+    """
+    cache_dir = task.get_raster_statistics_cache()
+    for tile_type in ['orthophoto', 'dsm', 'dtm']:
+        raster_path = task.get_check_file_asset_path(tile_type + ".tif")
+        if raster_path is None:
+            continue
+
+        try:
+            with cog_reader(raster_path) as src:
+                get_raster_statistics(src, raster_path, cache_dir, tile_type)
+        except Exception as e:
+            logger.warning("Cannot precompute statistics for {} ({}): {}".format(task, tile_type, str(e)))
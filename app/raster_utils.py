@@ -7,15 +7,23 @@ import numpy as np
 import numexpr as ne
 import json
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.gis.geos import GEOSGeometry
-from rasterio.enums import ColorInterp
+from contextlib import ExitStack
+from rasterio.crs import CRS
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform
 from rasterio.windows import Window
 from rio_tiler.utils import has_alpha_band, linear_rescale
 from rio_tiler.colormap import cmap as colormap, apply_cmap
 from rio_tiler.errors import InvalidColorMapName
 from app.api.hsvblend import hsv_blend
 from app.api.hillshade import LightSource
-from rio_tiler.io import COGReader
+from app.reader_pool import cog_reader
+from app.geoutils import geom_transform_wkt_bbox
 from webodm import settings
 
 logger = logging.getLogger('app.logger')
@@ -72,22 +80,218 @@ def compute_subwindows(window, max_window_size, overlap_pixels=0):
 
     return windows
 
-def compute_block_aligned_subwindows(src, win):
-    subwins = []
-    for _, w in src.block_windows(1):
-        dst_w = Window(
-            w.col_off - win.col_off, 
-            w.row_off - win.row_off, 
-            w.width, 
-            w.height
-        )
-        subwins.append([w, dst_w])
-    
-    return subwins
-
 def padded_window(w, pad):
     return Window(w.col_off - pad, w.row_off - pad, w.width + pad * 2, w.height + pad * 2)
 
+def plan_subwindows(src, window, max_window_size):
+    """
+    Split window into subwindows that are aligned to the block layout of src,
+    so that each compressed block is decoded only once. Tiled rasters are split
+    in groups of whole blocks, striped rasters in groups of whole strips.
+    Falls back to compute_subwindows when blocks are larger than max_window_size.
+    """
+    block_h, block_w = src.block_shapes[0]
+    col_off = int(window.col_off)
+    row_off = int(window.row_off)
+    col_end = col_off + int(window.width)
+    row_end = row_off + int(window.height)
+
+    if block_w >= src.width and block_h <= max_window_size:
+        # Striped, read full rows
+        step_x = col_end - col_off
+        step_y = max(1, (max_window_size * max_window_size) // max(1, step_x) // block_h) * block_h
+    elif block_w <= max_window_size and block_h <= max_window_size:
+        step_x = (max_window_size // block_w) * block_w
+        step_y = (max_window_size // block_h) * block_h
+    else:
+        return compute_subwindows(window, max_window_size)
+
+    windows = []
+    for y in range(row_off, row_end, step_y):
+        for x in range(col_off, col_end, step_x):
+            w = Window(x, y, min(step_x, col_end - x), min(step_y, row_end - y))
+            dst_w = Window(x - col_off, y - row_off, w.width, w.height)
+            windows.append((w, dst_w))
+
+    return windows
+
+def read_boundless(src, window, fill_value, index=1):
+    """
+    Read a single band window which might extend past the edges of src,
+    filling the outside area with fill_value (WarpedVRTs do not support boundless reads)
+    """
+    out = np.full((int(window.height), int(window.width)), fill_value, dtype=src.dtypes[index - 1])
+    col_off = int(window.col_off)
+    row_off = int(window.row_off)
+    col_start = max(0, col_off)
+    row_start = max(0, row_off)
+    col_end = min(src.width, col_off + int(window.width))
+    row_end = min(src.height, row_off + int(window.height))
+
+    if col_end > col_start and row_end > row_start:
+        out[row_start - row_off:row_end - row_off, col_start - col_off:col_end - col_off] = \
+            src.read(index, window=Window(col_start, row_start, col_end - col_start, row_end - row_start))
+
+    return out
+
+def get_warp_options(src, epsg=None, crop=None, resampling='nearest'):
+    """
+    Compute the WarpedVRT options to reproject and/or crop a raster
+    :param src: rasterio dataset
+    :param epsg: target EPSG code, or None to keep the source CRS
+    :param crop: GEOSGeometry to crop to, or None
+    :param resampling: resampling method name
+    :return: dict of WarpedVRT options, or None if no warping is needed
+    """
+    if epsg is None and crop is None:
+        return None
+
+    window = Window(0, 0, src.width, src.height)
+    opts = {'resampling': Resampling[resampling]}
+
+    if crop is not None:
+        cutline, (minx, miny, maxx, maxy) = geom_transform_wkt_bbox(crop, src, bbox_crs="raster", wkt_crs="raster")
+        opts['cutline'] = cutline
+        window = Window(int(minx), int(miny), int(maxx - minx), int(maxy - miny)).intersection(window)
+
+    if epsg is not None:
+        left, bottom, right, top = src.window_bounds(window)
+        dst_crs = CRS.from_epsg(epsg)
+        transform, width, height = calculate_default_transform(src.crs, dst_crs,
+                                                               int(window.width), int(window.height),
+                                                               left, bottom, right, top)
+    else:
+        dst_crs = src.crs
+        transform = src.window_transform(window)
+        width, height = int(window.width), int(window.height)
+
+    opts.update(crs=dst_crs, transform=transform, width=width, height=height)
+    return opts
+
+def estimate_window_io(src, subwins, count=None, pad=0):
+    """
+    Estimate the number of bytes that need to be decompressed to read subwins
+    (assuming no block caching between windows) versus the number of bytes read
+    :param count: number of bands read (defaults to all). Blocks are decompressed
+        for all bands regardless (pixel interleaving)
+    :return: (decompressed bytes, output bytes)
+    """
+    block_h, block_w = src.block_shapes[0]
+    if count is None:
+        count = src.count
+    band_bytes = np.dtype(src.dtypes[0]).itemsize
+    pixel_bytes = band_bytes * src.count
+
+    decompressed = 0
+    output = 0
+    for w, _ in subwins:
+        output += int(w.width) * int(w.height) * band_bytes * count
+
+        rw = padded_window(w, pad) if pad > 0 else w
+        col_start = max(0, int(rw.col_off))
+        row_start = max(0, int(rw.row_off))
+        col_end = min(src.width, int(rw.col_off + rw.width))
+        row_end = min(src.height, int(rw.row_off + rw.height))
+        if col_end <= col_start or row_end <= row_start:
+            continue
+
+        blocks_x = (col_end - 1) // block_w - col_start // block_w + 1
+        blocks_y = (row_end - 1) // block_h - row_start // block_h + 1
+        decompressed += blocks_x * blocks_y * block_w * block_h * pixel_bytes
+
+    return decompressed, output
+
+class WindowReader:
+    """
+    Hands out a dataset handle to each thread processing windows.
+    Rasterio datasets cannot be shared across threads, so
+    worker threads open their own handle to the same file.
+    """
+    def __init__(self, src, path, max_workers=1, warp_options=None):
+        self.src = src
+        self.path = path
+        self.warp_options = warp_options
+        self.max_workers = max(1, int(max_workers or 1))
+        self.local = threading.local()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.max_workers == 1:
+            return self.src
+
+        ds = getattr(self.local, 'ds', None)
+        if ds is None:
+            ds = rasterio.open(self.path)
+            with self.lock:
+                self.opened.append(ds)
+
+            if self.warp_options is not None:
+                ds = WarpedVRT(ds, **self.warp_options)
+                with self.lock:
+                    self.opened.append(ds)
+
+            self.local.ds = ds
+        return ds
+
+    def close(self):
+        with self.lock:
+            for ds in reversed(self.opened):
+                ds.close()
+            self.opened = []
+
+def map_windows(func, subwins, max_workers=1, max_pending=None):
+    """
+    Apply func(w, dst_w) to each window, yielding (dst_w, result) pairs
+    in the same order as subwins. When max_workers > 1 windows are
+    processed by a thread pool, with at most max_pending results held in memory.
+    """
+    if max_workers <= 1:
+        for w, dst_w in subwins:
+            yield dst_w, func(w, dst_w)
+        return
+
+    if max_pending is None:
+        max_pending = max_workers * 2
+
+    pending = deque()
+    windows = iter(subwins)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for w, dst_w in windows:
+                pending.append((dst_w, executor.submit(func, w, dst_w)))
+                if len(pending) >= max_pending:
+                    break
+
+            while pending:
+                dst_w, future = pending.popleft()
+                result = future.result()
+
+                for w, next_dst_w in windows:
+                    pending.append((next_dst_w, executor.submit(func, w, next_dst_w)))
+                    break
+
+                yield dst_w, result
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def write_windows(dst, subwins, process_window, window_reader, p, progress_per_win):
+    """
+    Process windows (possibly in parallel) and write the results in order
+    :param process_window: function(w, dst_w) returning a list of (array, indexes) to write
+    """
+    num_wins = len(subwins)
+    try:
+        for idx, (dst_w, writes) in enumerate(map_windows(process_window, subwins, window_reader.max_workers)):
+            p(f"Processing tile {idx}/{num_wins}", progress_per_win)
+
+            for arr, indexes in writes:
+                dst.write(arr, indexes, window=dst_w)
+    finally:
+        window_reader.close()
+
 def export_raster(input, output, progress_callback=None, **opts):
     now = time.time()
 
@@ -122,28 +326,23 @@ def export_raster(input, output, progress_callback=None, **opts):
     if dem:
         resampling = 'bilinear'
 
-    if crop_wkt is not None:
-        crop = GEOSGeometry(crop_wkt)
-
-        crop_geojson = os.path.join(path_base, "crop.geojson")
-        raster_vrt = os.path.join(path_base, "raster.vrt")
+    # Crop areas are stored as lat/lon (WKT does not carry the SRID)
+    crop = GEOSGeometry(crop_wkt, srid=4326) if crop_wkt is not None else None
 
-        os.makedirs(os.path.dirname(crop_geojson), exist_ok=True)
-        with open(crop_geojson, "w", encoding="utf-8") as f:
-            f.write(crop.geojson)
+    with cog_reader(input) as ds_src, ExitStack() as stack:
+        reproject = ds_src.dataset.crs is not None and epsg is not None and ds_src.dataset.crs.to_epsg() != epsg
 
-        subprocess.check_output(["gdalwarp", "-cutline", crop_geojson,
-                '--config', 'GDALWARP_DENSIFY_CUTLINE', 'NO', 
-                '-crop_to_cutline', '-of', 'VRT', '-r', resampling,
-                 input, raster_vrt])
+        # Reprojection and cropping are applied on the fly
+        # while reading windows, without intermediate files
+        warp_options = get_warp_options(ds_src.dataset, epsg if reproject else None, crop, resampling)
+        if warp_options is not None:
+            src = stack.enter_context(WarpedVRT(ds_src.dataset, **warp_options))
+        else:
+            src = ds_src.dataset
 
-        input = raster_vrt
-    
-    with COGReader(input) as ds_src:
-        src = ds_src.dataset
         profile = src.meta.copy()
         win = Window(0, 0, src.width, src.height)
-            
+
         # Output format
         driver = "GTiff"
         compress = None
@@ -154,7 +353,7 @@ def export_raster(input, output, progress_callback=None, **opts):
         indexes = src.indexes
         output_raster = output
         jpg_background = 255 # white
-        reproject = src.crs is not None and epsg is not None and src.crs.to_epsg() != epsg
+        temp_bytes = 0
 
         # KMZ is special, we just export it as GeoTIFF
         # and then call GDAL to tile/package it
@@ -163,19 +362,6 @@ def export_raster(input, output, progress_callback=None, **opts):
             export_format = "gtiff-rgb"
             output_raster = path_base + ".kmz.tif"
 
-        # JPG and PNG are exported to GeoTIFF only if reprojection is needed
-        jpg = export_format == "jpg"
-        png = export_format == "png"
-        if reproject:
-            if jpg:
-                export_format = 'gtiff-rgb'
-                path_base, _ = os.path.splitext(output)
-                output_raster = path_base + ".jpg.tif"
-            if png:
-                export_format = 'gtiff-rgb'
-                path_base, _ = os.path.splitext(output)
-                output_raster = path_base + ".png.tif"
-
         if export_format == "jpg":
             driver = "JPEG"
             profile.update(quality=90)
@@ -192,9 +378,6 @@ def export_raster(input, output, progress_callback=None, **opts):
             profile.update(jpeg_quality=90)
             band_count = 4
             rgb = True
-            if jpg:
-                band_count = 3
-                with_alpha = False
         else:
             bigtiff = True
             compress = "DEFLATE"
@@ -203,11 +386,7 @@ def export_raster(input, output, progress_callback=None, **opts):
         if bigtiff:
             profile.update(BIGTIFF='IF_SAFER')
 
-        if reproject:
-            path_base, _ = os.path.splitext(output_raster)
-            output_raster = path_base + ".base.tif"
-
-        if compress is not None and not reproject:
+        if compress is not None:
             profile.update(compress=compress)
             profile.update(predictor=2 if compress == "DEFLATE" else 1)
 
@@ -220,6 +399,7 @@ def export_raster(input, output, progress_callback=None, **opts):
                 percentiles=[2.0, 98.0],
                 hist_options={"bins": 255},
                 nodata=nodata,
+                vrt_options={'cutline': warp_options['cutline']} if warp_options is not None and 'cutline' in warp_options else None,
             )
 
             band_stats = statistics.get("1")
@@ -249,8 +429,11 @@ def export_raster(input, output, progress_callback=None, **opts):
         if has_alpha_band(src):
             alpha_index = src.colorinterp.index(ColorInterp.alpha) + 1
         
-        subwins = compute_subwindows(win, window_size)
-        # subwins = compute_block_aligned_subwindows(src, win)
+        if warp_options is None:
+            subwins = plan_subwindows(src, win, window_size)
+        else:
+            # The blocks of a WarpedVRT don't match those of the source
+            subwins = compute_subwindows(win, window_size)
 
         if rgb and expression is None:
             # More than 4 bands?
@@ -277,6 +460,22 @@ def export_raster(input, output, progress_callback=None, **opts):
             except InvalidColorMapName:
                 logger.warning("Invalid colormap {}".format(color_map))
 
+        # Hillshading reads a padded window around each subwindow
+        pad = 16 if dem and rgb and cmap is not None else 0
+
+        if warp_options is None:
+            # Number of bands read for each window
+            if expression is not None:
+                read_count = len(set(re.findall(r"b(?P<bands>[0-9]{1,2})", expression))) + (1 if alpha_index is not None else 0)
+            elif dem:
+                read_count = 1 if rgb and cmap is not None else src.count
+            else:
+                read_count = len(indexes)
+
+            decompressed_bytes, output_bytes = estimate_window_io(src, subwins, pad=pad, count=read_count)
+            logger.info(f"Reading {len(subwins)} windows of {input}: ~{round(decompressed_bytes / 1024 / 1024, 2)} MB "
+                        f"decompressed for {round(output_bytes / 1024 / 1024, 2)} MB read")
+
 
         def process(arr, skip_rescale=False, skip_background=False, skip_type=False, mask=None, includes_alpha=True, drop_last_band=False):
             if not skip_rescale and rescale is not None:
@@ -318,10 +517,15 @@ def export_raster(input, output, progress_callback=None, **opts):
             profile.update(nodata=None)
 
         
-        post_perc = 20 if reproject or kmz else 0
+        post_perc = 20 if kmz else 0
         num_wins = len(subwins)
         progress_per_win = (100 - post_perc) / num_wins if num_wins > 0 else 0
 
+        # Windows are read and processed by a pool of workers
+        # and written back in order by this thread
+        max_workers = opts.get('max_workers', settings.WORKERS_MAX_THREADS)
+        window_reader = WindowReader(src, input, max_workers, warp_options)
+
         if expression is not None:
             # Apply band math
             if rgb:
@@ -336,101 +540,102 @@ def export_raster(input, output, progress_callback=None, **opts):
             if alpha_index is not None:
                 indexes += (alpha_index, )
 
+            def process_window(w, dst_w):
+                data = window_reader.get().read(indexes=indexes, window=w, out_dtype=np.float32)
+                arr = dict(zip(bands_names, data))
+                arr = np.array([np.nan_to_num(ne.evaluate(bloc.strip(), local_dict=arr)) for bloc in rgb_expr])
+
+                # Set nodata values
+                index_band = arr[0]
+                mask = None
+                if alpha_index is not None:
+                    # -1 is the last band = alpha
+                    mask = data[-1] != 0
+                    index_band[~mask] = -9999
+
+                # Remove infinity values
+                index_band[index_band>1e+30] = -9999
+                index_band[index_band<-1e+30] = -9999
+
+                # Make sure this is float32
+                arr = arr.astype(np.float32)
+
+                # Apply colormap?
+                if rgb and cmap is not None:
+                    rgb_data, _ = apply_cmap(process(arr, skip_background=True, includes_alpha=False), cmap)
+                    writes = [(process(rgb_data, skip_rescale=True, mask=mask, includes_alpha=False), (1,2,3))]
+
+                    if with_alpha:
+                        writes.append((mask.astype(np.uint8) * 255, 4))
+                    return writes
+                else:
+                    # Raw
+                    return [(process(arr), None)]
+
             with rasterio.open(output_raster, 'w', **profile) as dst:
-                for idx, (w, dst_w) in enumerate(subwins):
-                    p(f"Processing tile {idx}/{num_wins}", progress_per_win)
-
-                    data = src.read(indexes=indexes, window=w, out_dtype=np.float32)
-                    arr = dict(zip(bands_names, data))
-                    arr = np.array([np.nan_to_num(ne.evaluate(bloc.strip(), local_dict=arr)) for bloc in rgb_expr])
-
-                    # Set nodata values
-                    index_band = arr[0]
-                    mask = None
-                    if alpha_index is not None:
-                        # -1 is the last band = alpha
-                        mask = data[-1] != 0
-                        index_band[~mask] = -9999
-
-                    # Remove infinity values
-                    index_band[index_band>1e+30] = -9999
-                    index_band[index_band<-1e+30] = -9999
-
-                    # Make sure this is float32
-                    arr = arr.astype(np.float32)
-
-                    # Apply colormap?
-                    if rgb and cmap is not None:
-                        rgb_data, _ = apply_cmap(process(arr, skip_background=True, includes_alpha=False), cmap)
-                        dst.write(process(rgb_data, skip_rescale=True, mask=mask, includes_alpha=False), window=dst_w, indexes=(1,2,3))
-
-                        if with_alpha:
-                            dst.write(mask.astype(np.uint8) * 255, 4, window=dst_w)
-
-                        update_rgb_colorinterp(dst)
-                    else:
-                        # Raw
-                        dst.write(process(arr), window=dst_w) 
+                write_windows(dst, subwins, process_window, window_reader, p, progress_per_win)
+                if rgb and cmap is not None:
+                    update_rgb_colorinterp(dst)
         elif dem:
             # Apply hillshading, colormaps to elevation
+            # Hillshade is computed using the ground resolution of the source
+            # (reprojected pixels might be in degrees)
+            transform = ds_src.dataset.meta["transform"]
+
+            def process_window(w, dst_w):
+                # Apply colormap?
+                if rgb and cmap is not None:
+                    nodata = profile.get('nodata')
+                    if nodata is None:
+                        nodata = -9999
+
+                    win_h, win_w = int(w.height), int(w.width)
+                    elevation = read_boundless(window_reader.get(), padded_window(w, pad), nodata)
+
+                    elevation[0:pad, 0:pad] = nodata
+                    elevation[pad+win_h:pad*2+win_h, 0:pad] = nodata
+                    elevation[0:pad, pad+win_w:pad*2+win_w] = nodata
+                    elevation[pad+win_h:pad*2+win_h, pad+win_w:pad*2+win_w] = nodata
+
+                    mask = elevation != nodata
+                    intensity = None
+                    if hillshade is not None and hillshade > 0:
+                        delta_scale = ZOOM_EXTRA_LEVELS ** 2
+                        dx = transform[0] * delta_scale
+                        dy = transform[4] * delta_scale
+                        ls = LightSource(azdeg=315, altdeg=45)
+
+                        intensity = ls.hillshade(elevation, dx=dx, dy=dy, vert_exag=hillshade)
+                        intensity = intensity[pad:pad+win_h, pad:pad+win_w]
+                        intensity = intensity * 255.0
+
+                    rgb_data, _ = apply_cmap(process(elevation[pad:win_h+pad, pad:win_w+pad][np.newaxis,:], skip_background=True, includes_alpha=False), cmap)
+
+                    if intensity is not None:
+                        rgb_data = hsv_blend(rgb_data, intensity)
+
+                    mask = mask[pad:win_h+pad, pad:win_w+pad]
+                    writes = [(process(rgb_data, skip_rescale=True, mask=mask, includes_alpha=False), (1,2,3))]
+                    if with_alpha:
+                        writes.append((mask.astype(np.uint8) * 255, 4))
+                    return writes
+                else:
+                    # Raw
+                    arr = window_reader.get().read(window=w)[:1]
+                    return [(process(arr), None)]
+
             with rasterio.open(output_raster, 'w', **profile) as dst:
-                for idx, (w, dst_w) in enumerate(subwins):
-                    p(f"Processing tile {idx}/{num_wins}", progress_per_win)
-
-                    # Apply colormap?
-                    if rgb and cmap is not None:
-                        nodata = profile.get('nodata')
-                        if nodata is None:
-                            nodata = -9999
-
-                        pad = 16
-                        elevation = src.read(window=padded_window(w, pad), boundless=True, fill_value=nodata, out_shape=(
-                            1,
-                            window_size + pad * 2,
-                            window_size + pad * 2,
-                        ), resampling=rasterio.enums.Resampling.bilinear)[:1][0]
-
-                        elevation[0:pad, 0:pad] = nodata
-                        elevation[pad+window_size:pad*2+window_size, 0:pad] = nodata
-                        elevation[0:pad, pad+window_size:pad*2+window_size] = nodata
-                        elevation[pad+window_size:pad*2+window_size, pad+window_size:pad*2+window_size] = nodata
-
-                        mask = elevation != nodata
-
-                        intensity = None
-                        if hillshade is not None and hillshade > 0:
-                            delta_scale = ZOOM_EXTRA_LEVELS ** 2
-                            dx = src.meta["transform"][0] * delta_scale
-                            dy = src.meta["transform"][4] * delta_scale
-                            ls = LightSource(azdeg=315, altdeg=45)
-
-                            intensity = ls.hillshade(elevation, dx=dx, dy=dy, vert_exag=hillshade)
-                            intensity = intensity[pad:pad+window_size, pad:pad+window_size]
-                            intensity = intensity * 255.0
-
-                        rgb_data, _ = apply_cmap(process(elevation[pad:window_size+pad, pad:window_size+pad][np.newaxis,:], skip_background=True, includes_alpha=False), cmap)
-
-                        if intensity is not None:
-                            rgb_data = hsv_blend(rgb_data, intensity)
-                        
-                        mask = mask[pad:window_size+pad, pad:window_size+pad]
-                        dst.write(process(rgb_data, skip_rescale=True, mask=mask, includes_alpha=False), window=dst_w, indexes=(1,2,3))
-                        if with_alpha:
-                            dst.write(mask.astype(np.uint8) * 255, 4, window=dst_w)
-
-                        update_rgb_colorinterp(dst)
-                    else:
-                        # Raw
-                        arr = src.read(window=w)[:1]
-                        dst.write(process(arr), window=dst_w)
+                write_windows(dst, subwins, process_window, window_reader, p, progress_per_win)
+                if rgb and cmap is not None:
+                    update_rgb_colorinterp(dst)
         else:
             # Copy bands as-is
-            with rasterio.open(output_raster, 'w', **profile) as dst:
-                for idx, (w, dst_w) in enumerate(subwins):
-                    p(f"Processing tile {idx}/{num_wins}", progress_per_win)
+            def process_window(w, dst_w):
+                arr = window_reader.get().read(indexes=indexes, window=w)
+                return [(process(arr, drop_last_band=not with_alpha), None)]
 
-                    arr = src.read(indexes=indexes, window=w)
-                    dst.write(process(arr, drop_last_band=not with_alpha), window=dst_w)
+            with rasterio.open(output_raster, 'w', **profile) as dst:
+                write_windows(dst, subwins, process_window, window_reader, p, progress_per_win)
 
                 new_ci = [src.colorinterp[idx - 1] for idx in indexes]
                 if not with_alpha:
@@ -442,37 +647,11 @@ def export_raster(input, output, progress_callback=None, **opts):
             subprocess.check_output(["gdal_translate", "-of", "KMLSUPEROVERLAY", 
                                         "-co", "Name={}".format(name),
                                         "-co", "FORMAT=AUTO", output_raster, output])
-            p("Finalizing", post_perc)
-
-        elif reproject:
-            output_vrt = path_base + ".vrt"
-
-            subprocess.check_output(["gdalwarp", "-r", "near" if resampling == "nearest" else resampling, 
-                                    "-of", "VRT",
-                                    "-t_srs", f"EPSG:{epsg}",
-                                    output_raster, output_vrt])
-            gt_args = ["-r", resampling, "--config", "GDAL_CACHEMAX", "25%"]
-            if bigtiff and not jpg and not png:
-                gt_args += ["-co", "BIGTIFF=IF_SAFER", 
-                            "-co", "BLOCKXSIZE=512", 
-                            "-co", "BLOCKYSIZE=512", 
-                            "-co", "NUM_THREADS=%s" % settings.WORKERS_MAX_THREADS,]
-
-            if compress and not png:
-                if jpg:
-                    gt_args += ["-co", "QUALITY=90"]
-                else:
-                    gt_args += ["-co", f"COMPRESS={compress}", 
-                                "-co", "PREDICTOR=2"]
-
-            subprocess.check_output(["gdal_translate"] +  
-                                    gt_args +
-                                    [output_vrt, output])
-            
             if os.path.isfile(output_raster):
+                temp_bytes += os.path.getsize(output_raster)
                 os.unlink(output_raster)
-
             p("Finalizing", post_perc)
-            
-        logger.info(f"Exported {output} in {round(time.time() - now, 2)}s")
+
+        logger.info(f"Exported {output} in {round(time.time() - now, 2)}s "
+                    f"(peak temporary disk usage: {round(temp_bytes / 1024 / 1024, 2)} MB)")
         
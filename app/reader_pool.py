@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from rasterio.errors import RasterioError
+from rio_tiler.io import COGReader
+from webodm import settings
+
+logger = logging.getLogger('app.logger')
+
+class ReaderPool:
+    """
+    A bounded, thread-safe pool of open COGReader instances.
+    Opening a large GeoTIFF requires parsing its header, IFDs and overviews,
+    so we keep readers open and reuse them across requests.
+    Readers are keyed on (path, mtime), so that a raster that changes
+    on disk is never served from a stale handle. A reader is lent to
+    a single caller at a time, since datasets are not safe to share across threads.
+    """
+
+    def __init__(self, max_size=32, idle_timeout=300):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.idle = {} # (path, mtime) --> [(reader, last_used), ...]
+        self.open_count = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fork(self):
+        # Handles opened by a parent process must not be used
+        # (or closed) by forked workers
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.idle = {}
+            self.open_count = 0
+
+    def _close(self, reader):
+        try:
+            reader.close()
+        except Exception as e:
+            logger.warning("Cannot close reader: {}".format(str(e)))
+
+    def _evict(self, now, need_slot=False):
+        """
+        Close readers that have been idle for too long and, if need_slot is set,
+        the least recently used idle reader when the pool is full.
+        Must be called while holding the lock.
+        :return list of readers to close
+        """
+        to_close = []
+        for key in list(self.idle.keys()):
+            keep = []
+            for reader, last_used in self.idle[key]:
+                if now - last_used > self.idle_timeout:
+                    to_close.append(reader)
+                else:
+                    keep.append((reader, last_used))
+            if keep:
+                self.idle[key] = keep
+            else:
+                del self.idle[key]
+
+        if need_slot and self.open_count - len(to_close) >= self.max_size:
+            lru_key = None
+            lru_time = None
+            for key, entries in self.idle.items():
+                if lru_time is None or entries[0][1] < lru_time:
+                    lru_key = key
+                    lru_time = entries[0][1]
+            if lru_key is not None:
+                reader, _ = self.idle[lru_key].pop(0)
+                if not self.idle[lru_key]:
+                    del self.idle[lru_key]
+                to_close.append(reader)
+
+        self.open_count -= len(to_close)
+        return to_close
+
+    def acquire(self, path):
+        """
+        :return (key, reader, pooled) where pooled indicates
+            whether the reader must be returned to the pool with release()
+        """
+        key = (os.path.realpath(path), os.path.getmtime(path))
+        now = time.time()
+
+        with self.lock:
+            self._check_fork()
+            to_close = self._evict(now, need_slot=key not in self.idle)
+            reader = None
+
+            if key in self.idle:
+                reader, _ = self.idle[key].pop()
+                if not self.idle[key]:
+                    del self.idle[key]
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            pooled = reader is not None or self.open_count < self.max_size
+            if reader is None and pooled:
+                # Reserve a slot
+                self.open_count += 1
+
+        for r in to_close:
+            self._close(r)
+
+        if reader is None:
+            try:
+                reader = COGReader(path)
+            except:
+                if pooled:
+                    with self.lock:
+                        self.open_count -= 1
+                raise
+
+        return key, reader, pooled
+
+    def release(self, key, reader):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked while borrowed
+                self._close(reader)
+                return
+
+            self.idle.setdefault(key, []).append((reader, time.time()))
+
+    def discard(self, reader):
+        with self.lock:
+            if self.pid == os.getpid():
+                self.open_count -= 1
+        self._close(reader)
+
+    def clear(self):
+        with self.lock:
+            to_close = [reader for entries in self.idle.values() for reader, _ in entries]
+            self.open_count -= len(to_close)
+            self.idle = {}
+        for r in to_close:
+            self._close(r)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'open': self.open_count,
+                'idle': sum(len(e) for e in self.idle.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+pool = ReaderPool(max_size=settings.TILER_READER_POOL_SIZE,
+                  idle_timeout=settings.TILER_READER_IDLE_TIMEOUT)
+
+@contextmanager
+def cog_reader(path, pooled=True):
+    """
+    Drop-in replacement for "with COGReader(path) as src"
+    that reuses open readers from a process-wide pool
+    :param path: path to the raster
+    :param pooled: set to False to bypass the pool (e.g. for temporary files)
+    """
+    if not pooled or pool.max_size <= 0:
+        with COGReader(path) as src:
+            yield src
+        return
+
+    key, reader, in_pool = pool.acquire(path)
+    if not in_pool:
+        # Pool is exhausted, use a one-off reader
+        try:
+            yield reader
+        finally:
+            reader.close()
+        return
+
+    try:
+        yield reader
+    except RasterioError:
+        # The underlying dataset might be in an inconsistent state
+        pool.discard(reader)
+        raise
+    except:
+        pool.release(key, reader)
+        raise
+    else:
+        pool.release(key, reader)
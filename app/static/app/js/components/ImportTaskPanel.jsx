@@ -54,6 +54,7 @@ class ImportTaskPanel extends React.Component {
           timeout: 2147483647,
           chunking: true,
           chunkSize: 8000000, // 8MB,
+          parallelChunkUploads: true,
           retryChunks: true,
           retryChunksLimit: 20,
           headers: {
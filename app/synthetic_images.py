@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+import piexif
+from PIL import Image
+
+
+def write_synthetic_images(directory, count, width=5472, height=3648):
+    """
+    Write JPGs with EXIF tags, similar in size to those of a 20MP drone camera
+    :return: list of paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) % 256)], axis=-1).astype(np.uint8)
+    exif = piexif.dump({'0th': {piexif.ImageIFD.Make: b"WebODM", piexif.ImageIFD.Model: b"Benchmark"},
+                        'Exif': {piexif.ExifIFD.FocalLength: (88, 10)}})
+
+    paths = []
+    for i in range(count):
+        noise = np.random.randint(0, 32, base.shape, dtype=np.uint8)
+        path = os.path.join(directory, f"IMG_{i:04d}.JPG")
+        Image.fromarray(base + noise).save(path, quality=95, exif=exif)
+        paths.append(path)
+    return paths
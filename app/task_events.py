@@ -0,0 +1,96 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+from webodm import settings
+
+logger = logging.getLogger('app.logger')
+
+redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+# Fields included in task events (and returned by /api/tasks/updates)
+TASK_EVENT_FIELDS = ('id', 'status', 'pending_action', 'last_error', 'processing_time',
+                     'upload_progress', 'resize_progress', 'running_progress', 'tile_seed_progress', 'updated_at', )
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def version_to_datetime(version):
+    return EPOCH + timedelta(microseconds=version)
+
+
+def datetime_to_version(dt):
+    """
+    :return: integer version (microseconds since epoch) for a task's updated_at value
+    """
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def channel_name(task_id):
+    return "task_events_{}".format(task_id)
+
+
+def publish(task_id, data):
+    """
+    Publish an event with the status and/or progress of a task.
+    Events are best effort: errors are logged, but not raised.
+    :param data: dict with TASK_EVENT_FIELDS values (other keys are ignored)
+    :return: number of clients that received the event
+    """
+    if not settings.TASK_EVENTS:
+        return 0
+
+    event = {k: v for k, v in data.items() if k in TASK_EVENT_FIELDS}
+    event['id'] = str(task_id)
+    if isinstance(event.get('updated_at'), datetime):
+        event['updated_at'] = datetime_to_version(event['updated_at'])
+
+    try:
+        return redis_client.publish(channel_name(task_id), json.dumps(event))
+    except redis.exceptions.RedisError as e:
+        logger.warning("Cannot publish event for task {}: {}".format(task_id, str(e)))
+        return 0
+
+
+def subscribe(task_ids):
+    """
+    :return: redis PubSub receiving the events of the given tasks
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(*[channel_name(task_id) for task_id in task_ids])
+    return pubsub
+
+
+class ProgressThrottle:
+    """
+    Decides when a progress update should be published and when it should
+    be written to the database. When task events are enabled, the database
+    is written less often than events are published (clients receive events instead).
+    """
+    def __init__(self, publish_interval=None, db_interval=None, clock=time.time):
+        self.publish_interval = settings.TASK_PROGRESS_PUBLISH_INTERVAL if publish_interval is None else publish_interval
+        if db_interval is None:
+            db_interval = settings.TASK_PROGRESS_DB_INTERVAL if settings.TASK_EVENTS else self.publish_interval
+        self.db_interval = db_interval
+        self.clock = clock
+        self.last_publish = None
+        self.last_write = None
+
+    def check(self, final=False):
+        """
+        :param final: whether this is the last update, which is always published and written
+        :return: (publish, write) booleans
+        """
+        now = self.clock()
+        publish = final or self.last_publish is None or now - self.last_publish >= self.publish_interval
+        write = final or self.last_write is None or now - self.last_write >= self.db_interval
+
+        if publish:
+            self.last_publish = now
+        if write:
+            self.last_write = now
+
+        return publish, write
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from django import db
 from django.contrib.auth.models import User
@@ -85,3 +86,14 @@ class BootTransactionTestCase(TransactionTestCase):
     @classmethod
     def tearDownClass(cls):
         super(BootTransactionTestCase, cls).tearDownClass()
+
+
+class TempDirTestCase(TestCase):
+    '''
+    Provides a temporary directory (self.tmpdir) to each test,
+    which is removed when the test ends (even if it fails)
+    '''
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(rmtree, self.tmpdir)
@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import assign_perm
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.models import Project, Task
+from nodeodm.models import ProcessingNode
+from .classes import BootTestCase
+
+
+class TestApiQueryCounts(BootTestCase):
+    def count_queries(self, client, url):
+        # The first request caches values computed lazily (e.g. statistics)
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), res.data
+
+    def test_task_list(self):
+        client = APIClient()
+        client.login(username="testuser", password="test1234")
+
+        user = User.objects.get(username="testuser")
+        project = Project.objects.create(owner=user, name="test project")
+        pnodes = [ProcessingNode.objects.create(hostname="invalid-host-{}".format(i), port=11223,
+                                                available_options=[{'name': 'rerun-from', 'domain': ['', 'dataset', 'opensfm']}])
+                  for i in range(2)]
+
+        def add_tasks(count):
+            for i in range(count):
+                Task.objects.create(project=project, name="task {}".format(i), processing_node=pnodes[i % len(pnodes)])
+
+        url = "/api/projects/{}/tasks/".format(project.id)
+
+        add_tasks(3)
+        queries, data = self.count_queries(client, url)
+        self.assertEqual(len(data), 3)
+
+        add_tasks(6)
+        more_queries, data = self.count_queries(client, url)
+        self.assertEqual(len(data), 9)
+
+        # Number of queries does not depend on the number of tasks
+        self.assertEqual(queries, more_queries)
+
+        for t in data:
+            self.assertEqual(t['can_rerun_from'], ['', 'dataset', 'opensfm'])
+            self.assertTrue(t['processing_node_name'].startswith("invalid-host-"))
+
+    def test_project_list(self):
+        client = APIClient()
+        client.login(username="testuser", password="test1234")
+
+        user = User.objects.get(username="testuser")
+        other_user = User.objects.get(username="testuser2")
+
+        def add_projects(count):
+            for i in range(count):
+                project = Project.objects.create(owner=user, name="test project {}".format(i))
+                Task.objects.create(project=project, name="task")
+                Task.objects.create(project=project, name="task")
+
+                # Shared with read-only access
+                shared = Project.objects.create(owner=other_user, name="shared project {}".format(i))
+                assign_perm('view_project', user, shared)
+                Task.objects.create(project=shared, name="task")
+
+        add_projects(2)
+        queries, data = self.count_queries(client, "/api/projects/")
+
+        add_projects(4)
+        more_queries, more_data = self.count_queries(client, "/api/projects/")
+        self.assertEqual(len(more_data) - len(data), 8)
+
+        # Number of queries does not depend on the number of projects
+        self.assertEqual(queries, more_queries)
+
+        for p in more_data:
+            if p['name'].startswith("test project"):
+                self.assertEqual(len(p['tasks']), 2)
+                self.assertTrue(p['owned'])
+                self.assertEqual(set(p['permissions']), {'add', 'change', 'delete', 'view'})
+            elif p['name'].startswith("shared project"):
+                self.assertEqual(len(p['tasks']), 1)
+                self.assertFalse(p['owned'])
+                self.assertEqual(p['permissions'], ['view'])
+
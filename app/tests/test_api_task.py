@@ -31,6 +31,7 @@ from nodeodm import status_codes
 from nodeodm.models import ProcessingNode
 from guardian.shortcuts import assign_perm
 from app.testwatch import testWatch
+from app.tile_seed import seed_task_tiles, get_default_rescale
 from .utils import start_processing_node, clear_test_media_root, catch_signal
 
 # We need to test the task API in a TransactionTestCase because
@@ -182,6 +183,9 @@ class TestApiTask(BootTransactionTestCase):
             # Upload progress is 100%
             self.assertEqual(resized_task.upload_progress, 1.0)
 
+            # Upload state is cleared once the task is created on the node
+            self.assertEqual(resized_task.upload_state, {})
+
             # Upload progress callback has been called
             self.assertTrue(testWatch.get_calls_count("Task.process.callback") > 0)
 
@@ -256,8 +260,8 @@ class TestApiTask(BootTransactionTestCase):
             # Orthophoto bands field should be an empty list
             self.assertEqual(len(task.orthophoto_bands), 0)
 
-            # Size should be zero
-            self.assertEqual(task.size, 0)
+            # Size should account for the uploaded images
+            self.assertTrue(task.size > 0)
 
             # Crop should be none
             self.assertTrue(task.crop is None)
@@ -410,6 +414,41 @@ class TestApiTask(BootTransactionTestCase):
             res = client.get("/api/projects/{}/tasks/{}/assets/odm_orthophoto/odm_orthophoto.tif".format(project.id, task.id))
             self.assertTrue(res.status_code == status.HTTP_200_OK)
 
+            # Byte ranges and conditional requests are supported
+            asset_url = "/api/projects/{}/tasks/{}/assets/odm_orthophoto/odm_orthophoto.tif".format(project.id, task.id)
+            with open(task.assets_path("odm_orthophoto", "odm_orthophoto.tif"), "rb") as f:
+                orthophoto = f.read()
+            etag = res['ETag']
+            self.assertEqual(res['Accept-Ranges'], 'bytes')
+
+            res = client.get(asset_url, HTTP_RANGE="bytes=100-199")
+            self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(res['Content-Range'], "bytes 100-199/{}".format(len(orthophoto)))
+            self.assertEqual(b"".join(res.streaming_content), orthophoto[100:200])
+
+            res = client.get(asset_url, HTTP_RANGE="bytes=-10")
+            self.assertEqual(b"".join(res.streaming_content), orthophoto[-10:])
+
+            res = client.get(asset_url, HTTP_RANGE="bytes={}-".format(len(orthophoto)))
+            self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+            # Ranges are ignored if the file has changed
+            res = client.get(asset_url, HTTP_RANGE="bytes=100-199", HTTP_IF_RANGE='"outdated"')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            res = client.get(asset_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            # nginx can send the files
+            settings.DOWNLOAD_ACCEL_REDIRECT = '/_protected_media/'
+            try:
+                res = client.get(asset_url)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertEqual(res['X-Accel-Redirect'], '/_protected_media/' + os.path.relpath(os.path.realpath(task.assets_path("odm_orthophoto", "odm_orthophoto.tif")), os.path.realpath(settings.MEDIA_ROOT)))
+                self.assertEqual(len(res.content), 0)
+            finally:
+                settings.DOWNLOAD_ACCEL_REDIRECT = None
+
              # Orthophoto bands field should be populated
             self.assertEqual(len(task.orthophoto_bands), 4)
 
@@ -577,6 +616,17 @@ class TestApiTask(BootTransactionTestCase):
                 self.assertTrue('max' in metadata['statistics'][b])
                 self.assertTrue('min' in metadata['statistics'][b])
 
+            # Statistics were precomputed and cached at completion
+            stats_cache = task.get_raster_statistics_cache()
+            self.assertTrue(os.path.isdir(stats_cache))
+            cached_stats_count = len(os.listdir(stats_cache))
+            self.assertTrue(cached_stats_count > 0)
+
+            # Same request is served from the cache
+            res = client.get("/api/projects/{}/tasks/{}/orthophoto/metadata".format(project.id, task.id))
+            self.assertEqual(json.loads(res.content.decode("utf-8"))['statistics'], metadata['statistics'])
+            self.assertEqual(len(os.listdir(stats_cache)), cached_stats_count)
+
             # Metadata with invalid formula
             res = client.get("/api/projects/{}/tasks/{}/orthophoto/metadata?formula=INVALID".format(project.id, task.id))
             self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -675,7 +725,59 @@ class TestApiTask(BootTransactionTestCase):
                 with Image.open(io.BytesIO(res.content)) as i:
                     self.assertEqual(i.width, 512)
                     self.assertEqual(i.height, 512)
-            
+
+            # Rendered tiles are cached and can be revalidated
+            tile_url = "/api/projects/{}/tasks/{}/orthophoto/tiles/{}.png".format(project.id, task.id, tile_path['orthophoto'])
+            res = client.get(tile_url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue('ETag' in res)
+            self.assertTrue('must-revalidate' in res['Cache-Control'])
+            self.assertTrue(os.path.isdir(task.get_tile_cache()))
+            etag = res['ETag']
+            cached_content = res.content
+
+            res = client.get(tile_url)
+            self.assertEqual(res['ETag'], etag)
+            self.assertEqual(res.content, cached_content)
+
+            res = client.get(tile_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            # Different rendering parameters have different keys
+            res = client.get(tile_url + "?rescale=0,100")
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(res['ETag'], etag)
+
+            # Clearing the assets cache clears the tiles cache
+            task.clear_task_assets_cache()
+            self.assertFalse(os.path.isdir(task.get_tile_cache()))
+
+            # Tiles can be seeded in the background
+            rendered = seed_task_tiles(task, 1)
+            self.assertTrue(rendered > 0)
+            self.assertTrue(os.path.isdir(task.get_tile_cache()))
+
+            # Seeded tiles are not rendered again
+            self.assertEqual(seed_task_tiles(task, 1), 0)
+
+            # Seeding can be canceled
+            task.clear_task_assets_cache()
+            self.assertEqual(seed_task_tiles(task, 1, is_canceled=lambda: True), 0)
+
+            # Seeding progress is reported on the task
+            zoom_levels = settings.TILE_SEED_ZOOM_LEVELS
+            settings.TILE_SEED_ZOOM_LEVELS = 1
+            try:
+                worker.tasks.seed_tiles(task.id)
+            finally:
+                settings.TILE_SEED_ZOOM_LEVELS = zoom_levels
+            res = client.get("/api/projects/{}/tasks/{}/".format(project.id, task.id))
+            self.assertEqual(res.data['tile_seed_progress'], 1.0)
+
+            # Default rescale matches the one computed by the viewer
+            self.assertEqual(get_default_rescale({}), "-1,1")
+            self.assertEqual(get_default_rescale({'1': {'min': 0.0, 'max': 255.0}, '2': {'min': 1.5, 'max': 254.0}}), "1.5,254")
+
             # Cannot set invalid scene
             res = client.post("/api/projects/{}/tasks/{}/3d/scene".format(project.id, task.id), json.dumps({ "garbage": "" }), content_type="application/json")
             self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1145,6 +1247,14 @@ class TestApiTask(BootTransactionTestCase):
         # Directories have been created
         self.assertTrue(os.path.exists(new_task.task_path()))
 
+        # Images and assets are shared via hard links, console output is not
+        image = task.scan_images()[0]
+        self.assertTrue(os.path.samefile(task.task_path(image), new_task.task_path(image)))
+        self.assertTrue(os.path.samefile(task.assets_path(task.ASSETS_MAP['georeferenced_model.laz']), new_task.assets_path(task.ASSETS_MAP['georeferenced_model.laz'])))
+        self.assertFalse(os.path.samefile(task.data_path("console_output.txt"), new_task.data_path("console_output.txt")))
+        new_task.console += "Duplicated"
+        self.assertFalse(task.console.output().endswith("Duplicated"))
+
         # Can create task with align_to parameter
         res = client.post("/api/projects/{}/tasks/".format(project.id), {
             'images': [image1, image2],
@@ -1427,7 +1537,27 @@ class TestApiTask(BootTransactionTestCase):
             }, format="multipart")
             self.assertEqual(res.status_code, status.HTTP_200_OK)
             self.assertEqual(len(res.data['uploaded']), 0)
+            self.assertEqual(res.data['received'], [[0, chunk_1_size]])
             chunk_1.close()
+
+            # Chunks outside of the file are rejected
+            for offset, total_size in [(-1, image1_size), (chunk_1_size, chunk_1_size), (0, -1)]:
+                with open(chunk_2_path, 'rb') as chunk:
+                    res = client.post("/api/projects/{}/tasks/{}/upload/".format(project.id, task.id), {
+                        'images': [chunk],
+                        'dzuuid': 'abc-test-range',
+                        'dzchunkindex': 1,
+                        'dztotalchunkcount': 2,
+                        'dzchunkbyteoffset': offset,
+                        'dztotalfilesize': total_size
+                    }, format="multipart")
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            # Received ranges can be queried to resume uploads
+            res = client.get("/api/projects/{}/tasks/{}/upload/ranges/?dzuuid=abc-test".format(project.id, task.id))
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['ranges'], [[0, chunk_1_size]])
+            self.assertEqual(res.data['chunks'], [0])
                 
             res = client.post("/api/projects/{}/tasks/{}/upload/".format(project.id, task.id), {
                 'images': [chunk_2],
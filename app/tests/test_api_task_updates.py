@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.task_events import datetime_to_version
+from app.models import Project, Task
+from nodeodm import status_codes
+from .classes import BootTestCase
+
+
+class TestApiTaskUpdates(BootTestCase):
+    def test_task_updates(self):
+        client = APIClient()
+
+        user = User.objects.get(username="testuser")
+        other_user = User.objects.get(username="testuser2")
+        project = Project.objects.create(owner=user, name="test project")
+        other_project = Project.objects.create(owner=other_user, name="other project")
+
+        task = Task.objects.create(project=project, name="task")
+        old_task = Task.objects.create(project=project, name="old task")
+        other_task = Task.objects.create(project=other_project, name="other task")
+
+        # Changed long ago
+        Task.objects.filter(pk=old_task.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        url = "/api/tasks/updates?ids={}".format(",".join(map(str, [task.id, old_task.id, other_task.id])))
+
+        # Requires authentication
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.login(username="testuser", password="test1234")
+
+        # Invalid parameters
+        for bad_url in ["/api/tasks/updates", "/api/tasks/updates?ids=invalid", url + "&since=abc", url + "&since=-1"]:
+            res = client.get(bad_url)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Without a version, all accessible tasks are returned
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['id'] for t in res.data['tasks']], [str(old_task.id), str(task.id)])
+        self.assertEqual(set(res.data['tasks'][0].keys()), {'id', 'status', 'pending_action', 'last_error', 'processing_time',
+                                                            'upload_progress', 'resize_progress', 'running_progress', 'tile_seed_progress', 'updated_at'})
+        version = res.data['version']
+        task.refresh_from_db()
+        self.assertEqual(version, datetime_to_version(task.updated_at))
+
+        # Only recent changes are returned
+        res = client.get(url + "&since={}".format(version))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['id'] for t in res.data['tasks']], [str(task.id)])
+        self.assertEqual(res.data['version'], version)
+        etag = res['ETag']
+
+        # Nothing changed
+        res = client.get(url + "&since={}".format(version), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Saves and progress updates change the version
+        task.status = status_codes.RUNNING
+        task.save()
+        res = client.get(url + "&since={}".format(version), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tasks'][0]['status'], status_codes.RUNNING)
+        self.assertTrue(res.data['version'] > version)
+        self.assertNotEqual(res['ETag'], etag)
+        version = res.data['version']
+
+        Task.objects.filter(pk=old_task.id).update(running_progress=0.5, updated_at=timezone.now())
+        res = client.get(url + "&since={}".format(version))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tasks'][-1]['id'], str(old_task.id))
+        self.assertEqual(res.data['tasks'][-1]['running_progress'], 0.5)
+
+        # Tasks of other users are never returned
+        res = client.get("/api/tasks/updates?ids={}".format(other_task.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tasks'], [])
@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+
+from app.classes.chunked_upload import ChunkedUpload, save_uploaded_file
+from .classes import TempDirTestCase
+
+
+class TestChunkedUpload(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(100000)
+        self.chunk_size = 16000
+        self.offsets = list(range(0, len(self.data), self.chunk_size))
+
+    def chunk(self, offset, temporary=False):
+        data = self.data[offset:offset + self.chunk_size]
+        if temporary:
+            f = TemporaryUploadedFile("chunk", "application/octet-stream", len(data), None, dir=self.tmpdir)
+            f.write(data)
+            f.flush()
+            return f
+        return SimpleUploadedFile("chunk", data)
+
+    def write(self, upload, offset, total_size=None, temporary=False):
+        return upload.write_chunk(self.chunk(offset, temporary), offset,
+                                  chunk_index=self.offsets.index(offset),
+                                  total_chunk_count=len(self.offsets),
+                                  total_size=total_size)
+
+    def test_out_of_order(self):
+        upload = ChunkedUpload(self.tmpdir, "out-of-order")
+        order = list(reversed(self.offsets))
+
+        # Received ranges are tracked and merged
+        self.assertFalse(self.write(upload, order[0], len(self.data)))
+        self.assertEqual(os.path.getsize(upload.path), len(self.data))
+        self.assertFalse(self.write(upload, order[2], len(self.data), temporary=True))
+        self.assertEqual(upload.received()['ranges'], [[order[2], order[2] + self.chunk_size], [order[0], len(self.data)]])
+
+        # Chunks can be sent again (resume)
+        self.assertFalse(self.write(upload, order[2], len(self.data)))
+
+        completed = [self.write(upload, offset, len(self.data), temporary=i % 2 == 0) for i, offset in enumerate(order[1:])]
+        self.assertEqual(completed.count(True), 1)
+        self.assertEqual(upload.received()['ranges'], [[0, len(self.data)]])
+
+        dst_path = os.path.join(self.tmpdir, "out-of-order.bin")
+        upload.finish(dst_path)
+        with open(dst_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        for p in [upload.path, upload.state_path, upload.lock_path]:
+            self.assertFalse(os.path.exists(p))
+
+    def test_parallel(self):
+        for total_size in [len(self.data), None]:
+            upload = ChunkedUpload(self.tmpdir, "parallel")
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                completed = list(executor.map(lambda o: self.write(upload, o, total_size, temporary=True), self.offsets))
+
+            # Only one chunk completes the upload
+            self.assertEqual(completed.count(True), 1)
+
+            dst_path = os.path.join(self.tmpdir, "parallel.bin")
+            upload.finish(dst_path)
+            with open(dst_path, 'rb') as f:
+                self.assertEqual(f.read(), self.data)
+
+    def test_out_of_range(self):
+        upload = ChunkedUpload(self.tmpdir, "out-of-range")
+        last = self.offsets[-1]
+        for offset, total_size in [(-1, len(self.data)), (0, -1), (self.chunk_size, self.chunk_size), (last + 1, len(self.data))]:
+            with self.assertRaises(ValidationError):
+                upload.write_chunk(self.chunk(0), offset, total_size=total_size)
+        self.assertFalse(os.path.exists(upload.path))
+
+        # Checked against the known total size
+        self.assertFalse(self.write(upload, 0, len(self.data)))
+        with self.assertRaises(ValidationError):
+            upload.write_chunk(self.chunk(0), len(self.data))
+        self.assertEqual(os.path.getsize(upload.path), len(self.data))
+
+    def test_save_uploaded_file(self):
+        dst_path = os.path.join(self.tmpdir, "saved.bin")
+        for f in [self.chunk(0), self.chunk(0, temporary=True)]:
+            save_uploaded_file(f, dst_path)
+            with open(dst_path, 'rb') as fd:
+                self.assertEqual(fd.read(), self.data[:self.chunk_size])
@@ -0,0 +1,48 @@
+import os
+
+from app.clone import clone_tree, clone_file
+from app.models import Task
+from .classes import TempDirTestCase
+
+
+class TestClone(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.src = os.path.join(self.tmpdir, "src")
+        self.files = {
+            "DJI_0001.JPG": os.urandom(1000),
+            os.path.join("assets", "odm_orthophoto", "odm_orthophoto.tif"): os.urandom(2000),
+            os.path.join("assets", "task_output.txt"): b"output",
+            os.path.join("data", "console_output.txt"): b"console",
+        }
+        for name, data in self.files.items():
+            path = os.path.join(self.src, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+
+    def test_clone_tree(self):
+        dst = os.path.join(self.tmpdir, "cow")
+        stats = clone_tree(self.src, dst, link_filter=Task.is_immutable_file)
+
+        for name, data in self.files.items():
+            with open(os.path.join(dst, name), "rb") as f:
+                self.assertEqual(f.read(), data)
+
+        # Immutable files are hard linked, others are reflinked or copied
+        linked = [n for n in self.files if os.path.samefile(os.path.join(self.src, n), os.path.join(dst, n))]
+        self.assertEqual(sorted(linked), sorted(["DJI_0001.JPG", os.path.join("assets", "odm_orthophoto", "odm_orthophoto.tif")]))
+        self.assertEqual(stats['link'], 2)
+        self.assertEqual(stats['reflink'] + stats['copy'], 2)
+        if stats['reflink'] == 0:
+            self.assertEqual(stats['bytes_written'], len(b"output") + len(b"console"))
+
+        # Copy mode writes everything
+        stats = clone_tree(self.src, os.path.join(self.tmpdir, "copy"), mode='copy')
+        self.assertEqual(stats['copy'], len(self.files))
+        self.assertEqual(stats['bytes_written'], sum(len(d) for d in self.files.values()))
+
+        # Single files can be cloned without links
+        method, written = clone_file(os.path.join(self.src, "DJI_0001.JPG"), os.path.join(self.tmpdir, "single.JPG"), link=False)
+        self.assertTrue(method in ['reflink', 'copy'])
+        self.assertEqual(written, 0 if method == 'reflink' else 1000)
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from app.cogeo import has_cog_layout, valid_cogeo, assure_cogeos
+from .classes import TempDirTestCase
+
+
+class TestCogeo(TempDirTestCase):
+    def write_raster(self, name, driver='GTiff'):
+        path = os.path.join(self.tmpdir, name)
+        with rasterio.open(path, 'w', driver=driver, width=1024, height=1024, count=1,
+                           dtype=rasterio.float32, crs='EPSG:32615',
+                           transform=from_origin(576000, 4550000, 0.1, 0.1)) as dst:
+            dst.write(np.random.random((1024, 1024)).astype(np.float32), 1)
+        return path
+
+    def test_assure_cogeos(self):
+        cog = self.write_raster("cog.tif", driver='COG')
+        rasters = [self.write_raster("dsm.tif"), self.write_raster("dtm.tif")]
+
+        # Layout markers are detected from the header
+        self.assertTrue(has_cog_layout(cog))
+        self.assertTrue(valid_cogeo(cog))
+        for r in rasters:
+            self.assertFalse(has_cog_layout(r))
+            self.assertFalse(valid_cogeo(r))
+
+        results = assure_cogeos(rasters + [cog], cpu_budget=2)
+
+        # Results are in order, with timing information
+        self.assertEqual([r[0] for r in results], rasters + [cog])
+        for path, converted, elapsed, error in results:
+            self.assertIsNone(error)
+            self.assertTrue(elapsed >= 0)
+            self.assertEqual(converted, path != cog)
+            self.assertTrue(valid_cogeo(path))
+            self.assertTrue(has_cog_layout(path))
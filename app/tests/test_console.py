@@ -0,0 +1,60 @@
+import os
+
+from app.classes.console import Console
+from .classes import TempDirTestCase
+
+
+class TestConsole(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.console = Console(os.path.join(self.tmpdir, "data", "console_output.txt"))
+
+    def assertIndexed(self):
+        # Indexed reads match reading and splitting the whole output
+        out = self.console.output()
+        self.assertEqual(self.console.line_count(), 0 if not out else len(out.split("\n")))
+
+        lines = out.rstrip().split("\n")
+        self.assertEqual(self.console.line_count(rstrip=True), len(lines))
+        for start in range(0, len(lines) + 2):
+            for end in [None] + list(range(0, len(lines) + 2)):
+                self.assertEqual(self.console.lines(start, end), lines[start:end])
+
+    def test_line_index(self):
+        # No output
+        self.assertEqual(self.console.line_count(), 0)
+        self.assertEqual(self.console.lines(), [""])
+        self.assertIndexed()
+
+        self.console.reset("line1\nline2\nline3")
+        self.assertIndexed()
+        self.assertEqual(self.console.lines(1, 2), ["line2"])
+
+        # Appends update the index
+        self.console += "\nline4\n"
+        self.assertIndexed()
+        self.console += "partial"
+        self.assertIndexed()
+        self.console += " line5\n\n  \n"
+        self.assertIndexed()
+        self.assertEqual(self.console.lines(4), ["partial line5"])
+
+        # So do writes from other processes
+        with open(self.console.file, "a", encoding="utf-8") as f:
+            f.write("line6\nline7 è\n")
+        self.assertIndexed()
+        self.assertEqual(self.console.lines(7), ["line6", "line7 è"])
+
+        # Replaced files are indexed from scratch
+        self.console.reset("a\nb\n")
+        self.assertIndexed()
+
+        other = os.path.join(self.tmpdir, "task_output.txt")
+        with open(other, "w", encoding="utf-8") as f:
+            f.write("x\ny\nz\n")
+        self.console.link(other)
+        self.assertIndexed()
+        self.assertEqual(self.console.line_count(), 4)
+
+        self.console.reset()
+        self.assertIndexed()
@@ -0,0 +1,119 @@
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.models import Project, Task
+from nodeodm import status_codes
+from .classes import BootTestCase
+
+
+def bbox(xmin, ymin, xmax, ymax):
+    p = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+    p.srid = 4326
+    return p
+
+
+def to_json(map_items):
+    return json.loads(json.dumps(map_items))
+
+
+class TestMapItems(BootTestCase):
+    def test_map_items(self):
+        client = APIClient()
+
+        user = User.objects.get(username="testuser")
+        other_user = User.objects.get(username="testuser2")
+        project = Project.objects.create(owner=user, name="test project")
+        other_project = Project.objects.create(owner=other_user, name="other project")
+
+        ortho_task = Task.objects.create(project=project, name="ortho", status=status_codes.COMPLETED,
+                                         orthophoto_extent=bbox(10, 10, 11, 11),
+                                         available_assets=['orthophoto.tif', 'shots.geojson'])
+        dtm_task = Task.objects.create(project=project, name="dtm", status=status_codes.COMPLETED,
+                                       dtm_extent=bbox(20, 20, 21, 21),
+                                       available_assets=['dtm.tif'])
+        Task.objects.create(project=project, name="running", status=status_codes.RUNNING)
+        other_task = Task.objects.create(project=other_project, name="other", status=status_codes.COMPLETED,
+                                         orthophoto_extent=bbox(10, 10, 11, 11),
+                                         available_assets=['orthophoto.tif'])
+
+        # Same map items as the ones built from task instances, using a single query
+        project = Project.objects.get(pk=project.id)
+        with CaptureQueriesContext(connection) as ctx:
+            map_items = project.get_map_items()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(to_json(map_items), to_json([dtm_task.get_map_items(), ortho_task.get_map_items()]))
+
+        item = map_items[1]
+        self.assertEqual([t['type'] for t in item['tiles']], ['orthophoto', 'plant'])
+        self.assertEqual(item['tiles'][1]['url'], "/api/projects/{}/tasks/{}/orthophoto/".format(project.id, ortho_task.id))
+        self.assertEqual(item['meta']['task']['camera_shots'], "/api/projects/{}/tasks/{}/download/shots.geojson".format(project.id, ortho_task.id))
+        self.assertEqual(list(item['meta']['task']['extent']), [10, 10, 11, 11])
+        self.assertFalse(item['meta']['task']['crop'])
+        self.assertEqual(list(map_items[0]['meta']['task']['extent']), [20, 20, 21, 21])
+
+        # Cached
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(project.get_map_items(), map_items)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # Invalidated on crop changes (after commit)
+        ortho_task.crop = bbox(10, 10, 10.5, 10.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            ortho_task.save()
+            self.assertFalse(project.get_map_items()[1]['meta']['task']['crop'])
+        self.assertTrue(project.get_map_items()[1]['meta']['task']['crop'])
+
+        # Invalidated when a task completes or leaves the completed state
+        dtm_task.status = status_codes.RUNNING
+        with self.captureOnCommitCallbacks(execute=True):
+            dtm_task.save()
+        self.assertEqual(len(project.get_map_items()), 1)
+
+        dtm_task.status = status_codes.COMPLETED
+        with self.captureOnCommitCallbacks(execute=True):
+            dtm_task.save()
+        self.assertEqual(len(project.get_map_items()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ortho_task.delete()
+        self.assertEqual(len(project.get_map_items()), 1)
+
+        # API
+        res = client.get("/api/mapitems?project={}".format(project.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        client.login(username="testuser", password="test1234")
+        res = client.get("/api/mapitems")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = client.get("/api/mapitems?project={}".format(project.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(to_json(res.data), to_json(project.get_map_items()))
+
+        res = client.get("/api/mapitems?project={}".format(other_project.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Public projects are accessible
+        other_project.public = True
+        other_project.save()
+        res = client.get("/api/mapitems?project={}".format(other_project.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['meta']['task']['id'], str(other_task.id))
+
+        # Bounding box across the user's projects
+        res = client.get("/api/mapitems?bbox=19,19,22,22")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([i['meta']['task']['id'] for i in res.data], [str(dtm_task.id)])
+
+        res = client.get("/api/mapitems?bbox=9,9,12,12")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+        res = client.get("/api/mapitems?bbox=invalid")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,10 +1,16 @@
+import os
+
 from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 from app.models import Task, Project
 from nodeodm.models import ProcessingNode
-from worker.tasks import check_quotas
+from worker.tasks import check_quotas, reconcile_task_sizes
+from app.plugins.signals import task_removing, task_removed
 from .classes import BootTestCase
+from .utils import catch_signal
 
 class TestQuota(BootTestCase):
     def setUp(self):
@@ -81,8 +87,69 @@ class TestQuota(BootTestCase):
         check_quota_warning(0.99, "in 59 minutes")
         check_quota_warning(0, "very soon")
 
+        # A dry run reports which tasks would be removed, without removing them
+        report = check_quotas(dry_run=True)
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]['user'], "testuser")
+        self.assertEqual(report[0]['used'], 2015)
+        self.assertEqual(report[0]['tasks'], [str(Task.objects.get(name="Test2").id)])
+        self.assertEqual(len(Task.objects.filter(project__owner=user)), 2)
+
         # Running the check_quotas function should remove the last task only
-        check_quotas()
+        removed_id = Task.objects.get(name="Test2").id
+        with catch_signal(task_removing) as h1:
+            with catch_signal(task_removed) as h2:
+                check_quotas()
+        h1.assert_called_once_with(sender=Task, task_id=removed_id, signal=task_removing)
+        h2.assert_called_once_with(sender=Task, task_id=removed_id, signal=task_removed)
         tasks = Task.objects.filter(project__owner=user)
         self.assertEqual(len(tasks), 1)
-        self.assertEqual(tasks[0].name, "Test")
\ No newline at end of file
+        self.assertEqual(tasks[0].name, "Test")
+
+    def test_size_accounting(self):
+        user = User.objects.get(username="testuser")
+        p = Project.objects.create(owner=user, name='Test')
+        t = Task.objects.create(project=p, name='Test')
+        stale = Task.objects.get(pk=t.id)
+
+        os.makedirs(t.task_path("data"), exist_ok=True)
+        with open(t.task_path("image.jpg"), 'wb') as f:
+            f.write(b'0' * 1024 * 1024)
+        self.assertEqual(user.profile.used_quota_cached(), 0)
+
+        # Sizes are updated incrementally
+        t.add_size(1024 * 1024)
+        self.assertEqual(t.size, 1)
+        self.assertEqual(user.profile.used_quota_cached(), 1)
+
+        # With a single query each
+        with CaptureQueriesContext(connection) as ctx:
+            t.add_size(1024)
+            t.add_size(-1024)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(t.size, 1)
+
+        # And are not overwritten by stale instances saving other fields
+        stale.name = 'Renamed'
+        stale.save(update_fields=['name', 'updated_at'])
+        t.refresh_from_db()
+        self.assertEqual(t.size, 1)
+        self.assertEqual(t.name, 'Renamed')
+
+        # Untracked files are picked up during reconciliation
+        with open(t.task_path("data", "untracked.bin"), 'wb') as f:
+            f.write(b'0' * 1024 * 1024)
+        reconcile_task_sizes()
+        t.refresh_from_db()
+        self.assertEqual(t.size, 2)
+        self.assertEqual(user.profile.used_quota_cached(), 2)
+
+        # Compacting removes the images
+        t.compact()
+        t.refresh_from_db()
+        self.assertEqual(t.size, 1)
+        self.assertTrue(t.compacted)
+
+        # Sizes never go negative
+        t.add_size(-100 * 1024 * 1024)
+        self.assertEqual(t.size, 0)
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform
+
+from rasterio.windows import Window
+
+from app.raster_utils import export_raster, plan_subwindows, compute_subwindows, estimate_window_io
+from .classes import TempDirTestCase
+
+
+class TestRasterUtils(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Synthetic elevation model, not a multiple of the window size
+        self.dem = os.path.join(self.tmpdir, "dsm.tif")
+        width, height = 1100, 900
+        y, x = np.mgrid[0:height, 0:width]
+        elevation = (100 + 20 * np.sin(x / 50.0) * np.cos(y / 70.0)).astype(np.float32)
+        elevation[0:50, 0:50] = -9999
+        with rasterio.open(self.dem, 'w', driver='GTiff', width=width, height=height, count=1,
+                           dtype=rasterio.float32, nodata=-9999, crs='EPSG:32615',
+                           transform=from_origin(576000, 4550000, 0.1, 0.1),
+                           tiled=True, blockxsize=256, blockysize=256) as dst:
+            dst.write(elevation, 1)
+
+        self.orthophoto = os.path.join("app", "fixtures", "orthophoto.tif")
+
+    def assertSameRaster(self, a, b):
+        with rasterio.open(a) as ra, rasterio.open(b) as rb:
+            self.assertEqual(ra.profile, rb.profile)
+            self.assertEqual(ra.colorinterp, rb.colorinterp)
+            self.assertTrue(np.array_equal(ra.read(), rb.read()))
+
+    def test_parallel_export(self):
+        exports = [
+            (self.dem, {'asset_type': 'dsm', 'format': 'gtiff'}),
+            (self.dem, {'asset_type': 'dsm', 'format': 'gtiff-rgb', 'color_map': 'viridis', 'hillshade': 6}),
+            (self.orthophoto, {'asset_type': 'orthophoto', 'format': 'gtiff'}),
+            (self.orthophoto, {'asset_type': 'orthophoto', 'format': 'gtiff-rgb'}),
+            (self.orthophoto, {'asset_type': 'orthophoto', 'format': 'gtiff', 'expression': '(b2-b1)/(b2+b1-b3)'}),
+            (self.orthophoto, {'asset_type': 'orthophoto', 'format': 'gtiff-rgb', 'expression': '(b2-b1)/(b2+b1-b3)',
+                               'color_map': 'rdylgn', 'rescale': [-1, 1]}),
+        ]
+
+        for i, (input, opts) in enumerate(exports):
+            serial = os.path.join(self.tmpdir, "serial_{}.tif".format(i))
+            parallel = os.path.join(self.tmpdir, "parallel_{}.tif".format(i))
+
+            export_raster(input, serial, max_workers=1, **opts)
+            export_raster(input, parallel, max_workers=4, **opts)
+
+            # Output is identical regardless of the number of workers
+            self.assertSameRaster(serial, parallel)
+
+    def test_block_aligned_windows(self):
+        with rasterio.open(self.dem) as src:
+            win = Window(0, 0, src.width, src.height)
+            subwins = plan_subwindows(src, win, 512)
+
+            # Windows are aligned to 256px blocks and cover the raster exactly once
+            self.assertEqual(len(subwins), 6)
+            for w, dst_w in subwins:
+                self.assertEqual(w.col_off % 256, 0)
+                self.assertEqual(w.row_off % 256, 0)
+                self.assertEqual(w, dst_w)
+            self.assertEqual(sum(w.width * w.height for w, _ in subwins), src.width * src.height)
+
+            # Each block is decompressed only once
+            decompressed, output = estimate_window_io(src, subwins)
+            self.assertEqual(decompressed, 5 * 4 * 256 * 256 * 4)
+            self.assertEqual(output, src.width * src.height * 4)
+
+            # Which is less than with fixed windows
+            fixed_decompressed, fixed_output = estimate_window_io(src, compute_subwindows(win, 512))
+            self.assertTrue(fixed_decompressed > decompressed)
+
+        # Blocks are decompressed for all bands, even when fewer are read
+        with rasterio.open(self.orthophoto) as src:
+            subwins = plan_subwindows(src, Window(0, 0, src.width, src.height), 512)
+            decompressed, output = estimate_window_io(src, subwins)
+            single_decompressed, single_output = estimate_window_io(src, subwins, count=1)
+            self.assertEqual(single_decompressed, decompressed)
+            self.assertEqual(single_output * src.count, output)
+
+    def test_warped_export(self):
+        # Reprojection happens without intermediate files
+        reprojected = os.path.join(self.tmpdir, "reprojected.tif")
+        export_raster(self.dem, reprojected, asset_type='dsm', format='gtiff', epsg=4326)
+        with rasterio.open(reprojected) as ds:
+            self.assertEqual(ds.crs.to_epsg(), 4326)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["dsm.tif", "reprojected.tif"])
+
+        # Triangle covering the center of the DEM
+        xs, ys = transform('EPSG:32615', 'EPSG:4326', [576020, 576090, 576055, 576020], [4549920, 4549920, 4549990, 4549920])
+        crop_wkt = "POLYGON (({}))".format(", ".join("{} {}".format(x, y) for x, y in zip(xs, ys)))
+
+        for epsg in [None, 4326]:
+            serial = os.path.join(self.tmpdir, "cropped_serial.tif")
+            parallel = os.path.join(self.tmpdir, "cropped_parallel.tif")
+            opts = {'asset_type': 'dsm', 'format': 'gtiff-rgb', 'color_map': 'viridis', 'hillshade': 6,
+                    'crop': crop_wkt, 'epsg': epsg}
+            export_raster(self.dem, serial, max_workers=1, **opts)
+            export_raster(self.dem, parallel, max_workers=4, **opts)
+            self.assertSameRaster(serial, parallel)
+
+            with rasterio.open(serial) as ds:
+                # Output is cropped to the bounding box of the polygon
+                self.assertTrue(ds.width < 800)
+                self.assertTrue(ds.height < 800)
+
+                # Areas outside the polygon are transparent
+                alpha = ds.read(4)
+                self.assertEqual(alpha[0][0], 0)
+                self.assertEqual(alpha[0][-1], 0)
+                self.assertEqual(alpha[alpha.shape[0] // 2 + 100][alpha.shape[1] // 2], 255)
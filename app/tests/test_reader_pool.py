@@ -0,0 +1,69 @@
+import os
+import shutil
+
+from app.reader_pool import ReaderPool
+from .classes import TempDirTestCase
+
+
+class TestReaderPool(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.raster = os.path.join(self.tmpdir, "orthophoto.tif")
+        shutil.copy(os.path.join("app", "fixtures", "orthophoto.tif"), self.raster)
+
+    def test_reader_pool(self):
+        pool = ReaderPool(max_size=2, idle_timeout=300)
+
+        # First access opens a reader
+        key, reader, pooled = pool.acquire(self.raster)
+        self.assertTrue(pooled)
+        self.assertEqual(reader.dataset.width, 212)
+        pool.release(key, reader)
+        self.assertEqual(pool.stats()['misses'], 1)
+
+        # Second access reuses it
+        key2, reader2, pooled = pool.acquire(self.raster)
+        self.assertTrue(reader2 is reader)
+        self.assertEqual(pool.stats()['hits'], 1)
+
+        # A reader is not shared while borrowed
+        key3, reader3, pooled = pool.acquire(self.raster)
+        self.assertFalse(reader3 is reader2)
+        self.assertEqual(pool.stats()['open'], 2)
+
+        # Pool is full
+        key4, reader4, pooled = pool.acquire(self.raster)
+        self.assertFalse(pooled)
+        reader4.close()
+
+        pool.release(key2, reader2)
+        pool.release(key3, reader3)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+        # Changing the file invalidates the key
+        st = os.stat(self.raster)
+        os.utime(self.raster, (st.st_atime, st.st_mtime + 10))
+        key5, reader5, pooled = pool.acquire(self.raster)
+        self.assertNotEqual(key5, key2)
+        self.assertTrue(pooled)
+        self.assertFalse(reader5 is reader2 or reader5 is reader3)
+
+        # Least recently used reader was closed to make room
+        self.assertEqual(pool.stats()['open'], 2)
+        pool.release(key5, reader5)
+
+        pool.clear()
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_idle_timeout(self):
+        pool = ReaderPool(max_size=2, idle_timeout=-1)
+        key, reader, pooled = pool.acquire(self.raster)
+        pool.release(key, reader)
+
+        # Idle readers are closed on the next access
+        key, reader2, pooled = pool.acquire(self.raster)
+        self.assertFalse(reader2 is reader)
+        self.assertEqual(pool.stats()['open'], 1)
+        pool.release(key, reader2)
+        pool.clear()
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from app.synthetic_images import write_synthetic_images
+from app.models.task import resize_images_parallel
+from .classes import TempDirTestCase
+
+
+class TestResize(TempDirTestCase):
+    def test_parallel_resize(self):
+        images = write_synthetic_images(os.path.join(self.tmpdir, "parallel"), 6, width=1200, height=800)
+        originals = write_synthetic_images(os.path.join(self.tmpdir, "serial"), 1, width=1200, height=800)
+
+        done = []
+        results = resize_images_parallel(images, 300, done=lambda retval=None: done.append(retval), max_workers=3)
+
+        # Results are in order and callbacks are invoked once per image
+        self.assertEqual([r['path'] for r in results], images)
+        self.assertEqual(len(done), len(images))
+
+        for r in results:
+            self.assertEqual(r['resize_ratio'], 0.25)
+            with Image.open(r['path']) as im:
+                self.assertEqual(im.size, (300, 200))
+                self.assertTrue('exif' in im.info)
+
+        # Draft mode output is close to a full decode
+        full = resize_images_parallel(originals, 300, draft=False)[0]
+        with Image.open(full['path']) as a, Image.open(images[0]) as b:
+            diff = np.abs(np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32))
+            self.assertTrue(diff.mean() < 16)
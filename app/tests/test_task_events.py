@@ -0,0 +1,207 @@
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app import task_events
+from app.models import Project, Task
+from app.task_events import ProgressThrottle
+from nodeodm import status_codes
+from webodm import settings
+from .classes import BootTestCase
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTaskEvents(BootTestCase):
+    def setUp(self):
+        self.task_events = settings.TASK_EVENTS
+        settings.TASK_EVENTS = True
+
+    def tearDown(self):
+        settings.TASK_EVENTS = self.task_events
+
+    def test_synthetic_load(self):
+        # Synthetic load: 10 running tasks reporting progress twice per second
+        # for a minute, with a dashboard refreshing them every 3 seconds
+        client = APIClient()
+        client.login(username="testuser", password="test1234")
+
+        user = User.objects.get(username="testuser")
+        project = Project.objects.create(owner=user, name="test project")
+        tasks = [Task.objects.create(project=project, name="task {}".format(i), status=status_codes.RUNNING) for i in range(10)]
+        seconds = 60
+        refresh_interval = 3
+
+        def report_progress(events):
+            """
+            :return: (number of DB writes, number of events received)
+            """
+            settings.TASK_EVENTS = events
+            clock = FakeClock()
+            throttles = [ProgressThrottle(clock=clock) for _ in tasks]
+            pubsub = task_events.subscribe([t.id for t in tasks])
+            try:
+                with CaptureQueriesContext(connection) as ctx:
+                    for step in range(seconds * 2):
+                        clock.now = step * 0.5
+                        for task, throttle in zip(tasks, throttles):
+                            publish, write = throttle.check()
+                            if publish or write:
+                                task.report_progress(write, running_progress=step / (seconds * 2.0))
+
+                received = 0
+                while pubsub.get_message(timeout=1) is not None:
+                    received += 1
+
+                return len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), received
+            finally:
+                pubsub.close()
+
+        writes_without_events, received = report_progress(False)
+        self.assertEqual(received, 0)
+
+        writes, received = report_progress(True)
+        self.assertEqual(received, writes_without_events)
+        self.assertTrue(writes > 0)
+        self.assertTrue(writes * 5 <= writes_without_events)
+
+        def count_queries(urls):
+            with CaptureQueriesContext(connection) as ctx:
+                for url in urls:
+                    res = client.get(url)
+                    self.assertEqual(res.status_code, status.HTTP_200_OK)
+                    if res.streaming:
+                        b''.join(res.streaming_content)
+            return len(ctx.captured_queries)
+
+        refreshes = seconds // refresh_interval
+        task_urls = ["/api/projects/{}/tasks/{}/".format(project.id, t.id) for t in tasks]
+        ids = ",".join([str(t.id) for t in tasks])
+
+        # Polling each task (statistics are cached on first access)
+        count_queries(task_urls)
+        polling_requests = refreshes * len(tasks)
+        polling_queries = refreshes * count_queries(task_urls)
+
+        # Polling changes with /api/tasks/updates
+        updates_requests = refreshes
+        updates_queries = refreshes * count_queries(["/api/tasks/updates?ids={}".format(ids)])
+
+        # A single stream (which lasts TASK_EVENTS_STREAM_TIMEOUT)
+        timeout = settings.TASK_EVENTS_STREAM_TIMEOUT
+        settings.TASK_EVENTS_STREAM_TIMEOUT = 1
+        try:
+            events_requests = 1
+            events_queries = count_queries(["/api/tasks/events?ids={}".format(ids)])
+        finally:
+            settings.TASK_EVENTS_STREAM_TIMEOUT = timeout
+
+        self.assertTrue(events_requests < updates_requests < polling_requests)
+        self.assertTrue(events_queries < updates_queries < polling_queries)
+
+        # Final updates are always published and written
+        throttle = ProgressThrottle(clock=FakeClock())
+        self.assertEqual(throttle.check(), (True, True))
+        self.assertEqual(throttle.check(), (False, False))
+        self.assertEqual(throttle.check(final=True), (True, True))
+
+    def test_publish_subscribe(self):
+        task_id = uuid.uuid4()
+        pubsub = task_events.subscribe([task_id])
+        try:
+            self.assertEqual(task_events.publish(task_id, {'running_progress': 0.5, 'upload_state': {'uuid': 'x'}}), 1)
+            message = pubsub.get_message(timeout=5)
+            self.assertEqual(json.loads(message['data']), {'id': str(task_id), 'running_progress': 0.5})
+
+            # Disabled
+            settings.TASK_EVENTS = False
+            self.assertEqual(task_events.publish(task_id, {'running_progress': 0.6}), 0)
+        finally:
+            settings.TASK_EVENTS = True
+            pubsub.close()
+
+    def test_report_progress(self):
+        user = User.objects.get(username="testuser")
+        project = Project.objects.create(owner=user, name="test project")
+        task = Task.objects.create(project=project, name="task")
+        updated_at = task.updated_at
+
+        pubsub = task_events.subscribe([task.id])
+        try:
+            # Events only
+            with CaptureQueriesContext(connection) as ctx:
+                task.report_progress(False, resize_progress=0.5)
+            self.assertEqual(len(ctx.captured_queries), 0)
+            self.assertEqual(json.loads(pubsub.get_message(timeout=5)['data'])['resize_progress'], 0.5)
+            task.refresh_from_db()
+            self.assertEqual(task.resize_progress, 0.0)
+
+            # Events and database
+            task.report_progress(resize_progress=0.7)
+            event = json.loads(pubsub.get_message(timeout=5)['data'])
+            task.refresh_from_db()
+            self.assertEqual(task.resize_progress, 0.7)
+            self.assertTrue(task.updated_at > updated_at)
+            self.assertEqual(event['updated_at'], task_events.datetime_to_version(task.updated_at))
+        finally:
+            pubsub.close()
+
+    def test_events_stream(self):
+        client = APIClient()
+
+        user = User.objects.get(username="testuser")
+        other_user = User.objects.get(username="testuser2")
+        project = Project.objects.create(owner=user, name="test project")
+        other_project = Project.objects.create(owner=other_user, name="other project")
+        task = Task.objects.create(project=project, name="task", status=status_codes.RUNNING)
+        other_task = Task.objects.create(project=other_project, name="other task")
+
+        url = "/api/tasks/events?ids={},{}".format(task.id, other_task.id)
+
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.login(username="testuser", password="test1234")
+
+        timeout = settings.TASK_EVENTS_STREAM_TIMEOUT
+        settings.TASK_EVENTS_STREAM_TIMEOUT = 1
+        try:
+            res = client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res['Content-Type'], 'text/event-stream')
+
+            # Published after subscribing
+            task_events.publish(task.id, {'running_progress': 0.25})
+            task_events.publish(other_task.id, {'running_progress': 0.75})
+
+            content = b''.join(res.streaming_content).decode('utf-8')
+        finally:
+            settings.TASK_EVENTS_STREAM_TIMEOUT = timeout
+
+        self.assertTrue(content.startswith("retry: "))
+        events = [json.loads(line[len("data: "):]) for line in content.split("\n") if line.startswith("data: ")]
+
+        # Current state, then changes
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0]['id'], str(task.id))
+        self.assertEqual(events[0]['status'], status_codes.RUNNING)
+        self.assertEqual(events[1], {'id': str(task.id), 'running_progress': 0.25})
+
+        # Disabled
+        settings.TASK_EVENTS = False
+        try:
+            res = client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        finally:
+            settings.TASK_EVENTS = True
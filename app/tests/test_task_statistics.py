@@ -0,0 +1,60 @@
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from app.models import Task, Project
+from nodeodm import status_codes
+from .classes import BootTestCase
+
+
+class TestTaskStatistics(BootTestCase):
+    def write_stats(self, task, gsd, mtime):
+        stats_json = task.assets_path("odm_report", "stats.json")
+        os.makedirs(os.path.dirname(stats_json), exist_ok=True)
+        with open(stats_json, "w") as f:
+            f.write(json.dumps({
+                'odm_processing_statistics': {'average_gsd': gsd},
+                'reconstruction_statistics': {'has_gps': True, 'reconstructed_points_count': 1000},
+            }))
+        os.utime(stats_json, (mtime, mtime))
+
+    def test_statistics(self):
+        client = APIClient()
+        client.login(username="testuser", password="test1234")
+
+        user = User.objects.get(username="testuser")
+        project = Project.objects.create(owner=user, name="test project")
+        task = Task.objects.create(project=project, status=status_codes.COMPLETED)
+        self.assertIsNone(task.statistics)
+
+        # Statistics are parsed on first access and cached
+        self.write_stats(task, 1.5, 1000)
+        res = client.get("/api/projects/{}/tasks/{}/".format(project.id, task.id))
+        self.assertEqual(res.data['statistics']['gsd'], 1.5)
+        self.assertEqual(res.data['statistics']['spatial_refs'], ['gps'])
+        self.assertFalse('statistics_mtime' in res.data)
+
+        task.refresh_from_db()
+        self.assertEqual(task.statistics['gsd'], 1.5)
+        self.assertEqual(task.statistics_mtime, 1000)
+
+        # stats.json is not read again unless it changes
+        self.write_stats(task, 2.0, 1000)
+        self.assertFalse(task.update_statistics_field())
+        res = client.get("/api/projects/{}/tasks/".format(project.id))
+        self.assertEqual(res.data[0]['statistics']['gsd'], 1.5)
+
+        self.write_stats(task, 2.0, 2000)
+        call_command("updatestatistics")
+        task.refresh_from_db()
+        self.assertEqual(task.statistics['gsd'], 2.0)
+        self.assertEqual(task.statistics_mtime, 2000)
+
+        # Tasks without stats.json have empty statistics
+        other_task = Task.objects.create(project=project)
+        self.assertEqual(other_task.get_statistics(), {})
+        other_task.refresh_from_db()
+        self.assertEqual(other_task.statistics, {})
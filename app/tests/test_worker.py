@@ -6,6 +6,7 @@ import json
 import worker
 from app.models import Project
 from app.models import Task
+from nodeodm import status_codes
 from nodeodm.models import ProcessingNode
 from webodm import settings
 from .classes import BootTestCase
@@ -121,6 +122,34 @@ class TestWorker(BootTestCase):
         worker.tasks.cleanup_tmp_directory()
         self.assertFalse(os.path.exists(tmpdir))
 
+    def test_batch_polling(self):
+        project = Project.objects.get(name="User Test Project")
+        pnode = ProcessingNode.objects.create(hostname="localhost", port=11223)
+
+        with start_processing_node():
+            worker.tasks.update_nodes_info()
+
+            task = Task.objects.create(project=project, processing_node=pnode, auto_processing_node=False,
+                                       uuid="invalid-uuid", status=status_codes.RUNNING)
+            self.assertTrue(worker.tasks.can_poll_status(task))
+
+            # Tasks with pending actions are not polled
+            task.pending_action = 1
+            self.assertFalse(worker.tasks.can_poll_status(task))
+            task.pending_action = None
+
+            settings.NODE_BATCH_POLLING = True
+            try:
+                worker.tasks.process_pending_tasks()
+            finally:
+                settings.NODE_BATCH_POLLING = False
+
+            # The node doesn't know about this task, so it
+            # was handed off to process_task which failed it
+            task.refresh_from_db()
+            self.assertEqual(task.status, status_codes.FAILED)
+            self.assertTrue(task.last_error is not None)
+
     def test_workers_api(self):
         client = APIClient()
 
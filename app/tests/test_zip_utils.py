@@ -0,0 +1,126 @@
+import os
+import zipfile
+
+from app.zip_utils import extract_zip, download_and_extract_zip
+from .classes import TempDirTestCase
+
+
+class TestZipUtils(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.zip_path = os.path.join(self.tmpdir, "all.zip")
+        self.files = {
+            "odm_orthophoto/odm_orthophoto.tif": os.urandom(300000),
+            "odm_dem/dsm.tif": b"dsm" * 100000,
+            "odm_dem/dtm.tif": os.urandom(1000),
+            "images.json": b"[]",
+            "empty.txt": b"",
+        }
+
+        with zipfile.ZipFile(self.zip_path, "w") as z:
+            z.writestr("odm_texturing/", b"")
+            for name, data in self.files.items():
+                z.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED if name.endswith("dsm.tif") else zipfile.ZIP_STORED)
+
+        with open(self.zip_path, "rb") as f:
+            self.original = f.read()
+
+    def assertExtracted(self, destination):
+        self.assertTrue(os.path.isdir(os.path.join(destination, "odm_texturing")))
+        for name, data in self.files.items():
+            with open(os.path.join(destination, name), "rb") as f:
+                self.assertEqual(f.read(), data)
+
+    def corrupt(self, name):
+        with zipfile.ZipFile(self.zip_path, "r") as z:
+            info = z.getinfo(name)
+        with open(self.zip_path, "r+b") as f:
+            f.seek(info.header_offset + 100)
+            b = f.read(1)
+            f.seek(info.header_offset + 100)
+            f.write(bytes([b[0] ^ 0xFF]))
+
+    def test_extract(self):
+        for workers in [1, 4]:
+            progress = []
+            destination = os.path.join(self.tmpdir, "out_{}".format(workers))
+            extracted = extract_zip(self.zip_path, destination, max_workers=workers, progress_callback=progress.append)
+
+            self.assertExtracted(destination)
+            self.assertEqual(extracted, sum(len(d) for d in self.files.values()))
+            self.assertEqual(progress[-1], 1)
+            self.assertEqual(progress, sorted(progress))
+
+    def test_corrupted_members(self):
+        fetched = []
+
+        def fetch_range(start, end):
+            fetched.append((start, end))
+            return self.original[start:end + 1]
+
+        for name in ["odm_orthophoto/odm_orthophoto.tif", "odm_dem/dsm.tif"]:
+            self.corrupt(name)
+
+        # CRC errors are detected
+        with self.assertRaises(zipfile.BadZipFile):
+            extract_zip(self.zip_path, os.path.join(self.tmpdir, "bad"), max_workers=4)
+
+        # Only the corrupted members are fetched again
+        destination = os.path.join(self.tmpdir, "out")
+        extract_zip(self.zip_path, destination, max_workers=4, fetch_range=fetch_range)
+        self.assertExtracted(destination)
+        self.assertEqual(len(fetched), 4)
+        self.assertTrue(sum(end - start + 1 for start, end in fetched) < len(self.original))
+
+        with open(self.zip_path, "rb") as f:
+            self.assertEqual(f.read(), self.original)
+
+    def test_unsafe_paths(self):
+        with zipfile.ZipFile(self.zip_path, "w") as z:
+            z.writestr("../outside.txt", b"x")
+            z.writestr("/absolute.txt", b"y")
+
+        destination = os.path.join(self.tmpdir, "out")
+        extract_zip(self.zip_path, destination, max_workers=2)
+
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "outside.txt")))
+        self.assertTrue(os.path.isfile(os.path.join(destination, "outside.txt")))
+        self.assertTrue(os.path.isfile(os.path.join(destination, "absolute.txt")))
+
+    def test_pipelined_download(self):
+        events = []
+
+        def fetch_range(start, end):
+            events.append(('fetch', start))
+            return self.original[start:end + 1]
+
+        for workers in [1, 4]:
+            events.clear()
+            progress = []
+            destination = os.path.join(self.tmpdir, "out_{}".format(workers))
+            zip_path = os.path.join(self.tmpdir, "download_{}.zip".format(workers))
+            download_and_extract_zip(fetch_range, len(self.original), zip_path, destination,
+                                     max_workers=workers, download_workers=2, chunk_size=32 * 1024, tail_size=1024,
+                                     progress_callback=progress.append,
+                                     member_callback=lambda path: events.append(('extracted', path)))
+
+            self.assertExtracted(destination)
+            with open(zip_path, "rb") as f:
+                self.assertEqual(f.read(), self.original)
+            self.assertEqual(progress[-1], 1)
+
+            # All members are post-processed, some before the download is complete
+            extracted = [e for e in events if e[0] == 'extracted']
+            self.assertEqual(len(extracted), len(self.files))
+            self.assertTrue(events.index(extracted[0]) < max(i for i, e in enumerate(events) if e[0] == 'fetch'))
+
+        # Corrupted downloads are detected
+        def corrupted_range(start, end):
+            data = bytearray(self.original[start:end + 1])
+            if start == 0:
+                data[200] ^= 0xFF
+            return bytes(data)
+
+        with self.assertRaises(zipfile.BadZipFile):
+            download_and_extract_zip(corrupted_range, len(self.original), os.path.join(self.tmpdir, "bad.zip"),
+                                     os.path.join(self.tmpdir, "bad"), tail_size=1024, max_retries=0)
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from webodm import settings
+
+logger = logging.getLogger('app.logger')
+
+TILE_EXTENSIONS = ['png', 'jpg', 'webp']
+
+def tile_cache_enabled():
+    return settings.TILE_CACHE_MAX_SIZE is not None and settings.TILE_CACHE_MAX_SIZE > 0
+
+def get_tile_cache_root():
+    return os.path.join(settings.MEDIA_CACHE, "task_assets")
+
+def get_tile_cache_key(task, raster_path, params):
+    """
+    Compute a content-addressed key for a rendered tile
+    :param task: Task instance
+    :param raster_path: path to the source raster (its mtime is part of the key)
+    :param params: dictionary of normalized rendering parameters
+    :return: hex digest string
+    """
+    try:
+        mtime = os.path.getmtime(raster_path)
+    except OSError:
+        mtime = None
+
+    payload = json.dumps({
+        'task': str(task.id),
+        'mtime': mtime,
+        'params': params
+    }, sort_keys=True, default=str)
+
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _tile_cache_path(cache_dir, key, ext):
+    # Spread entries over subdirectories to keep directory listings small
+    return os.path.join(cache_dir, key[:2], "{}.{}".format(key, ext))
+
+def get_cached_tile(cache_dir, key, ext=None):
+    """
+    Look up a rendered tile
+    :param cache_dir: task tile cache directory
+    :param key: tile cache key
+    :param ext: tile extension, or None to look for any extension
+    :return: (path, ext) of the cached tile or (None, None)
+    """
+    if cache_dir is None:
+        return None, None
+
+    for e in ([ext] if ext is not None else TILE_EXTENSIONS):
+        p = _tile_cache_path(cache_dir, key, e)
+        if os.path.isfile(p):
+            try:
+                # Mark as recently used (LRU eviction is based on mtime)
+                os.utime(p)
+            except OSError:
+                pass
+            return p, e
+
+    return None, None
+
+def write_cached_tile(cache_dir, key, ext, content):
+    """
+    Atomically store a rendered tile
+    :return: path of the stored tile or None on failure
+    """
+    if cache_dir is None:
+        return None
+
+    p = _tile_cache_path(cache_dir, key, ext)
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(p))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, p)
+        return p
+    except OSError as e:
+        logger.warning("Cannot write tile cache entry {}: {}".format(p, str(e)))
+        return None
+
+def evict_tile_cache(max_size_mb=None):
+    """
+    Remove least recently used tiles until the total size
+    of all task tile caches is below max_size_mb
+    :return: number of bytes removed
+    """
+    if max_size_mb is None:
+        max_size_mb = settings.TILE_CACHE_MAX_SIZE
+    if max_size_mb is None:
+        return 0
+
+    root = get_tile_cache_root()
+    if not os.path.isdir(root):
+        return 0
+
+    entries = []
+    total_bytes = 0
+    for task_dir in os.listdir(root):
+        tiles_dir = os.path.join(root, task_dir, "tiles")
+        if not os.path.isdir(tiles_dir):
+            continue
+
+        for dirpath, _, filenames in os.walk(tiles_dir):
+            for f in filenames:
+                fp = os.path.join(dirpath, f)
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fp))
+                total_bytes += st.st_size
+
+    max_bytes = max_size_mb * 1024 * 1024
+    removed = 0
+    if total_bytes <= max_bytes:
+        return removed
+
+    entries.sort()
+    for _, size, fp in entries:
+        if total_bytes - removed <= max_bytes:
+            break
+        try:
+            os.remove(fp)
+            removed += size
+        except OSError:
+            pass
+
+    logger.info("Evicted {} bytes from tile cache".format(removed))
+    return removed
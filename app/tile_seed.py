@@ -0,0 +1,149 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from rest_framework import exceptions
+from app.api.tiler import get_zoom_safe, get_tile_cache_key_for, render_tile
+from app.reader_pool import cog_reader
+from app.raster_stats import get_raster_statistics
+from app.tile_cache import get_cached_tile, write_cached_tile
+
+logger = logging.getLogger('app.logger')
+
+# Same parameters used by the map viewer when it
+# first displays a task's layers (see Map.jsx)
+SEED_TILESIZE = 512
+SEED_EXT = 'auto-webp'
+SEED_LAYERS = {
+    'orthophoto': {'color_map': None, 'hillshade': None},
+    'dsm': {'color_map': 'viridis', 'hillshade': '6'},
+    'dtm': {'color_map': 'viridis', 'hillshade': '6'},
+}
+
+
+def format_js_number(value):
+    """
+    Format a number the way Javascript would
+    when interpolating it in a string
+    """
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def get_default_rescale(stats):
+    """
+    The viewer rescales layers using the min/max of the last band
+    in the raster statistics, or -1,1 if statistics are not available
+    """
+    if not stats or not "1" in stats:
+        return "-1,1"
+
+    def band_order(band):
+        try:
+            return (0, int(band))
+        except ValueError:
+            return (1, band)
+
+    last = stats[sorted(stats.keys(), key=band_order)[-1]]
+    return "{},{}".format(format_js_number(last['min']), format_js_number(last['max']))
+
+
+def get_seed_tiles(src, zoom_levels):
+    """
+    :param src: COGReader
+    :param zoom_levels: number of zoom levels to seed, starting from minzoom
+    :return: list of (x, y, z) tuples
+    """
+    minzoom, maxzoom = get_zoom_safe(src)
+    west, south, east, north = src.geographic_bounds
+    zooms = list(range(minzoom, min(minzoom + zoom_levels, maxzoom + 1)))
+    return [(t.x, t.y, t.z) for t in src.tms.tiles(west, south, east, north, zooms)]
+
+
+def seed_task_tiles(task, zoom_levels, max_workers=1, progress_callback=None, is_canceled=None):
+    """
+    Render the tile pyramid of a task's orthophoto and elevation models
+    and store the results in the tile cache
+    :param task: Task
+    :param zoom_levels: number of zoom levels to seed, starting from minzoom
+    :param max_workers: number of tiles to render concurrently
+    :param progress_callback: optional function(done, total)
+    :param is_canceled: optional function returning True if seeding should stop
+    :return: number of tiles that were rendered
+    """
+    cache_dir = task.get_tile_cache()
+    jobs = []
+
+    for tile_type, params in SEED_LAYERS.items():
+        raster_path = task.get_check_file_asset_path(tile_type + ".tif")
+        if raster_path is None:
+            continue
+
+        with cog_reader(raster_path) as src:
+            stats = get_raster_statistics(src, raster_path, task.get_raster_statistics_cache(), tile_type)
+            tiles = get_seed_tiles(src, zoom_levels)
+
+        rescale = get_default_rescale(stats)
+        for x, y, z in tiles:
+            jobs.append((tile_type, raster_path, x, y, z, rescale, params['color_map'], params['hillshade']))
+
+    def seed_tile(job):
+        tile_type, raster_path, x, y, z, rescale, color_map, hillshade = job
+        key = get_tile_cache_key_for(task, raster_path, tile_type, z, x, y, SEED_TILESIZE, SEED_EXT,
+                                     rescale=rescale, color_map=color_map, hillshade=hillshade)
+        cached_path, _ = get_cached_tile(cache_dir, key)
+        if cached_path is not None:
+            return False
+
+        try:
+            content, ext = render_tile(task, tile_type, raster_path, z, x, y, SEED_TILESIZE,
+                                       rescale=rescale, color_map=color_map, hillshade=hillshade,
+                                       webp=True)
+        except exceptions.NotFound:
+            return False
+
+        write_cached_tile(cache_dir, key, ext, content)
+        return True
+
+    total = len(jobs)
+    done = 0
+    rendered = 0
+
+    if total == 0 and progress_callback is not None:
+        progress_callback(0, 0)
+    pending = set()
+    jobs_iter = iter(jobs)
+
+    # Keep a bounded number of tiles in flight, so that
+    # we can stop quickly when the task is removed
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            if is_canceled is not None and is_canceled():
+                for f in pending:
+                    f.cancel()
+                logger.info("Tile seeding for {} canceled ({} of {} tiles)".format(task, done, total))
+                return rendered
+
+            for job in jobs_iter:
+                pending.add(executor.submit(seed_tile, job))
+                if len(pending) >= max_workers * 2:
+                    break
+
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in finished:
+                try:
+                    if f.result():
+                        rendered += 1
+                except Exception as e:
+                    logger.warning("Cannot seed tile for {}: {}".format(task, str(e)))
+                done += 1
+
+            if progress_callback is not None:
+                progress_callback(done, total)
+
+    logger.info("Seeded {} tiles for {}".format(rendered, task))
+    return rendered
@@ -0,0 +1,312 @@
+import bisect
+import logging
+import os
+import shutil
+import struct
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger('app.logger')
+
+# Local file header signature, version, flags, compression, time, date,
+# crc, compressed size, uncompressed size, filename length, extra length
+LOCAL_HEADER_STRUCT = "<4s5HL2L2H"
+LOCAL_HEADER_SIZE = struct.calcsize(LOCAL_HEADER_STRUCT)
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def member_path(destination, info):
+    """
+    Compute the path where a zip member should be extracted, discarding
+    absolute paths and parent directory references (same rules as ZipFile.extract)
+    """
+    arcname = info.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    invalid_path_parts = ('', os.path.curdir, os.path.pardir)
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in invalid_path_parts)
+    return os.path.join(destination, arcname)
+
+
+def repair_member(zip_path, info, fetch_range):
+    """
+    Replace the bytes of a single member (local header + data) in a zip archive
+    :param fetch_range: function(start, end) returning the bytes of the original archive in [start, end] (inclusive)
+    """
+    header = fetch_range(info.header_offset, info.header_offset + LOCAL_HEADER_SIZE - 1)
+    if len(header) != LOCAL_HEADER_SIZE:
+        raise zipfile.BadZipFile("Cannot fetch local header for {}".format(info.filename))
+
+    fields = struct.unpack(LOCAL_HEADER_STRUCT, header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile("Bad magic number for file header of {}".format(info.filename))
+
+    data_start = info.header_offset + LOCAL_HEADER_SIZE
+    data_end = data_start + fields[9] + fields[10] + info.compress_size - 1
+    data = fetch_range(data_start, data_end)
+    if len(data) != data_end - data_start + 1:
+        raise zipfile.BadZipFile("Cannot fetch data for {}".format(info.filename))
+
+    with open(zip_path, 'r+b') as f:
+        f.seek(info.header_offset)
+        f.write(header)
+        f.write(data)
+
+
+class MemberExtractor:
+    """
+    Extracts members of a zip archive from multiple threads. Each thread
+    reads from its own unbuffered handle, so that bytes written to the archive
+    after a handle was opened (downloads, repairs) are always seen.
+    """
+    def __init__(self, zip_path, destination, fetch_range=None, max_retries=3):
+        self.zip_path = zip_path
+        self.destination = destination
+        self.fetch_range = fetch_range
+        self.max_retries = max_retries
+        self.local = threading.local()
+        self.handles = []
+        self.lock = threading.Lock()
+
+    def prepare(self, members):
+        """
+        Create directories upfront, so that threads don't race to create them
+        :return: list of (ZipInfo, path) for the files to extract
+        """
+        files = []
+        for info in members:
+            path = member_path(self.destination, info)
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                files.append((info, path))
+        return files
+
+    def get_handle(self, reopen=False):
+        handle = getattr(self.local, 'handle', None)
+        if handle is not None and reopen:
+            self.close_handle(handle)
+            handle = None
+        if handle is None:
+            fp = open(self.zip_path, 'rb', buffering=0)
+            handle = (zipfile.ZipFile(fp, "r"), fp)
+            with self.lock:
+                self.handles.append(handle)
+            self.local.handle = handle
+        return handle[0]
+
+    def close_handle(self, handle):
+        with self.lock:
+            if handle in self.handles:
+                self.handles.remove(handle)
+        handle[0].close()
+        handle[1].close()
+
+    def extract(self, info, path):
+        """
+        Extract a single member, verifying its CRC
+        :return: number of bytes extracted
+        """
+        retry_num = 0
+        while True:
+            try:
+                with self.get_handle().open(info) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                return info.file_size
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                if self.fetch_range is None or retry_num >= self.max_retries:
+                    raise zipfile.BadZipFile("{} is corrupted: {}".format(info.filename, str(e)))
+
+                retry_num += 1
+                logger.warning("{} is corrupted ({}), fetching it again (attempt {})".format(info.filename, str(e), retry_num))
+                repair_member(self.zip_path, info, self.fetch_range)
+                self.get_handle(reopen=True)
+
+    def close(self):
+        for handle in list(self.handles):
+            self.close_handle(handle)
+
+
+def extract_zip(zip_path, destination, max_workers=1, progress_callback=None, fetch_range=None, max_retries=3):
+    """
+    Extract all members of a zip archive, in parallel if max_workers > 1.
+    CRCs are verified as each member is decompressed. If a member is corrupted and
+    fetch_range is set, only that member is downloaded again and extracted.
+    :param max_workers: number of members to extract concurrently
+    :param progress_callback: optional function(progress) with progress from 0 to 1
+    :param fetch_range: optional function(start, end) returning the bytes of the original archive in [start, end]
+    :param max_retries: number of times a corrupted member is fetched again
+    :return: number of bytes extracted
+    It will raise a zipfile.BadZipFile exception if the archive cannot be extracted
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_h:
+        members = zip_h.infolist()
+
+    extractor = MemberExtractor(zip_path, destination, fetch_range, max_retries)
+    files = extractor.prepare(members)
+
+    # Largest members first, for better load balancing
+    files.sort(key=lambda f: f[0].file_size, reverse=True)
+    total_bytes = max(1, sum(info.file_size for info, _ in files))
+
+    extracted = 0
+    try:
+        if max_workers <= 1:
+            for info, path in files:
+                extracted += extractor.extract(info, path)
+                if progress_callback is not None:
+                    progress_callback(extracted / total_bytes)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(extractor.extract, info, path) for info, path in files]
+                try:
+                    for future in as_completed(futures):
+                        extracted += future.result()
+                        if progress_callback is not None:
+                            progress_callback(extracted / total_bytes)
+                finally:
+                    for future in futures:
+                        future.cancel()
+    finally:
+        extractor.close()
+
+    return extracted
+
+
+def read_central_directory(fetch_range, total_size, zip_path, tail_size=1024 * 1024):
+    """
+    Create a sparse copy of a remote zip archive containing only its tail
+    (central directory), so that members can be listed before downloading them
+    :return: (list of ZipInfo, offset of the first byte that was downloaded)
+    """
+    with open(zip_path, 'wb') as f:
+        f.truncate(total_size)
+
+    tail_size = min(total_size, tail_size)
+    while True:
+        tail_start = total_size - tail_size
+        data = fetch_range(tail_start, total_size - 1)
+        if len(data) != tail_size:
+            raise zipfile.BadZipFile("Cannot fetch central directory")
+
+        with open(zip_path, 'r+b') as f:
+            f.seek(tail_start)
+            f.write(data)
+
+        try:
+            with zipfile.ZipFile(zip_path, "r") as zip_h:
+                return zip_h.infolist(), tail_start
+        except zipfile.BadZipFile:
+            # Central directory is larger than the tail?
+            if tail_size == total_size:
+                raise
+            tail_size = min(total_size, tail_size * 4)
+
+
+def download_and_extract_zip(fetch_range, total_size, zip_path, destination, max_workers=1, download_workers=4,
+                             chunk_size=8 * 1024 * 1024, tail_size=1024 * 1024, progress_callback=None,
+                             member_callback=None, max_retries=3):
+    """
+    Download a zip archive by byte ranges and extract its members as soon as
+    their bytes are on disk, while the rest of the archive is still downloading
+    :param fetch_range: function(start, end) returning the bytes of the remote archive in [start, end] (inclusive)
+    :param total_size: size of the remote archive
+    :param zip_path: where to store the archive
+    :param max_workers: number of members to extract (and post-process) concurrently
+    :param download_workers: number of ranges to download concurrently
+    :param chunk_size: size of each range
+    :param tail_size: number of bytes to download initially from the end of the archive
+    :param progress_callback: optional function(progress) with download progress from 0 to 1
+    :param member_callback: optional function(path) called from the extraction threads after a member is extracted
+    :return: number of bytes extracted
+    It will raise a zipfile.BadZipFile exception if the archive cannot be extracted
+    """
+    members, tail_start = read_central_directory(fetch_range, total_size, zip_path, tail_size)
+
+    extractor = MemberExtractor(zip_path, destination, fetch_range, max_retries)
+    files = extractor.prepare(members)
+
+    # A member is complete once all bytes up to the next member
+    # (or to the central directory) are on disk
+    offsets = sorted(set([info.header_offset for info in members] + [tail_start]))
+    def member_end(info):
+        if info.header_offset >= tail_start:
+            return 0
+        return offsets[bisect.bisect_right(offsets, info.header_offset)]
+    files = sorted([(member_end(info), info, path) for info, path in files], key=lambda f: f[0])
+
+    chunks = [(start, min(start + chunk_size, tail_start) - 1) for start in range(0, tail_start, chunk_size)]
+    completed = [False] * len(chunks)
+    frontier = 0 # Index of the first chunk that is not on disk
+    downloaded = 0
+
+    def download_chunk(chunk):
+        start, end = chunk
+        data = fetch_range(start, end)
+        if len(data) != end - start + 1:
+            raise zipfile.BadZipFile("Incomplete range {}-{}".format(start, end))
+
+        with open(zip_path, 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+        return len(data)
+
+    def extract_member(info, path):
+        extracted = extractor.extract(info, path)
+        if member_callback is not None:
+            member_callback(path)
+        return extracted
+
+    extracted = 0
+    extractions = []
+    next_file = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as extract_executor:
+            def submit_ready(available_bytes):
+                nonlocal next_file
+                while next_file < len(files) and files[next_file][0] <= available_bytes:
+                    _, info, path = files[next_file]
+                    extractions.append(extract_executor.submit(extract_member, info, path))
+                    next_file += 1
+
+            try:
+                # Members stored in the downloaded tail
+                # are ready right away
+                submit_ready(0 if len(chunks) > 0 else tail_start)
+
+                with ThreadPoolExecutor(max_workers=max(1, download_workers)) as download_executor:
+                    futures = {download_executor.submit(download_chunk, c): i for i, c in enumerate(chunks)}
+                    try:
+                        for future in as_completed(futures):
+                            downloaded += future.result()
+                            completed[futures[future]] = True
+
+                            while frontier < len(chunks) and completed[frontier]:
+                                frontier += 1
+                            submit_ready(chunks[frontier][0] if frontier < len(chunks) else tail_start)
+
+                            if progress_callback is not None:
+                                progress_callback(downloaded / max(1, tail_start))
+                    finally:
+                        for future in futures:
+                            future.cancel()
+
+                if progress_callback is not None and len(chunks) == 0:
+                    progress_callback(1)
+
+                for future in extractions:
+                    extracted += future.result()
+            finally:
+                for future in extractions:
+                    future.cancel()
+    finally:
+        extractor.close()
+
+    return extracted
@@ -101,6 +101,7 @@ class PlatformsTaskView(TaskView):
 
 def import_files(task_id, files):
     import requests
+    from django.utils import timezone
     from app import models
     from app.plugins import logger
     from app.security import path_traversal_check
@@ -123,7 +124,7 @@ def import_files(task_id, files):
         for file in files: 
             download_file(task, file)
             task.check_if_canceled()
-            models.Task.objects.filter(pk=task.id).update(upload_progress=(float(downloaded_total) / float(len(files))))
+            models.Task.objects.filter(pk=task.id).update(upload_progress=(float(downloaded_total) / float(len(files))), updated_at=timezone.now())
             downloaded_total += 1
 
     except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
@@ -206,6 +206,7 @@ class ImportDatasetTaskView(TaskView):
 
 def import_files(task_id, carrier):
     import requests
+    from django.utils import timezone
     from app import models
     from app.plugins import logger
     from app.security import path_traversal_check
@@ -236,7 +237,7 @@ def import_files(task_id, carrier):
         for file in files: 
             download_file(task, file)
             task.check_if_canceled()
-            models.Task.objects.filter(pk=task.id).update(upload_progress=(float(downloaded_total) / float(len(files))))
+            models.Task.objects.filter(pk=task.id).update(upload_progress=(float(downloaded_total) / float(len(files))), updated_at=timezone.now())
             downloaded_total += 1
 
     except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
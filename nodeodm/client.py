@@ -0,0 +1,227 @@
+import json
+import mimetypes
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from pyodm import Node
+from pyodm.exceptions import NodeConnectionError, NodeServerError, NodeResponseError
+from pyodm.utils import MultipartEncoder, options_to_json
+
+
+class SessionNode(Node):
+    """
+    pyodm Node that sends requests through a requests.Session,
+    so that connections are kept alive and reused across calls
+    """
+    def __init__(self, host, port, token="", timeout=30, session=None):
+        super().__init__(host, port, token, timeout)
+        self.owns_session = session is None
+        self.session = session if session is not None else requests.Session()
+
+    def get(self, url, query={}, **kwargs):
+        try:
+            res = self.session.get(self.url(url, query), timeout=self.timeout, **kwargs)
+            if res.status_code == 401:
+                raise NodeResponseError("Unauthorized. Do you need to set a token?")
+            elif not res.status_code in [200, 403, 206]:
+                raise NodeServerError("Unexpected status code: %s" % res.status_code)
+
+            if "Content-Type" in res.headers and "application/json" in res.headers['Content-Type']:
+                result = res.json()
+                if 'error' in result:
+                    raise NodeResponseError(result['error'])
+                return result
+            else:
+                return res
+        except json.decoder.JSONDecodeError as e:
+            raise NodeServerError(str(e))
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            raise NodeConnectionError(str(e))
+
+    def post(self, url, data=None, headers={}):
+        try:
+            res = self.session.post(self.url(url), data=data, headers=headers, timeout=self.timeout)
+
+            if res.status_code == 401:
+                raise NodeResponseError("Unauthorized. Do you need to set a token?")
+            elif res.status_code != 200 and res.status_code != 403:
+                raise NodeServerError(res.status_code)
+
+            if "Content-Type" in res.headers and "application/json" in res.headers['Content-Type']:
+                result = res.json()
+                if 'error' in result:
+                    raise NodeResponseError(result['error'])
+                return result
+            else:
+                return res
+        except json.decoder.JSONDecodeError as e:
+            raise NodeServerError(str(e))
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            raise NodeConnectionError(str(e))
+
+    def close(self):
+        # Shared sessions are closed by their pool
+        if self.owns_session:
+            self.session.close()
+
+
+class ClientPool:
+    """
+    Per-process cache of HTTP sessions used to talk to processing nodes,
+    keyed on (hostname, port, token). Connections are kept alive
+    and reused by all API clients pointing to the same node.
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host, port, token="", timeout=30, pool_size=10):
+        """
+        :param pool_size: max number of connections kept alive for a node
+        :return: SessionNode sharing the pooled session for the node
+        """
+        key = (host, port, token)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                self.misses += 1
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[key] = session
+            else:
+                self.hits += 1
+
+        return SessionNode(host, port, token, timeout, session=session)
+
+    def invalidate(self, host, port, token=""):
+        with self.lock:
+            session = self.sessions.pop((host, port, token), None)
+        if session is not None:
+            session.close()
+
+    def clear(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+            self.hits = 0
+            self.misses = 0
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.sessions)
+            }
+
+
+client_pool = ClientPool()
+
+
+def create_task_resumable(node, files, options={}, name=None, uuid=None, uploaded=None,
+                          progress_callback=None, state_callback=None,
+                          parallel_uploads=8, max_retries=5, retry_timeout=5):
+    """
+    Create a task on a node, uploading files concurrently (same protocol as
+    pyodm's Node.create_task, requires API >= 1.4.0). Files are streamed from disk
+    and each file is retried independently. Uploads can be resumed by
+    passing the UUID of a task that was initialized by a previous call
+    and the names of the files that were already uploaded to it.
+
+    :param node: pyodm Node (a SessionNode with pooled connections is recommended)
+    :param files: list of file paths
+    :param options: dict of options
+    :param uuid: UUID of an initialized (but not committed) task to resume
+    :param uploaded: names of the files already uploaded to the task with the given UUID
+    :param progress_callback: optional function(progress) with upload progress from 0 to 100
+    :param state_callback: optional function(uuid, uploaded) invoked after the task is
+        initialized and every time a file is uploaded, to persist the state of the upload
+    :param parallel_uploads: number of files to upload concurrently
+    :param max_retries: number of times a file upload is retried
+    :param retry_timeout: seconds to wait before retrying a file upload (multiplied by the retry number)
+    :return: UUID of the new task
+    Callbacks are invoked from the calling thread; if they raise, pending uploads are canceled.
+    """
+    if len(files) == 0:
+        raise NodeResponseError("Not enough images")
+
+    if uuid is None:
+        fields = {
+            'name': name,
+            'options': options_to_json(options),
+        }
+        e = MultipartEncoder(fields=fields)
+        result = node.post('/task/new/init', data=e, headers={'Content-Type': e.content_type})
+        if not isinstance(result, dict) or not 'uuid' in result:
+            raise NodeServerError("Invalid response from /task/new/init: %s" % result)
+
+        uuid = result['uuid']
+        uploaded = []
+
+    uploaded = list(uploaded or [])
+    done = set(uploaded)
+    if state_callback is not None:
+        state_callback(uuid, list(uploaded))
+
+    sizes = {f: os.path.getsize(f) for f in files}
+    total_bytes = max(1, sum(sizes.values()))
+    uploaded_bytes = sum(sizes[f] for f in files if os.path.basename(f) in done)
+    pending = [f for f in files if not os.path.basename(f) in done]
+    stop = threading.Event()
+
+    def upload_file(file):
+        retry_num = 0
+        while True:
+            if stop.is_set():
+                return None
+
+            try:
+                with open(file, 'rb') as f:
+                    e = MultipartEncoder(fields={
+                        'images': [(os.path.basename(file), f, (mimetypes.guess_type(file)[0] or "image/jpg"))]
+                    })
+                    result = node.post('/task/new/upload/{}'.format(uuid), data=e, headers={'Content-Type': e.content_type})
+
+                if isinstance(result, dict) and result.get('success'):
+                    return file
+                elif isinstance(result, dict) and 'error' in result:
+                    raise NodeResponseError(result['error'])
+                else:
+                    raise NodeServerError("Failed upload with unexpected result: %s" % str(result))
+            except (NodeConnectionError, NodeServerError):
+                # Errors reported by the node (NodeResponseError) are not retried
+                if retry_num >= max_retries:
+                    raise
+                retry_num += 1
+                stop.wait(retry_num * retry_timeout)
+
+    if progress_callback is not None:
+        progress_callback(100.0 * uploaded_bytes / total_bytes)
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel_uploads)) as executor:
+        futures = [executor.submit(upload_file, f) for f in pending]
+        try:
+            for future in as_completed(futures):
+                file = future.result()
+                uploaded.append(os.path.basename(file))
+                uploaded_bytes += sizes[file]
+
+                if state_callback is not None:
+                    state_callback(uuid, list(uploaded))
+                if progress_callback is not None:
+                    progress_callback(100.0 * uploaded_bytes / total_bytes)
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+    result = node.post('/task/new/commit/{}'.format(uuid))
+    return node.handle_task_new_response(result).uuid
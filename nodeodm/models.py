@@ -12,6 +12,7 @@ from webodm import settings
 
 import json
 from pyodm import Node
+from .client import SessionNode, client_pool, create_task_resumable
 from pyodm import exceptions
 from django.db.models import signals
 from datetime import timedelta
@@ -36,6 +37,12 @@ class ProcessingNode(models.Model):
         verbose_name = _("Processing Node")
         verbose_name_plural = _("Processing Nodes")
 
+    def __init__(self, *args, **kwargs):
+        super(ProcessingNode, self).__init__(*args, **kwargs)
+
+        # To help keep track of changes to the connection fields
+        self.__original_connection = self.connection_key()
+
     def __str__(self):
         if self.label != "":
             return self.label
@@ -94,8 +101,37 @@ class ProcessingNode(models.Model):
         except exceptions.OdmError:
             return False
 
-    def api_client(self, timeout=30):
-        return Node(self.hostname, self.port, self.token, timeout)
+    def connection_key(self):
+        return (self.hostname, self.port, self.token)
+
+    def api_client(self, timeout=30, keep_alive=False):
+        if settings.NODE_CONNECTION_POOL_SIZE > 0:
+            return client_pool.get(self.hostname, self.port, self.token, timeout, settings.NODE_CONNECTION_POOL_SIZE)
+        elif keep_alive:
+            return SessionNode(self.hostname, self.port, self.token, timeout)
+        else:
+            return Node(self.hostname, self.port, self.token, timeout)
+
+    def save(self, *args, **kwargs):
+        connection = self.connection_key()
+        if connection != self.__original_connection:
+            # Don't keep connections to the old address around
+            client_pool.invalidate(*self.__original_connection)
+            self.__original_connection = connection
+
+        super(ProcessingNode, self).save(*args, **kwargs)
+
+    def api_version_greater_or_equal_than(self, version, api_client=None):
+        """
+        Checks the node's API version, using the version reported
+        during the last node info update if available (saves a request)
+        """
+        if self.api_version:
+            return Node.compare_version(self.api_version, version) >= 0
+
+        if api_client is None:
+            api_client = self.api_client()
+        return api_client.version_greater_or_equal_than(version)
 
     def get_available_options_json(self, pretty=False):
         """
@@ -118,7 +154,7 @@ class ProcessingNode(models.Model):
 
         return opts
 
-    def process_new_task(self, images, name=None, options=[], progress_callback=None):
+    def process_new_task(self, images, name=None, options=[], progress_callback=None, upload_state=None, state_callback=None):
         """
         Sends a set of images (and optional GCP file) via the API
         to start processing.
@@ -127,6 +163,8 @@ class ProcessingNode(models.Model):
         :param name: name of the task
         :param options: options to be used for processing ([{'name': optionName, 'value': optionValue}, ...])
         :param progress_callback: optional callback invoked during the upload images process to be used to report status.
+        :param upload_state: optional dict with the 'uuid' and 'uploaded' files of a previous upload to resume
+        :param state_callback: optional callback(uuid, uploaded) invoked as files are uploaded, to persist the upload state
 
         :returns UUID of the newly created task
         """
@@ -136,21 +174,37 @@ class ProcessingNode(models.Model):
 
         opts = self.options_list_to_dict(options)
 
-        task = api_client.create_task(images, opts, name, progress_callback)
-        return task.uuid
+        if not self.api_version_greater_or_equal_than("1.4.0", api_client):
+            task = api_client.create_task(images, opts, name, progress_callback)
+            return task.uuid
+
+        kwargs = dict(progress_callback=progress_callback, state_callback=state_callback,
+                      parallel_uploads=settings.NODE_PARALLEL_UPLOADS)
+
+        if upload_state and upload_state.get('uuid'):
+            try:
+                return create_task_resumable(api_client, images, opts, name,
+                                             uuid=upload_state['uuid'], uploaded=upload_state.get('uploaded', []), **kwargs)
+            except exceptions.NodeResponseError as e:
+                # The node might have purged the partial upload
+                logger.warning("Cannot resume upload to {} ({}), starting over".format(upload_state['uuid'], str(e)))
+
+        return create_task_resumable(api_client, images, opts, name, **kwargs)
 
-    def get_task_info(self, uuid, with_output=None):
+    def get_task_info(self, uuid, with_output=None, api_client=None):
         """
         Gets information about this task, such as name, creation date, 
         processing time, status, command line options and number of 
         images being processed.
+        :param api_client: optional API client to reuse (e.g. when polling several tasks)
         """
-        api_client = self.api_client()
+        if api_client is None:
+            api_client = self.api_client()
         task = api_client.get_task(uuid)
         task_info = task.info(with_output)
 
         # Output support for older clients
-        if not api_client.version_greater_or_equal_than("1.5.1") and with_output:
+        if with_output and not self.api_version_greater_or_equal_than("1.5.1", api_client):
             task_info.output = self.get_task_console_output(uuid, with_output)
 
         return task_info
@@ -188,6 +242,39 @@ class ProcessingNode(models.Model):
         task = api_client.get_task(uuid)
         return task.download_zip(destination, progress_callback, parallel_downloads=parallel_downloads)
 
+    def download_task_asset_range(self, uuid, asset, start, end):
+        """
+        Downloads a byte range of a task asset
+        :param start: first byte
+        :param end: last byte (inclusive)
+        :returns: bytes
+        """
+        api_client = self.api_client()
+        task = api_client.get_task(uuid)
+        res = task.get('/task/{}/download/{}'.format(uuid, asset), headers={'Range': 'bytes={}-{}'.format(start, end)})
+        if res.status_code != 206:
+            raise exceptions.NodeServerError("Range requests are not supported")
+        return res.content
+
+    def get_task_asset_size(self, uuid, asset):
+        """
+        Retrieves the size of a task asset, checking that
+        the node supports range requests for it
+        :returns: size in bytes
+        """
+        api_client = self.api_client()
+        task = api_client.get_task(uuid)
+        res = task.get('/task/{}/download/{}'.format(uuid, asset), stream=True, headers={'Range': 'bytes=0-0'})
+        try:
+            content_range = res.headers.get('Content-Range', '')
+            if res.status_code != 206 or not '/' in content_range:
+                raise exceptions.NodeServerError("Range requests are not supported")
+            return int(content_range.split('/')[-1])
+        except ValueError:
+            raise exceptions.NodeServerError("Invalid Content-Range: {}".format(content_range))
+        finally:
+            res.close()
+
     def restart_task(self, uuid, options = None):
         """
         Restarts a task that was previously canceled or that had failed to process
@@ -200,6 +287,7 @@ class ProcessingNode(models.Model):
     def delete(self, using=None, keep_parents=False):
         pnode_id = self.id
         super(ProcessingNode, self).delete(using, keep_parents)
+        client_pool.invalidate(*self.connection_key())
 
         from app.plugins import signals as plugin_signals
         plugin_signals.processing_node_removed.send_robust(sender=self.__class__, processing_node_id=pnode_id)
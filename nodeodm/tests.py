@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 from datetime import timedelta, datetime
 
 import requests
@@ -13,6 +15,7 @@ from pyodm.exceptions import NodeConnectionError, NodeServerError, NodeResponseE
 from webodm import settings
 from app.tests.utils import start_processing_node
 from .models import ProcessingNode
+from .client import SessionNode, client_pool, create_task_resumable
 from . import status_codes
 
 current_dir = path.dirname(path.realpath(__file__))
@@ -201,6 +204,85 @@ class TestClientApi(TestCase):
             # Best choice now is original processing node
             self.assertTrue(ProcessingNode.find_best_available_node().id == pnode.id)
 
+    def test_connection_pool(self):
+        client_pool.clear()
+
+        with start_processing_node():
+            online_node = ProcessingNode.objects.get(pk=1)
+
+            # Clients for the same node share a session
+            api = online_node.api_client()
+            self.assertTrue(isinstance(api, SessionNode))
+            self.assertTrue(online_node.update_node_info())
+            self.assertTrue(online_node.api_client(timeout=5).session is api.session)
+            self.assertEqual(client_pool.stats()['misses'], 1)
+            self.assertTrue(client_pool.stats()['hits'] >= 2)
+
+            # Closing a pooled client does not close the shared session
+            api.close()
+            self.assertTrue(type(online_node.api_client().info().version) == str)
+
+            # Changing connection fields invalidates the pooled session
+            online_node.token = "test_token"
+            online_node.save()
+            self.assertEqual(client_pool.stats()['size'], 0)
+            self.assertFalse(online_node.api_client().session is api.session)
+            self.assertEqual(client_pool.stats()['misses'], 2)
+
+            # So does removing the node
+            online_node.delete()
+            self.assertEqual(client_pool.stats()['size'], 0)
+
+        # Pooling can be turned off
+        settings.NODE_CONNECTION_POOL_SIZE = 0
+        try:
+            self.assertFalse(isinstance(ProcessingNode.objects.get(pk=2).api_client(), SessionNode))
+        finally:
+            settings.NODE_CONNECTION_POOL_SIZE = 16
+
+    def test_resumable_upload(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        images = []
+        for i in range(5):
+            images.append(os.path.join(tmpdir, "{}.jpg".format(i)))
+            shutil.copy("app/fixtures/tiny_drone_image.jpg", images[-1])
+
+        with start_processing_node():
+            online_node = ProcessingNode.objects.get(pk=1)
+            api = online_node.api_client()
+            states = []
+
+            # Interrupt the upload after two files
+            def interrupt(uuid, uploaded):
+                states.append({'uuid': uuid, 'uploaded': uploaded})
+                if len(uploaded) == 2:
+                    raise NodeConnectionError("interrupted")
+
+            self.assertRaises(NodeConnectionError, create_task_resumable, api, images, {}, "test",
+                              state_callback=interrupt, parallel_uploads=2)
+            self.assertEqual(states[0]['uploaded'], [])
+            upload_state = states[-1]
+            self.assertEqual(len(upload_state['uploaded']), 2)
+
+            # Resuming skips the files that were uploaded
+            resumed = []
+            progress = []
+            uuid = online_node.process_new_task(images, "test", [], progress.append, upload_state=upload_state,
+                                                state_callback=lambda uuid, uploaded: resumed.append(uploaded))
+            self.assertEqual(uuid, upload_state['uuid'])
+            self.assertEqual(resumed[0], upload_state['uploaded'])
+            self.assertEqual(len(resumed), len(images) - 1)
+            self.assertEqual(sorted(resumed[-1]), sorted(os.path.basename(i) for i in images))
+            self.assertTrue(progress[0] > 0)
+            self.assertEqual(progress[-1], 100)
+            self.assertEqual(api.get_task(uuid).info().images_count, len(images))
+
+            # An upload that cannot be resumed starts over
+            uuid = online_node.process_new_task(images, "test", [], upload_state={'uuid': 'invalid-uuid', 'uploaded': []})
+            self.assertNotEqual(uuid, 'invalid-uuid')
+            self.assertEqual(api.get_task(uuid).info().images_count, len(images))
+
     def test_token_auth(self):
         def wait_for_status(api, uuid, status, num_retries=10, error_description="Failed to wait for status"):
             retries = 0
@@ -151,10 +151,29 @@ else
     fi
     echo "Web concurrency set to $WEB_CONCURRENCY"
 
+    # Threads per worker, so that long lived requests (task event streams)
+    # don't tie up whole workers. Only used when task events are enabled:
+    # each open stream holds a thread, so WEB_CONCURRENCY * WEB_THREADS caps
+    # how many streams can be open at once
+    gunicorn_threads=""
+    if [ "$WO_TASK_EVENTS" = "YES" ] && [ -z "$WEB_THREADS" ]; then
+        export WEB_THREADS=8
+    fi
+    if [ ! -z "$WEB_THREADS" ]; then
+        echo "Web threads set to $WEB_THREADS"
+        gunicorn_threads="--threads $WEB_THREADS"
+    fi
+
     congrats
 
     nginx -c $(pwd)/nginx/$conf
-    gunicorn webodm.wsgi --bind unix:/tmp/gunicorn.sock --timeout 300000 --max-requests 500 --workers $WEB_CONCURRENCY --preload
+
+    # Let nginx send downloads unless disabled (see DOWNLOAD_ACCEL_REDIRECT).
+    # The nginx location aliases /webodm/app/media/, set WO_ACCEL_REDIRECT=NO
+    # if MEDIA_ROOT is elsewhere
+    export WO_ACCEL_REDIRECT=${WO_ACCEL_REDIRECT:-YES}
+
+    gunicorn webodm.wsgi --bind unix:/tmp/gunicorn.sock --timeout 300000 --max-requests 500 --workers $WEB_CONCURRENCY $gunicorn_threads --preload
 fi
 
 # If this is executed, it means the previous command failed, don't display the congratulations message
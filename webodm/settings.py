@@ -377,6 +377,33 @@ NODE_OFFLINE_MINUTES = 5
 # and assumes that all nodes are always online, avoiding polling
 NODE_OPTIMISTIC_MODE = False
 
+# When turned on, the scheduler polls the status of running tasks
+# with one job per processing node (instead of one job per task)
+# and only dispatches per-task jobs when a task's state changes
+NODE_BATCH_POLLING = False
+
+# When turned on, results are downloaded from processing nodes by byte ranges
+# and extracted / optimized while the download is still in progress
+# (falls back to a regular download if the node doesn't support ranges)
+PIPELINED_ASSET_DOWNLOADS = True
+
+# Maximum number of keep-alive connections to each processing node,
+# shared by all API calls made from the same process (0 to disable
+# connection pooling and open a new connection for every request)
+NODE_CONNECTION_POOL_SIZE = 16
+
+# Number of images uploaded concurrently to a processing node
+# when creating a task (keep it below NODE_CONNECTION_POOL_SIZE)
+NODE_PARALLEL_UPLOADS = 8
+
+# When set, files under MEDIA_ROOT are sent by nginx (using sendfile)
+# after Django authorizes the download: responses carry an X-Accel-Redirect header
+# pointing to this prefix, which must be an internal nginx location aliasing MEDIA_ROOT
+# (see nginx/nginx.conf.template). Enabled by start.sh when nginx is used, unless
+# WO_ACCEL_REDIRECT=NO. The nginx location aliases /webodm/app/media/: if MEDIA_ROOT
+# points elsewhere, update the alias or disable this, otherwise downloads will 404.
+DOWNLOAD_ACCEL_REDIRECT = '/_protected_media/' if os.environ.get('WO_ACCEL_REDIRECT', 'NO') == 'YES' and not TESTING else None
+
 # URL to external auth endpoint
 EXTERNAL_AUTH_ENDPOINT = ''
 
@@ -408,9 +435,54 @@ CLEANUP_EMPTY_PROJECTS = None
 # Maximum number of threads that a worker should use for processing
 WORKERS_MAX_THREADS = 1
 
+# Maximum number of CPUs that a worker should use for converting
+# a task's orthophoto and elevation models to Cloud Optimized GeoTIFFs,
+# split among the rasters being converted concurrently (0 = all CPUs)
+COGEO_CPU_BUDGET = 0
+
+# How task files are duplicated: "cow" shares input images and assets
+# with the original task via hard links and clones other files with
+# reflinks when the filesystem supports them, "copy" always copies
+TASK_DUPLICATE_MODE = 'cow'
+
+# Publish task status and progress changes on the broker (Redis pub/sub),
+# so that clients can receive them from /api/tasks/events instead of polling.
+# When enabled, progress is written to the database less often (see below), so only
+# turn this on if clients read the events stream (the dashboard still polls the API).
+# Each open stream holds a web server thread for up to TASK_EVENTS_STREAM_TIMEOUT, so
+# the number of gunicorn threads (WEB_THREADS, see start.sh) caps how many can be open
+TASK_EVENTS = os.environ.get('WO_TASK_EVENTS', 'NO') == 'YES'
+
+# Seconds between progress updates published by workers. When task events are enabled,
+# progress is written to the database at most every TASK_PROGRESS_DB_INTERVAL seconds
+TASK_PROGRESS_PUBLISH_INTERVAL = 2
+TASK_PROGRESS_DB_INTERVAL = 10
+
+# Max duration (in seconds) of a task events stream, after which clients reconnect
+TASK_EVENTS_STREAM_TIMEOUT = 300
+
 # Maximum number of seconds a worker task should take before being terminated
 WORKERS_MAX_TIME_LIMIT = None
 
+# Maximum size (in megabytes) of the rendered tiles disk cache
+# (or None to disable tile caching)
+TILE_CACHE_MAX_SIZE = 2048
+
+# Number of seconds browsers and proxies can reuse a rendered tile
+# before revalidating it with the server
+TILE_CACHE_MAX_AGE = 0
+
+# Maximum number of raster readers (open file descriptors)
+# kept open by each web/worker process for serving tiles (0 to disable pooling)
+TILER_READER_POOL_SIZE = 16
+
+# Number of seconds after which an unused raster reader is closed
+TILER_READER_IDLE_TIMEOUT = 300
+
+# Number of zoom levels (starting from the lowest) to render into the
+# tile cache in the background after a task completes (0 to disable)
+TILE_SEED_ZOOM_LEVELS = 0
+
 # Link to GCP docs
 GCP_DOCS_LINK = "https://docs.opendronemap.org/gcp/#gcp-file-format"
 
@@ -52,6 +52,22 @@ app.conf.beat_schedule = {
             'retry': False
         }
     },
+    'cleanup-tile-cache': {
+        'task': 'worker.tasks.cleanup_tile_cache',
+        'schedule': 600,
+        'options': {
+            'expires': 299,
+            'retry': False
+        }
+    },
+    'reconcile-task-sizes': {
+        'task': 'worker.tasks.reconcile_task_sizes',
+        'schedule': 86400,
+        'options': {
+            'expires': 43199,
+            'retry': False
+        }
+    },
     'process-pending-tasks': {
         'task': 'worker.tasks.process_pending_tasks',
         'schedule': 5,
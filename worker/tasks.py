@@ -8,20 +8,26 @@ import socket
 import time
 from threading import Event, Thread
 from celery.utils.log import get_task_logger
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Count
+from django.db.models import Count, Sum
 from django.db.models import Q
 from app.models import Profile
 
 from app.models import Project
+from app.models.project import map_items_cache_key
 from app.models import Task
+from app import pending_actions
+from app.task_events import ProgressThrottle
 from nodeodm import status_codes
 from nodeodm.models import ProcessingNode
+from pyodm.exceptions import NodeConnectionError, OdmError
 from webodm import settings
 import worker
 from .celery import app
 from app.raster_utils import export_raster as export_raster_sync, extension_for_export_format
 from app.pointcloud_utils import export_pointcloud as export_pointcloud_sync
+from app.tile_cache import tile_cache_enabled, evict_tile_cache
 from django.utils import timezone
 from datetime import timedelta
 import redis
@@ -92,6 +98,21 @@ def cleanup_tasks():
         logger.info("Cleaning up partial task {}".format(t))
         t.delete()
 
+@app.task(ignore_result=True)
+def reconcile_task_sizes():
+    # Task sizes are updated incrementally; once in a while
+    # walk the task directories to correct any drift
+    # (e.g. files written by plugins or console output)
+    reconciled = 0
+    for task in Task.objects.select_related('project__owner__profile').iterator():
+        size = task.size
+        task.update_size(commit=True)
+        if abs(task.size - size) > 0.01:
+            reconciled += 1
+
+    if reconciled > 0:
+        logger.info("Reconciled the size of {} tasks".format(reconciled))
+
 @app.task(ignore_result=True)
 def cleanup_tmp_directory():
     # Delete files and folder in the tmp directory that are
@@ -131,6 +152,14 @@ def cleanup_cache_directory():
 
                 logger.info('Cleaned up: %s (%s)' % (filepath, modified))
 
+@app.task(ignore_result=True)
+def cleanup_tile_cache():
+    # Keep the rendered tiles cache within its size limit
+    if not tile_cache_enabled():
+        return
+
+    evict_tile_cache(settings.TILE_CACHE_MAX_SIZE)
+
 # Based on https://stackoverflow.com/questions/22498038/improve-current-implementation-of-a-setinterval-python/22498708#22498708
 def setInterval(interval, func, *args):
     stopped = Event()
@@ -208,11 +237,95 @@ def get_pending_tasks():
                                   processing_node__isnull=False, partial=False) |
                                 Q(pending_action__isnull=False, partial=False))
 
+def can_poll_status(task):
+    # Tasks that only need a status update from their processing node
+    return task.processing_node_id is not None and \
+           task.uuid and \
+           task.pending_action is None and \
+           not task.partial and \
+           task.status in [None, status_codes.QUEUED, status_codes.RUNNING]
+
 @app.task(ignore_result=True)
 def process_pending_tasks():
     tasks = get_pending_tasks()
-    for task in tasks:
-        process_task.delay(task.id)
+
+    if settings.NODE_BATCH_POLLING:
+        # Group status updates by processing node
+        polls = {}
+        for task in tasks:
+            if can_poll_status(task):
+                polls.setdefault(task.processing_node_id, []).append(str(task.id))
+            else:
+                process_task.delay(task.id)
+
+        for node_id, task_ids in polls.items():
+            poll_processing_node.delay(node_id, task_ids)
+    else:
+        for task in tasks:
+            process_task.delay(task.id)
+
+@app.task(ignore_result=True, time_limit=settings.WORKERS_MAX_TIME_LIMIT)
+def poll_processing_node(nodeId, taskIds):
+    """
+    Update the status of several tasks running on the same processing node,
+    reusing a single connection. Tasks that have finished (or that need
+    attention) are handed off to process_task.
+    """
+    try:
+        node = ProcessingNode.objects.get(pk=nodeId)
+    except ObjectDoesNotExist:
+        logger.info("Processing node {} has already been deleted.".format(nodeId))
+        return
+
+    if not node.is_online():
+        # Let process_task handle reassignments / failures
+        for taskId in taskIds:
+            process_task.delay(taskId)
+        return
+
+    api_client = node.api_client(keep_alive=True)
+    dispatch = []
+
+    try:
+        for taskId in taskIds:
+            lock_id = 'task_lock_{}'.format(taskId)
+            task_lock_last_update = redis_client.getset(lock_id, time.time())
+            if task_lock_last_update is not None and time.time() - float(task_lock_last_update) <= 30:
+                logger.debug("Task %s is already locked for processing; skipping", taskId)
+                continue
+
+            try:
+                task = Task.objects.filter(pk=taskId).first()
+                if task is None:
+                    continue
+                if not can_poll_status(task) or task.processing_node_id != node.id:
+                    # Changed in the meantime
+                    dispatch.append(taskId)
+                    continue
+
+                info = node.get_task_info(task.uuid, task.console.line_count(), api_client=api_client)
+                if info.status.value in [status_codes.FAILED, status_codes.COMPLETED, status_codes.CANCELED]:
+                    # Download, extraction, notifications, etc.
+                    dispatch.append(taskId)
+                else:
+                    task.update_from_task_info(info)
+                    task.save()
+            except NodeConnectionError as e:
+                logger.warning("{} connection/timeout error: {}. We'll try again at the next tick.".format(node, str(e)))
+                break
+            except OdmError:
+                # Let process_task handle errors
+                dispatch.append(taskId)
+            finally:
+                try:
+                    redis_client.delete(lock_id)
+                except redis.exceptions.RedisError:
+                    pass
+    finally:
+        api_client.close()
+
+    for taskId in dispatch:
+        process_task.delay(taskId)
 
 
 @app.task(bind=True, time_limit=settings.WORKERS_MAX_TIME_LIMIT)
@@ -251,33 +364,141 @@ def export_pointcloud(self, input, **opts):
         logger.error(str(e))
         return {'error': str(e)}
 
+@app.task(ignore_result=True, time_limit=settings.WORKERS_MAX_TIME_LIMIT)
+def seed_tiles(taskId):
+    # Avoid circular imports (the tiler imports this module)
+    from app.tile_seed import seed_task_tiles
+
+    try:
+        task = Task.objects.get(pk=taskId)
+    except ObjectDoesNotExist:
+        logger.info("Task {} has already been deleted.".format(taskId))
+        return
+
+    last_check = {'canceled': 0}
+    throttle = ProgressThrottle()
+
+    def is_canceled():
+        # Stop if the task has been removed or is being reprocessed
+        now = time.time()
+        if now - last_check['canceled'] < 2:
+            return False
+        last_check['canceled'] = now
+
+        return not Task.objects.filter(pk=taskId, status=status_codes.COMPLETED) \
+                               .exclude(pending_action=pending_actions.REMOVE).exists()
+
+    def progress_callback(done, total):
+        # Reported on the task, so that clients can follow it
+        publish, write = throttle.check(final=done == total)
+        if publish or write:
+            task.report_progress(write, tile_seed_progress=done / total if total > 0 else 1.0)
+
+    try:
+        logger.info("Seeding tiles for {}".format(task))
+        seed_task_tiles(task, settings.TILE_SEED_ZOOM_LEVELS,
+                        max_workers=max(1, settings.WORKERS_MAX_THREADS),
+                        progress_callback=progress_callback,
+                        is_canceled=is_canceled)
+    except Exception as e:
+        logger.error("Cannot seed tiles for {}: {}".format(task, str(e)))
+
 @app.task(ignore_result=True)
-def check_quotas():
-    profiles = Profile.objects.filter(quota__gt=-1)
-    for p in profiles:
-        if p.has_exceeded_quota():
+def check_quotas(dry_run=False):
+    """
+    Delete the most recent tasks of users that have exceeded their quota
+    for longer than the grace period, until they are back under quota
+    :param dry_run: don't delete tasks or change deadlines, just report what would happen
+    :return: list of dicts describing the users that have exceeded their quota
+    """
+    profiles = {p.user_id: p for p in Profile.objects.filter(quota__gt=-1).select_related('user')}
+    if len(profiles) == 0:
+        return []
+
+    # Disk usage of all users with a quota, in a single query
+    used = dict(Task.objects.filter(project__owner_id__in=profiles.keys())
+                            .values('project__owner_id')
+                            .annotate(total=Sum('size'))
+                            .values_list('project__owner_id', 'total'))
+
+    report = []
+    expired = []
+    for user_id, p in profiles.items():
+        used_quota = used.get(user_id) or 0
+        if used_quota > p.quota:
             deadline = p.get_quota_deadline()
             if deadline is None:
-                deadline = p.set_quota_deadline(settings.QUOTA_EXCEEDED_GRACE_PERIOD)
-            now = time.time()
-            if now > deadline:
-                # deadline passed, delete tasks until quota is met
-                logger.info("Quota deadline expired for %s, deleting tasks" % str(p.user.username))
-                task_count = Task.objects.filter(project__owner=p.user).count()
-                c = 0
-
-                while p.has_exceeded_quota():
-                    try:
-                        last_task = Task.objects.filter(project__owner=p.user).order_by("-created_at").first()
-                        if last_task is None:
-                            break
-                        logger.info("Deleting %s" % last_task)
-                        last_task.delete()
-                    except Exception as e:
-                        logger.warn("Cannot delete %s for %s: %s" % (str(last_task), str(p.user.username), str(e)))
-                    
-                    c += 1
-                    if c >= task_count:
-                        break
-        else:
+                if dry_run:
+                    deadline = time.time() + settings.QUOTA_EXCEEDED_GRACE_PERIOD * 60 * 60
+                else:
+                    deadline = p.set_quota_deadline(settings.QUOTA_EXCEEDED_GRACE_PERIOD)
+
+            entry = {
+                'user': p.user.username,
+                'quota': p.quota,
+                'used': used_quota,
+                'deadline': deadline,
+                'tasks': []
+            }
+            report.append(entry)
+
+            if time.time() > deadline:
+                expired.append((p, used_quota, entry))
+        elif not dry_run:
             p.clear_quota_deadline()
+
+    if len(expired) == 0:
+        return report
+
+    # Plan which tasks to delete (most recent first) to get back under quota
+    tasks = {}
+    for task_id, owner_id, size in Task.objects.filter(project__owner_id__in=[p.user_id for p, _, _ in expired]) \
+                                              .order_by('-created_at') \
+                                              .values_list('id', 'project__owner_id', 'size'):
+        tasks.setdefault(owner_id, []).append((task_id, size))
+
+    to_delete = []
+    for p, used_quota, entry in expired:
+        for task_id, size in tasks.get(p.user_id, []):
+            if used_quota <= p.quota:
+                break
+            entry['tasks'].append(str(task_id))
+            to_delete.append(task_id)
+            used_quota -= size
+
+        logger.info("Quota deadline expired for %s, %s %s tasks" % (p.user.username, "would delete" if dry_run else "deleting", len(entry['tasks'])))
+
+    if dry_run:
+        return report
+
+    # Delete in batches, with a single query per batch. This does what Task.delete
+    # does for each task (signals, cache and files cleanup), without the per-task queries
+    from app.plugins import signals as plugin_signals
+
+    batch_size = 100
+    for i in range(0, len(to_delete), batch_size):
+        batch = list(Task.objects.filter(pk__in=to_delete[i:i + batch_size]))
+        for task in batch:
+            logger.info("Deleting %s" % task)
+            plugin_signals.task_removing.send_robust(sender=Task, task_id=task.id)
+            task.clear_task_assets_cache()
+
+        try:
+            Task.objects.filter(pk__in=[task.id for task in batch]).delete()
+        except Exception as e:
+            logger.warning("Cannot delete tasks %s: %s" % (", ".join([str(task) for task in batch]), str(e)))
+            continue
+
+        cache.delete_many(list(set([map_items_cache_key(task.project_id) for task in batch])))
+
+        for task in batch:
+            try:
+                shutil.rmtree(task.task_path())
+            except FileNotFoundError as e:
+                logger.warning(e)
+            plugin_signals.task_removed.send_robust(sender=Task, task_id=task.id)
+
+    for p, _, _ in expired:
+        p.clear_used_quota_cache()
+
+    return report